@@ -2,16 +2,23 @@ from bson.objectid import ObjectId
 import logging
 import os
 import asyncio
+import random
+import time
+from contextlib import asynccontextmanager
 from datetime import datetime, timedelta
 from typing import Dict, List, Optional, Tuple, Union
 
 import aiohttp
 import motor.motor_asyncio
+import ujson
 from aiogram import Bot, Dispatcher, executor, types
 from aiogram.contrib.fsm_storage.memory import MemoryStorage
 from aiogram.dispatcher import FSMContext
 from aiogram.dispatcher.filters import Text
 from aiogram.dispatcher.filters.state import State, StatesGroup
+from aiogram.dispatcher.middlewares import BaseMiddleware
+from aiogram.utils.callback_data import CallbackData
+from aiogram.utils.exceptions import NetworkError, RetryAfter
 from aiogram.types import (
     InlineKeyboardButton,
     InlineKeyboardMarkup,
@@ -20,6 +27,7 @@ from aiogram.types import (
     ParseMode,
 )
 from dotenv import load_dotenv
+from pymongo import ReturnDocument, UpdateOne
 
 # Load environment variables
 load_dotenv()
@@ -35,6 +43,12 @@ bot = Bot(token=API_TOKEN)
 storage = MemoryStorage()
 dp = Dispatcher(bot, storage=storage)
 
+# Shared HTTP session for OGS API requests (opened on startup, closed on shutdown)
+ogs_session: Optional[aiohttp.ClientSession] = None
+
+# Rendered leaderboard text, rebuilt after it expires or is invalidated
+_leaderboard_cache = {"ts": 0.0, "text": None}
+
 # Initialize MongoDB connection
 client = motor.motor_asyncio.AsyncIOMotorClient(MONGO_URI)
 db = client.go_club_db
@@ -50,8 +64,50 @@ RANKS = [
     "10k", "9k", "8k", "7k", "6k", "5k", "4k", "3k", "2k", "1k",
     "1d", "2d", "3d", "4d", "5d", "6d", "7d", "8d", "9d"
 ]
+RANK_INDEX = {rank: i for i, rank in enumerate(RANKS)}
 
 MENTOR_MINIMUM_RANK = "3k"  # Minimum rank required to become a mentor
+MENTOR_MIN_INDEX = RANK_INDEX[MENTOR_MINIMUM_RANK]
+MENTOR_ELIGIBLE_RANKS = frozenset(RANKS[MENTOR_MIN_INDEX:])
+
+LEADERBOARD_SIZE = 20  # Number of players shown on the leaderboard
+LEADERBOARD_PROJECTION = {"name": 1, "rank": 1, "wins": 1, "losses": 1}
+LEADERBOARD_CACHE_TTL = 60  # Seconds a rendered leaderboard stays valid
+
+OGS_REFRESH_INTERVAL = timedelta(days=1)  # How long fetched OGS stats stay fresh
+
+# Field projections for user list queries that only need a few fields
+PLAYER_PROJECTION = {"telegram_id": 1, "name": 1, "rank": 1}
+OGS_SYNC_PROJECTION = {"telegram_id": 1, "ogs_username": 1}
+RECIPIENT_PROJECTION = {"telegram_id": 1}
+EVENT_NOTIFICATION_QUERY = {"notifications_enabled": {"$ne": False}}  # Users who have not opted out
+EVENT_LIST_PROJECTION = {"title": 1, "date": 1}
+EVENT_SUMMARY_PROJECTION = {"title": 1, "date": 1, "time": 1, "location": 1, "created_by": 1}
+
+OGS_SEM = asyncio.Semaphore(10)  # Maximum concurrent OGS stat refreshes
+OGS_RETRY_ATTEMPTS = 3  # Tries per OGS request on 429/5xx responses
+OGS_MAX_RETRY_DELAY = 30  # Upper bound in seconds for a single backoff sleep
+OGS_CACHE_TTL = 120  # Seconds a successful OGS lookup is reused
+OGS_CACHE_MAX_SIZE = 2048  # Usernames kept in the OGS lookup cache
+
+_ogs_cache: Dict[str, Tuple[float, Dict]] = {}
+# username -> [lock, number of callers holding or waiting for it]
+_ogs_locks: Dict[str, List] = {}
+
+USER_CACHE_TTL = 60  # Seconds a fetched user document is reused
+USER_CACHE_MAX_SIZE = 10000
+USER_CACHE_MISS_TTL = 10  # Seconds an unregistered sender is remembered as missing
+
+_user_cache: Dict[int, Tuple[float, Optional[Dict]]] = {}  # None marks a known miss
+
+# Strong references to fire-and-forget tasks so they are not garbage collected
+_background_tasks = set()
+
+SEND_CONCURRENCY = 30  # Maximum in-flight Telegram sends during a broadcast
+SEND_RATE_PER_SECOND = 30  # Telegram's global bot message limit
+PER_CHAT_BURST = 3  # Messages one chat may receive back to back, refilled at 1 msg/s
+SEND_MAX_ATTEMPTS = 3  # Tries per message on flood control or network errors
+BROADCAST_BATCH_SIZE = 500  # Recipients fetched per cursor batch
 
 # Define states for conversation handling
 class RegistrationForm(StatesGroup):
@@ -80,95 +136,387 @@ class MenteeForm(StatesGroup):
     mentor_id = State()
     message = State()
 
+class BroadcastForm(StatesGroup):
+    message = State()
+    confirm = State()
+
+# Callback data factories for inline buttons that carry an argument.
+# Prefixes are kept short because Telegram caps callback data at 64 bytes.
+event_cb = CallbackData("ev", "event_id")
+rsvp_cb = CallbackData("rsvp", "event_id")
+view_mentor_cb = CallbackData("vm", "mentor_id")
+subscribe_cb = CallbackData("sub", "mentor_id")
+pay_cb = CallbackData("pay", "method", "mentor_id")
+message_mentor_cb = CallbackData("msg", "mentor_id")
+cancel_sub_cb = CallbackData("unsub", "subscription_id")
+
+# Static keyboards, built once at import time
+RANK_KEYBOARD = InlineKeyboardMarkup(row_width=5)
+RANK_KEYBOARD.add(*[InlineKeyboardButton(rank, callback_data=f"rank_{rank}") for rank in RANKS])
+
+REGISTER_KEYBOARD = ReplyKeyboardMarkup(resize_keyboard=True)
+REGISTER_KEYBOARD.add(KeyboardButton("Register"))
+
+def build_main_menu_keyboard(is_admin: bool = False, is_mentor: bool = False) -> ReplyKeyboardMarkup:
+    keyboard = ReplyKeyboardMarkup(resize_keyboard=True, row_width=2)
+    keyboard.add(
+        KeyboardButton("Leaderboard"),
+        KeyboardButton("Events"),
+        KeyboardButton("My Profile"),
+        KeyboardButton("Record Match"),
+        KeyboardButton("Find Mentor"),
+        KeyboardButton("Help")
+    )
+    
+    # Add admin and mentor buttons if applicable
+    if is_admin:
+        keyboard.add(KeyboardButton("Admin Panel"))
+    
+    if is_mentor:
+        keyboard.add(KeyboardButton("Mentor Panel"))
+    
+    return keyboard
+
+MAIN_MENU_KEYBOARDS = {
+    (is_admin, is_mentor): build_main_menu_keyboard(is_admin, is_mentor)
+    for is_admin in (False, True)
+    for is_mentor in (False, True)
+}
+MAIN_MENU_KEYBOARD = MAIN_MENU_KEYBOARDS[(False, False)]
+
+LEADERBOARD_KEYBOARD = InlineKeyboardMarkup()
+LEADERBOARD_KEYBOARD.add(InlineKeyboardButton("Update OGS Stats", callback_data="update_leaderboard"))
+
+ADMIN_PANEL_KEYBOARD = InlineKeyboardMarkup(row_width=1)
+ADMIN_PANEL_KEYBOARD.add(
+    InlineKeyboardButton("Create Event", callback_data="create_event"),
+    InlineKeyboardButton("Broadcast Announcement", callback_data="broadcast")
+)
+
+# Broadcast message templates, formatted once per fan-out
+EVENT_NOTIFICATION_TEMPLATE = (
+    "📅 *New Event: {title}* 📅\n\n"
+    "📆 *Date*: {date}\n"
+    "🕒 *Time*: {time}\n"
+    "📍 *Location*: {location}\n\n"
+    "Check the Events section for more details!"
+)
+ANNOUNCEMENT_TEMPLATE = "📢 *ANNOUNCEMENT* 📢\n\n{message}"
+
+# Payment instructions by method, filled in with the subscription id
+PAYMENT_INSTRUCTIONS = {
+    "bank": (
+        "Please complete your payment using the following bank details:\n\n"
+        "Bank: Example Bank\n"
+        "Account Name: Go Club\n"
+        "Account Number: 1234567890\n"
+        "Reference: MENTOR-{subscription_id}"
+    ),
+    "crypto": (
+        "Please complete your payment using the following cryptocurrency address:\n\n"
+        "Bitcoin: 1A1zP1eP5QGefi2DMPTfTL5SLmv7DivfNa\n"
+        "Ethereum: 0x742d35Cc6634C0532925a3b844Bc454e4438f44e\n"
+        "Reference: MENTOR-{subscription_id}"
+    ),
+}
+
 # Utility Functions
 def get_rank_index(rank: str) -> int:
-    try:
-        return RANKS.index(rank)
-    except ValueError:
-        return -1
+    return RANK_INDEX.get(rank, -1)
 def register_all_handlers(dp):
     """Register all message handlers."""
     # All handlers are already registered with decorators
     # This function exists to provide an interface for main.py
-    pass
+    dp.middleware.setup(UserMiddleware())
+    
+    # Registered last so it only sees callbacks no other handler matched,
+    # such as buttons sent before a callback data format changed or ones
+    # pressed while a form expects other input
+    dp.register_callback_query_handler(unknown_callback, state="*")
+    
+async def unknown_callback(callback_query: types.CallbackQuery):
+    """Answer unhandled buttons so the client stops waiting."""
+    await bot.answer_callback_query(
+        callback_query.id,
+        text="That action isn't available right now."
+    )
+
+def parse_event_id(event_id: str) -> Union[ObjectId, str]:
+    """Convert an event id from callback data back to its stored form.
     
+    New events use Mongo-assigned ObjectIds; older ones have "event_<timestamp>" string ids.
+    """
+    return ObjectId(event_id) if ObjectId.is_valid(event_id) else event_id
+
+def rank_fields(rank: str, prefix: str = "") -> Dict:
+    """Return the rank string together with its numeric index for storage."""
+    return {f"{prefix}rank": rank, f"{prefix}rank_index": get_rank_index(rank)}
+
 def is_rank_sufficient_for_mentor(rank: str) -> bool:
-    mentor_min_index = get_rank_index(MENTOR_MINIMUM_RANK)
-    user_rank_index = get_rank_index(rank)
-    return user_rank_index >= mentor_min_index
+    return rank in MENTOR_ELIGIBLE_RANKS
+
+def _cached_user(telegram_id: int, now: float) -> Tuple[bool, Optional[Dict]]:
+    """Return (hit, user); misses are cached with a shorter TTL than documents."""
+    entry = _user_cache.get(telegram_id)
+    if entry is None:
+        return False, None
+    ttl = USER_CACHE_TTL if entry[1] is not None else USER_CACHE_MISS_TTL
+    if now - entry[0] >= ttl:
+        return False, None
+    return True, entry[1]
+
+def _cache_user(telegram_id: int, user: Optional[Dict], now: float) -> None:
+    if len(_user_cache) >= USER_CACHE_MAX_SIZE:
+        # Evict the oldest entry
+        _user_cache.pop(next(iter(_user_cache)))
+    _user_cache.pop(telegram_id, None)
+    _user_cache[telegram_id] = (now, user)
+
+async def get_user(telegram_id: int) -> Optional[Dict]:
+    """Return a user document, served from a short-lived cache when possible.
+    
+    Unregistered senders are cached as None too, so their every message
+    does not cost a query until registration invalidates the entry.
+    """
+    hit, user = _cached_user(telegram_id, time.monotonic())
+    if hit:
+        return user
+    
+    user = await users_collection.find_one({"telegram_id": telegram_id})
+    _cache_user(telegram_id, user, time.monotonic())
+    return user
+
+async def get_users(*telegram_ids: int) -> Dict[int, Dict]:
+    """Return user documents keyed by telegram_id, fetching cache misses in one query."""
+    now = time.monotonic()
+    users = {}
+    missing = []
+    for telegram_id in telegram_ids:
+        hit, user = _cached_user(telegram_id, now)
+        if not hit:
+            missing.append(telegram_id)
+        elif user is not None:
+            users[telegram_id] = user
+    
+    if missing:
+        async for user in users_collection.find({"telegram_id": {"$in": missing}}):
+            _cache_user(user["telegram_id"], user, now)
+            users[user["telegram_id"]] = user
+        for telegram_id in missing:
+            if telegram_id not in users:
+                _cache_user(telegram_id, None, now)
+    return users
+
+def invalidate_user_cache(*telegram_ids: int) -> None:
+    """Drop cached user documents after they have been modified."""
+    for telegram_id in telegram_ids:
+        _user_cache.pop(telegram_id, None)
+
+class UserMiddleware(BaseMiddleware):
+    """Load the sender's user document once and pass it to handlers as `user`."""
+    
+    async def on_process_message(self, message: types.Message, data: dict):
+        data["user"] = await get_user(message.from_user.id)
+    
+    async def on_process_callback_query(self, callback_query: types.CallbackQuery, data: dict):
+        data["user"] = await get_user(callback_query.from_user.id)
+
+async def get_ogs_session() -> aiohttp.ClientSession:
+    """Return the shared OGS HTTP session, creating it if needed."""
+    global ogs_session
+    if ogs_session is None or ogs_session.closed:
+        ogs_session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(
+                limit=100,
+                limit_per_host=20,
+                ttl_dns_cache=600,
+                enable_cleanup_closed=True
+            )
+        )
+    return ogs_session
+
+async def close_ogs_session() -> None:
+    """Close the shared OGS HTTP session."""
+    global ogs_session
+    if ogs_session is not None and not ogs_session.closed:
+        await ogs_session.close()
+    ogs_session = None
+
+def get_retry_delay(retry_after: Optional[str], attempt: int) -> float:
+    """Return the backoff delay, honouring a numeric Retry-After header when present."""
+    if retry_after and retry_after.isdigit():
+        return min(float(retry_after), OGS_MAX_RETRY_DELAY)
+    return min(2 ** attempt + random.random(), OGS_MAX_RETRY_DELAY)
+
+async def get_ogs_json(session: aiohttp.ClientSession, url: str, params: Optional[Dict] = None) -> Optional[Dict]:
+    """GET an OGS endpoint and return the decoded JSON, or None on failure.
+    
+    Rate-limited (429) and server error (5xx) responses are retried with exponential backoff.
+    """
+    for attempt in range(OGS_RETRY_ATTEMPTS):
+        async with session.get(url, params=params) as resp:
+            if resp.status == 200:
+                # ujson decodes noticeably faster than the stdlib json module
+                return await resp.json(loads=ujson.loads)
+            if resp.status != 429 and resp.status < 500:
+                return None
+            retry_after = resp.headers.get("Retry-After")
+        
+        if attempt < OGS_RETRY_ATTEMPTS - 1:
+            await asyncio.sleep(get_retry_delay(retry_after, attempt))
+    return None
+
+def get_cached_ogs_data(username: str) -> Optional[Dict]:
+    """Return a cached OGS lookup for the username if it is still fresh."""
+    ts, cached = _ogs_cache.get(username, (0.0, None))
+    if cached is not None and time.monotonic() - ts < OGS_CACHE_TTL:
+        return cached
+    return None
+
+@asynccontextmanager
+async def ogs_lookup_lock(username: str):
+    """Serialise lookups for one username, dropping the lock once nobody needs it."""
+    entry = _ogs_locks.setdefault(username, [asyncio.Lock(), 0])
+    entry[1] += 1
+    try:
+        async with entry[0]:
+            yield
+    finally:
+        entry[1] -= 1
+        if not entry[1]:
+            del _ogs_locks[username]
 
 async def fetch_ogs_data(username: str) -> Dict:
-    async with aiohttp.ClientSession() as session:
-        try:
-            # Search for user
-            async with session.get(f"{OGS_API_URL}/players", params={"username": username}) as resp:
-                if resp.status != 200:
-                    return {"error": "Failed to fetch OGS data"}
-                
-                data = await resp.json()
-                if not data.get("results"):
-                    return {"error": "User not found on OGS"}
-                
-                user_id = data["results"][0]["id"]
-                
-                # Get detailed user info
-                async with session.get(f"{OGS_API_URL}/players/{user_id}/") as user_resp:
-                    if user_resp.status != 200:
-                        return {"error": "Failed to fetch detailed user data"}
-                    
-                    user_data = await user_resp.json()
-                    
-                    # Get recent games
-                    async with session.get(f"{OGS_API_URL}/players/{user_id}/games/") as games_resp:
-                        if games_resp.status != 200:
-                            return {"error": "Failed to fetch user games"}
-                        
-                        games_data = await games_resp.json()
-                        
-                        return {
-                            "id": user_id,
-                            "username": user_data.get("username"),
-                            "rank": user_data.get("ranking"),
-                            "wins": user_data.get("wins", 0),
-                            "losses": user_data.get("losses", 0),
-                            "recent_games": games_data.get("results", [])[:5]
-                        }
-        except Exception as e:
-            return {"error": f"Error fetching OGS data: {str(e)}"}
-
-async def update_user_ogs_stats(user_id: int) -> None:
-    user = await users_collection.find_one({"telegram_id": user_id})
-    if not user or not user.get("ogs_username"):
-        return
+    """Fetch OGS data for a username, coalescing duplicate lookups within OGS_CACHE_TTL."""
+    cached = get_cached_ogs_data(username)
+    if cached is not None:
+        return cached
+    
+    # Concurrent callers for the same username share a single in-flight request
+    async with ogs_lookup_lock(username):
+        cached = get_cached_ogs_data(username)
+        if cached is not None:
+            return cached
+        
+        result = await fetch_ogs_data_uncached(username)
+        if "error" not in result:
+            if len(_ogs_cache) >= OGS_CACHE_MAX_SIZE:
+                # Evict the oldest entry
+                _ogs_cache.pop(next(iter(_ogs_cache)))
+            _ogs_cache.pop(username, None)
+            _ogs_cache[username] = (time.monotonic(), result)
+        return result
+
+def parse_ogs_player(user_id: int, user_data: Dict, games_data: Dict) -> Dict:
+    """Build the OGS lookup result from the decoded profile and games payloads."""
+    return {
+        "id": user_id,
+        "username": user_data.get("username"),
+        "rank": user_data.get("ranking"),
+        "wins": user_data.get("wins", 0),
+        "losses": user_data.get("losses", 0),
+        "recent_games": games_data.get("results", [])[:5]
+    }
+
+async def fetch_ogs_data_uncached(username: str) -> Dict:
+    session = await get_ogs_session()
+    try:
+        # Search for user
+        data = await get_ogs_json(session, f"{OGS_API_URL}/players", params={"username": username})
+        if data is None:
+            return {"error": "Failed to fetch OGS data"}
+        
+        if not data.get("results"):
+            return {"error": "User not found on OGS"}
+        
+        user_id = data["results"][0]["id"]
+        
+        # Get detailed user info and recent games concurrently
+        user_data, games_data = await asyncio.gather(
+            get_ogs_json(session, f"{OGS_API_URL}/players/{user_id}/"),
+            get_ogs_json(session, f"{OGS_API_URL}/players/{user_id}/games/")
+        )
+        
+        if user_data is None:
+            return {"error": "Failed to fetch detailed user data"}
+        
+        if games_data is None:
+            return {"error": "Failed to fetch user games"}
+        
+        return parse_ogs_player(user_id, user_data, games_data)
+    except Exception as e:
+        return {"error": f"Error fetching OGS data: {str(e)}"}
+
+async def update_user_ogs_stats(user: Dict) -> Dict:
+    """Refresh a user's OGS stats and return the updated user document."""
+    if not user.get("ogs_username"):
+        return user
     
-    ogs_data = await fetch_ogs_data(user["ogs_username"])
-    if "error" not in ogs_data:
-        await users_collection.update_one(
-            {"telegram_id": user_id},
+    async with OGS_SEM:
+        ogs_data = await fetch_ogs_data(user["ogs_username"])
+        if "error" in ogs_data:
+            return user
+        
+        now = datetime.now()
+        updated = await users_collection.find_one_and_update(
+            {"telegram_id": user["telegram_id"]},
             {"$set": {
                 "ogs_rank": ogs_data.get("rank"),
                 "ogs_wins": ogs_data.get("wins"),
                 "ogs_losses": ogs_data.get("losses"),
-                "last_ogs_update": datetime.now()
-            }}
+                "last_ogs_update": now,
+                "ogs_stale_after": now + OGS_REFRESH_INTERVAL
+            }},
+            return_document=ReturnDocument.AFTER
         )
+        invalidate_user_cache(user["telegram_id"])
+        return updated or user
+
+async def backfill_rank_indexes() -> None:
+    """Store the numeric rank_index on users registered before it existed."""
+    await users_collection.update_many(
+        {"rank_index": {"$exists": False}},
+        [{"$set": {"rank_index": {"$indexOfArray": [RANKS, "$rank"]}}}]
+    )
+
+async def get_leaderboard_users() -> List[Dict]:
+    """Fetch the top players, already sorted by rank and wins in MongoDB."""
+    return await users_collection.find({}, LEADERBOARD_PROJECTION).sort(
+        [("rank_index", -1), ("wins", -1)]
+    ).limit(LEADERBOARD_SIZE).to_list(LEADERBOARD_SIZE)
 
 def create_leaderboard_message(users: List[Dict]) -> str:
+    """Render a leaderboard from users already sorted by rank."""
     if not users:
         return "No players in the leaderboard yet."
     
-    ranked_users = sorted(users, key=lambda x: get_rank_index(x.get("rank", "30k")), reverse=True)
-    
-    message = "🏆 *Go Club Leaderboard* 🏆\n\n"
-    for i, user in enumerate(ranked_users, 1):
+    lines = ["🏆 *Go Club Leaderboard* 🏆\n\n"]
+    for i, user in enumerate(users, 1):
         name = user.get("name", "Unknown")
         rank = user.get("rank", "N/A")
         wins = user.get("wins", 0)
         losses = user.get("losses", 0)
         
-        message += f"{i}. *{name}* - {rank} ({wins}W/{losses}L)\n"
+        lines.append(f"{i}. *{name}* - {rank} ({wins}W/{losses}L)\n")
+    
+    return "".join(lines)
+
+async def get_leaderboard_message() -> str:
+    """Return the rendered leaderboard, rebuilding it when the cache is stale."""
+    if (
+        _leaderboard_cache["text"] is not None and
+        time.monotonic() - _leaderboard_cache["ts"] < LEADERBOARD_CACHE_TTL
+    ):
+        return _leaderboard_cache["text"]
     
-    return message
+    users = await get_leaderboard_users()
+    _leaderboard_cache["text"] = create_leaderboard_message(users)
+    _leaderboard_cache["ts"] = time.monotonic()
+    return _leaderboard_cache["text"]
+
+def invalidate_leaderboard_cache() -> None:
+    """Force the next leaderboard request to rebuild from the database."""
+    _leaderboard_cache["text"] = None
 
 def create_event_message(event: Dict) -> str:
     title = event.get("title", "Event")
@@ -177,13 +525,13 @@ def create_event_message(event: Dict) -> str:
     time = event.get("time", "TBD")
     location = event.get("location", "TBD")
     
-    message = f"📅 *{title}* 📅\n\n"
-    message += f"📝 *Description*: {description}\n"
-    message += f"📆 *Date*: {date}\n"
-    message += f"🕒 *Time*: {time}\n"
-    message += f"📍 *Location*: {location}\n"
-    
-    return message
+    return (
+        f"📅 *{title}* 📅\n\n"
+        f"📝 *Description*: {description}\n"
+        f"📆 *Date*: {date}\n"
+        f"🕒 *Time*: {time}\n"
+        f"📍 *Location*: {location}\n"
+    )
 
 def create_mentor_message(mentor: Dict) -> str:
     name = mentor.get("name", "Unknown")
@@ -192,47 +540,138 @@ def create_mentor_message(mentor: Dict) -> str:
     availability = mentor.get("mentor_availability", "Not specified")
     price = mentor.get("mentor_price", "Not specified")
     
-    message = f"👨‍🏫 *Mentor: {name}* ({rank})\n\n"
-    message += f"📝 *About*: {description}\n"
-    message += f"🕒 *Availability*: {availability}\n"
-    message += f"💰 *Price*: {price}\n"
+    return (
+        f"👨‍🏫 *Mentor: {name}* ({rank})\n\n"
+        f"📝 *About*: {description}\n"
+        f"🕒 *Availability*: {availability}\n"
+        f"💰 *Price*: {price}\n"
+    )
+
+class SendRateLimiter:
+    """Async token bucket allowing `rate` acquisitions per `period` seconds."""
+    
+    def __init__(self, rate: int, period: float = 1.0):
+        self.rate = rate
+        self.period = period
+        self.tokens = float(rate)
+        self.updated = time.monotonic()
+        self.lock = asyncio.Lock()
+    
+    async def __aenter__(self):
+        async with self.lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.rate, self.tokens + (now - self.updated) * self.rate / self.period)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return self
+                await asyncio.sleep((1 - self.tokens) * self.period / self.rate)
+    
+    async def __aexit__(self, exc_type, exc, tb):
+        return False
+
+send_limiter = SendRateLimiter(SEND_RATE_PER_SECOND)
+send_sem = asyncio.Semaphore(SEND_CONCURRENCY)
+_chat_limiters: Dict[int, SendRateLimiter] = {}
+
+def get_chat_limiter(chat_id: int) -> SendRateLimiter:
+    """Return the per-chat token bucket, creating it on first use."""
+    limiter = _chat_limiters.get(chat_id)
+    if limiter is None:
+        if len(_chat_limiters) >= USER_CACHE_MAX_SIZE:
+            _chat_limiters.pop(next(iter(_chat_limiters)))
+        limiter = _chat_limiters[chat_id] = SendRateLimiter(PER_CHAT_BURST, PER_CHAT_BURST)
+    return limiter
+
+async def safe_send_message(chat_id: int, text: str, **kwargs) -> bool:
+    """Send a message within Telegram's rate limits; return whether it was delivered.
+    
+    Flood control and network errors are retried with jittered backoff.
+    """
+    chat_limiter = get_chat_limiter(chat_id)
+    for attempt in range(SEND_MAX_ATTEMPTS):
+        async with chat_limiter, send_sem, send_limiter:
+            try:
+                await bot.send_message(chat_id, text, **kwargs)
+                return True
+            except RetryAfter as e:
+                delay = e.timeout + random.random()
+            except NetworkError:
+                delay = 2 ** attempt + random.random()
+            except Exception as e:
+                logging.error(f"Failed to send message to user {chat_id}: {e}")
+                return False
+        
+        if attempt < SEND_MAX_ATTEMPTS - 1:
+            await asyncio.sleep(delay)
     
-    return message
+    logging.error(f"Failed to send message to user {chat_id} after {SEND_MAX_ATTEMPTS} attempts")
+    return False
+
+async def broadcast_to_users(text: str, query: Optional[Dict] = None, **kwargs) -> Tuple[int, int]:
+    """Send a message to every user matching `query`; return (sent, failed) counts."""
+    queue = asyncio.Queue(maxsize=SEND_CONCURRENCY * 2)
+    counts = {"sent": 0, "failed": 0}
+    
+    async def worker():
+        while True:
+            chat_id = await queue.get()
+            if chat_id is None:
+                return
+            delivered = await safe_send_message(chat_id, text, **kwargs)
+            counts["sent" if delivered else "failed"] += 1
+    
+    workers = [asyncio.create_task(worker()) for _ in range(SEND_CONCURRENCY)]
+    
+    # Stream recipients so sending overlaps with fetching the next batch
+    try:
+        cursor = users_collection.find(query or {}, RECIPIENT_PROJECTION).batch_size(BROADCAST_BATCH_SIZE)
+        async for user in cursor:
+            await queue.put(user["telegram_id"])
+    finally:
+        for _ in workers:
+            await queue.put(None)
+        await asyncio.gather(*workers)
+    
+    return counts["sent"], counts["failed"]
+
+def _on_background_task_done(task: asyncio.Task) -> None:
+    _background_tasks.discard(task)
+    if not task.cancelled() and task.exception() is not None:
+        logging.error(f"Background task failed: {task.exception()}")
+
+def run_in_background(coro) -> asyncio.Task:
+    """Schedule a coroutine without making the current handler wait for it."""
+    task = asyncio.create_task(coro)
+    _background_tasks.add(task)
+    task.add_done_callback(_on_background_task_done)
+    return task
+
+def send_in_background(chat_id: int, text: str, **kwargs) -> asyncio.Task:
+    """Schedule a message without making the current handler wait for it."""
+    return run_in_background(safe_send_message(chat_id, text, **kwargs))
 
 # Command Handlers
 @dp.message_handler(commands=['start'])
 async def cmd_start(message: types.Message):
-    user = await users_collection.find_one({"telegram_id": message.from_user.id})
+    user = await get_user(message.from_user.id)
     
     if not user:
         # New user
-        keyboard = ReplyKeyboardMarkup(resize_keyboard=True)
-        keyboard.add(KeyboardButton("Register"))
         await message.answer(
             "Welcome to the Go Club Bot! 🎉\n\n"
             "This bot helps you track your Go progress, join events, "
             "find matches, and connect with mentors.\n\n"
             "Please register to access all features.",
-            reply_markup=keyboard
+            reply_markup=REGISTER_KEYBOARD
         )
     else:
         # Existing user
-        keyboard = ReplyKeyboardMarkup(resize_keyboard=True, row_width=2)
-        keyboard.add(
-            KeyboardButton("Leaderboard"),
-            KeyboardButton("Events"),
-            KeyboardButton("My Profile"),
-            KeyboardButton("Record Match"),
-            KeyboardButton("Find Mentor"),
-            KeyboardButton("Help")
-        )
-        
-        # Add admin and mentor buttons if applicable
-        if user.get("is_admin", False):
-            keyboard.add(KeyboardButton("Admin Panel"))
-        
-        if user.get("is_mentor", False):
-            keyboard.add(KeyboardButton("Mentor Panel"))
+        keyboard = MAIN_MENU_KEYBOARDS[(
+            bool(user.get("is_admin", False)),
+            bool(user.get("is_mentor", False))
+        )]
         
         await message.answer(
             f"Welcome back, {user.get('name', 'Go player')}! 👋\n\n"
@@ -250,18 +689,10 @@ async def process_name(message: types.Message, state: FSMContext):
     async with state.proxy() as data:
         data['name'] = message.text
     
-    # Create rank selection keyboard
-    keyboard = InlineKeyboardMarkup(row_width=5)
-    buttons = []
-    for rank in RANKS:
-        buttons.append(InlineKeyboardButton(rank, callback_data=f"rank_{rank}"))
-    
-    keyboard.add(*buttons)
-    
     await RegistrationForm.next()
-    await message.answer("What's your current Go rank?", reply_markup=keyboard)
+    await message.answer("What's your current Go rank?", reply_markup=RANK_KEYBOARD)
 
-@dp.callback_query_handler(lambda c: c.data.startswith('rank_'), state=RegistrationForm.rank)
+@dp.callback_query_handler(Text(startswith='rank_'), state=RegistrationForm.rank)
 async def process_rank(callback_query: types.CallbackQuery, state: FSMContext):
     await bot.answer_callback_query(callback_query.id)
     rank = callback_query.data.split('_')[1]
@@ -270,7 +701,7 @@ async def process_rank(callback_query: types.CallbackQuery, state: FSMContext):
         data['rank'] = rank
     
     await RegistrationForm.next()
-    await bot.send_message(
+    await safe_send_message(
         callback_query.from_user.id,
         "What's your OGS (Online Go Server) username? If you don't have one, type 'none'."
     )
@@ -307,15 +738,16 @@ async def process_ogs_username(message: types.Message, state: FSMContext):
                 data['ogs_losses'] = ogs_data['losses']
     
     # Save user data
+    now = datetime.now()
     user_data = {
         "telegram_id": message.from_user.id,
         "username": message.from_user.username,
         "name": data['name'],
-        "rank": data['rank'],
+        **rank_fields(data['rank']),
         "ogs_username": data['ogs_username'],
         "wins": 0,
         "losses": 0,
-        "registered_at": datetime.now(),
+        "registered_at": now,
         "is_admin": False,
         "is_mentor": False
     }
@@ -327,7 +759,8 @@ async def process_ogs_username(message: types.Message, state: FSMContext):
             "ogs_rank": data['ogs_rank'],
             "ogs_wins": data['ogs_wins'],
             "ogs_losses": data['ogs_losses'],
-            "last_ogs_update": datetime.now()
+            "last_ogs_update": now,
+            "ogs_stale_after": now + OGS_REFRESH_INTERVAL
         })
     
     # Check if user is eligible to be a mentor based on rank
@@ -348,38 +781,27 @@ async def process_ogs_username(message: types.Message, state: FSMContext):
     else:
         await users_collection.insert_one(user_data)
         
-        keyboard = ReplyKeyboardMarkup(resize_keyboard=True, row_width=2)
-        keyboard.add(
-            KeyboardButton("Leaderboard"),
-            KeyboardButton("Events"),
-            KeyboardButton("My Profile"),
-            KeyboardButton("Record Match"),
-            KeyboardButton("Find Mentor"),
-            KeyboardButton("Help")
-        )
-        
         await message.answer(
             f"Registration complete! Welcome to the Go Club, {data['name']}!",
-            reply_markup=keyboard
+            reply_markup=MAIN_MENU_KEYBOARD
         )
     
+    invalidate_user_cache(message.from_user.id)
+    invalidate_leaderboard_cache()
     await state.finish()
 
 @dp.message_handler(Text(equals="My Profile", ignore_case=True))
 async def show_profile(message: types.Message):
-    user = await users_collection.find_one({"telegram_id": message.from_user.id})
+    user = await get_user(message.from_user.id)
     
     if not user:
         await message.answer("You need to register first. Use /register to get started.")
         return
     
-    # Update OGS stats if username is available and last update was more than a day ago
-    if user.get("ogs_username") and (
-        not user.get("last_ogs_update") or 
-        datetime.now() - user["last_ogs_update"] > timedelta(days=1)
-    ):
-        await update_user_ogs_stats(message.from_user.id)
-        user = await users_collection.find_one({"telegram_id": message.from_user.id})
+    # Update OGS stats if username is available and the stored stats have expired;
+    # users saved before ogs_stale_after existed are refreshed once to get it
+    if user.get("ogs_username") and user.get("ogs_stale_after", datetime.min) <= datetime.now():
+        user = await update_user_ogs_stats(user)
     
     # Create profile message
     name = user.get("name", "Unknown")
@@ -388,10 +810,12 @@ async def show_profile(message: types.Message):
     losses = user.get("losses", 0)
     registered_at = user.get("registered_at", datetime.now()).strftime("%Y-%m-%d")
     
-    profile = f"👤 *Profile: {name}*\n\n"
-    profile += f"🥋 *Rank*: {rank}\n"
-    profile += f"📊 *Club Record*: {wins}W/{losses}L\n"
-    profile += f"📅 *Member since*: {registered_at}\n\n"
+    profile_parts = [
+        f"👤 *Profile: {name}*\n\n"
+        f"🥋 *Rank*: {rank}\n"
+        f"📊 *Club Record*: {wins}W/{losses}L\n"
+        f"📅 *Member since*: {registered_at}\n\n"
+    ]
     
     # Add OGS info if available
     if user.get("ogs_username"):
@@ -400,82 +824,90 @@ async def show_profile(message: types.Message):
         ogs_wins = user.get("ogs_wins", 0)
         ogs_losses = user.get("ogs_losses", 0)
         
-        profile += f"🌐 *OGS Profile*\n"
-        profile += f"👤 *Username*: {ogs_username}\n"
-        profile += f"🥋 *OGS Rank*: {ogs_rank}\n"
-        profile += f"📊 *OGS Record*: {ogs_wins}W/{ogs_losses}L\n\n"
+        profile_parts.append(
+            f"🌐 *OGS Profile*\n"
+            f"👤 *Username*: {ogs_username}\n"
+            f"🥋 *OGS Rank*: {ogs_rank}\n"
+            f"📊 *OGS Record*: {ogs_wins}W/{ogs_losses}L\n\n"
+        )
     
     # Add mentor status if applicable
     if user.get("is_mentor", False):
-        profile += "👨‍🏫 *Mentor Status*: Active\n\n"
+        profile_parts.append("👨‍🏫 *Mentor Status*: Active\n\n")
     
     # Add admin status if applicable
     if user.get("is_admin", False):
-        profile += "👑 *Admin Status*: Active\n\n"
-    
-    # Create profile actions keyboard
-    keyboard = InlineKeyboardMarkup(row_width=1)
-    keyboard.add(
-        InlineKeyboardButton("Update Rank", callback_data="update_rank"),
-        InlineKeyboardButton("Update OGS Username", callback_data="update_ogs"),
-    )
+        profile_parts.append("👑 *Admin Status*: Active\n\n")
     
-    # Add mentor-related buttons
+    # Create profile actions keyboard with the mentor-related button, if any
+    keyboard = None
     if user.get("is_mentor", False):
+        keyboard = InlineKeyboardMarkup(row_width=1)
         keyboard.add(InlineKeyboardButton("Update Mentor Profile", callback_data="update_mentor"))
     elif is_rank_sufficient_for_mentor(user.get("rank", "30k")):
+        keyboard = InlineKeyboardMarkup(row_width=1)
         keyboard.add(InlineKeyboardButton("Become a Mentor", callback_data="become_mentor"))
     
-    await message.answer(profile, reply_markup=keyboard, parse_mode=ParseMode.MARKDOWN)
+    await message.answer("".join(profile_parts), reply_markup=keyboard, parse_mode=ParseMode.MARKDOWN)
 
 @dp.message_handler(Text(equals="Leaderboard", ignore_case=True))
 async def show_leaderboard(message: types.Message):
-    users = await users_collection.find().to_list(length=100)
-    leaderboard = create_leaderboard_message(users)
+    leaderboard = await get_leaderboard_message()
     
-    keyboard = InlineKeyboardMarkup()
-    keyboard.add(InlineKeyboardButton("Update OGS Stats", callback_data="update_leaderboard"))
-    
-    await message.answer(leaderboard, reply_markup=keyboard, parse_mode=ParseMode.MARKDOWN)
+    await message.answer(leaderboard, reply_markup=LEADERBOARD_KEYBOARD, parse_mode=ParseMode.MARKDOWN)
 
-@dp.callback_query_handler(lambda c: c.data == "update_leaderboard")
+@dp.callback_query_handler(Text(equals="update_leaderboard"))
 async def update_leaderboard(callback_query: types.CallbackQuery):
     await bot.answer_callback_query(callback_query.id, text="Updating leaderboard...")
     
-    users = await users_collection.find({"ogs_username": {"$ne": None}}).to_list(length=50)
+    users = await users_collection.find({"ogs_username": {"$ne": None}}, OGS_SYNC_PROJECTION).to_list(length=50)
     
     update_message = "Updating OGS stats for players...\n"
-    await bot.send_message(callback_query.from_user.id, update_message)
-    
-    for user in users:
-        await update_user_ogs_stats(user["telegram_id"])
+    await safe_send_message(callback_query.from_user.id, update_message)
     
-    updated_users = await users_collection.find().to_list(length=100)
-    leaderboard = create_leaderboard_message(updated_users)
+    await asyncio.gather(
+        *(update_user_ogs_stats(user) for user in users),
+        return_exceptions=True
+    )
     
-    keyboard = InlineKeyboardMarkup()
-    keyboard.add(InlineKeyboardButton("Update OGS Stats", callback_data="update_leaderboard"))
+    invalidate_leaderboard_cache()
+    leaderboard = await get_leaderboard_message()
     
-    await bot.send_message(
+    await safe_send_message(
         callback_query.from_user.id, 
         "Leaderboard updated!\n\n" + leaderboard,
-        reply_markup=keyboard,
+        reply_markup=LEADERBOARD_KEYBOARD,
         parse_mode=ParseMode.MARKDOWN
     )
 
 @dp.message_handler(Text(equals="Events", ignore_case=True))
-async def show_events(message: types.Message):
+async def show_events(message: types.Message, user: Optional[Dict] = None):
     # Get upcoming events
     current_date = datetime.now()
-    upcoming_events = await events_collection.find(
-        {"date_time": {"$gte": current_date}}
-    ).sort("date_time", 1).to_list(length=10)
+    cursor = events_collection.find(
+        {"date_time": {"$gte": current_date}},
+        EVENT_LIST_PROJECTION
+    ).sort("date_time", 1).limit(10)
+    
+    # Build the events list as results stream in from the cursor
+    events_keyboard = InlineKeyboardMarkup(row_width=1)
+    event_count = 0
+    
+    async for event in cursor:
+        event_count += 1
+        event_date = event.get("date", "TBD")
+        event_title = event.get("title", "Event")
+        events_keyboard.add(
+            InlineKeyboardButton(
+                f"{event_date} - {event_title}",
+                callback_data=event_cb.new(event_id=event['_id'])
+            )
+        )
     
-    if not upcoming_events:
+    if not event_count:
         keyboard = InlineKeyboardMarkup()
         
         # Add button to create event if user is admin
-        user = await users_collection.find_one({"telegram_id": message.from_user.id})
         if user and user.get("is_admin", False):
             keyboard.add(InlineKeyboardButton("Create Event", callback_data="create_event"))
             await message.answer(
@@ -487,21 +919,7 @@ async def show_events(message: types.Message):
         
         return
     
-    # Create events list with navigation
-    events_keyboard = InlineKeyboardMarkup(row_width=1)
-    
-    for event in upcoming_events:
-        event_date = event.get("date", "TBD")
-        event_title = event.get("title", "Event")
-        events_keyboard.add(
-            InlineKeyboardButton(
-                f"{event_date} - {event_title}",
-                callback_data=f"event_{event['_id']}"
-            )
-        )
-    
     # Add button to create event if user is admin
-    user = await users_collection.find_one({"telegram_id": message.from_user.id})
     if user and user.get("is_admin", False):
         events_keyboard.add(InlineKeyboardButton("Create Event", callback_data="create_event"))
     
@@ -512,22 +930,15 @@ async def show_events(message: types.Message):
         parse_mode=ParseMode.MARKDOWN
     )
 
-@dp.callback_query_handler(lambda c: c.data.startswith('event_'))
-async def show_event_details(callback_query: types.CallbackQuery):
+@dp.callback_query_handler(event_cb.filter())
+async def show_event_details(callback_query: types.CallbackQuery, callback_data: Dict[str, str]):
     await bot.answer_callback_query(callback_query.id)
     
-    event_id = callback_query.data.split('_')[1]
-    # Handle both string IDs and ObjectId based on the format
-    if event_id.startswith("event_"):
-        event = await events_collection.find_one({"_id": event_id})
-    else:
-        try:
-            event = await events_collection.find_one({"_id": ObjectId(event_id)})
-        except:
-            event = await events_collection.find_one({"_id": event_id})
-        
+    event_id = callback_data["event_id"]
+    event = await events_collection.find_one({"_id": parse_event_id(event_id)})
+    
     if not event:
-        await bot.send_message(
+        await safe_send_message(
             callback_query.from_user.id,
             "Event not found. It may have been removed."
         )
@@ -538,19 +949,11 @@ async def show_event_details(callback_query: types.CallbackQuery):
     # Create event action keyboard
     keyboard = InlineKeyboardMarkup(row_width=2)
     keyboard.add(
-        InlineKeyboardButton("RSVP", callback_data=f"rsvp_{event_id}"),
+        InlineKeyboardButton("RSVP", callback_data=rsvp_cb.new(event_id=event_id)),
         InlineKeyboardButton("Back to Events", callback_data="show_events")
     )
     
-    # Add admin actions if user is admin
-    user = await users_collection.find_one({"telegram_id": callback_query.from_user.id})
-    if user and user.get("is_admin", False):
-        keyboard.add(
-            InlineKeyboardButton("Edit Event", callback_data=f"edit_event_{event_id}"),
-            InlineKeyboardButton("Delete Event", callback_data=f"delete_event_{event_id}")
-        )
-    
-    await bot.send_message(
+    await safe_send_message(
         callback_query.from_user.id,
         event_message,
         reply_markup=keyboard,
@@ -560,21 +963,17 @@ async def show_event_details(callback_query: types.CallbackQuery):
 @dp.message_handler(Text(equals="Record Match", ignore_case=True))
 async def record_match_start(message: types.Message):
     # Get list of club members for opponent selection
-    users = await users_collection.find(
-        {"telegram_id": {"$ne": message.from_user.id}}
-    ).sort("name", 1).to_list(length=100)
-    
-    if not users:
-        await message.answer(
-            "There are no other club members registered yet. "
-            "Invite your friends to join the club!"
-        )
-        return
+    cursor = users_collection.find(
+        {"telegram_id": {"$ne": message.from_user.id}},
+        PLAYER_PROJECTION
+    ).sort("name", 1).limit(100)
     
-    # Create opponent selection keyboard
+    # Build the opponent selection keyboard as results stream in
     keyboard = InlineKeyboardMarkup(row_width=1)
+    user_count = 0
     
-    for user in users:
+    async for user in cursor:
+        user_count += 1
         keyboard.add(
             InlineKeyboardButton(
                 f"{user['name']} ({user['rank']})",
@@ -582,6 +981,13 @@ async def record_match_start(message: types.Message):
             )
         )
     
+    if not user_count:
+        await message.answer(
+            "There are no other club members registered yet. "
+            "Invite your friends to join the club!"
+        )
+        return
+    
     # Add option for external opponent
     keyboard.add(InlineKeyboardButton("External Opponent", callback_data="opponent_external"))
     
@@ -592,7 +998,7 @@ async def record_match_start(message: types.Message):
     
     await MatchForm.opponent.set()
 
-@dp.callback_query_handler(lambda c: c.data.startswith('opponent_'), state=MatchForm.opponent)
+@dp.callback_query_handler(Text(startswith='opponent_'), state=MatchForm.opponent)
 async def process_opponent(callback_query: types.CallbackQuery, state: FSMContext):
     await bot.answer_callback_query(callback_query.id)
     
@@ -603,7 +1009,7 @@ async def process_opponent(callback_query: types.CallbackQuery, state: FSMContex
     
     # Get opponent info if it's a club member
     if opponent_id != "external":
-        opponent = await users_collection.find_one({"telegram_id": int(opponent_id)})
+        opponent = await get_user(int(opponent_id))
         async with state.proxy() as data:
             data['opponent_name'] = opponent['name']
             data['opponent_rank'] = opponent['rank']
@@ -616,13 +1022,13 @@ async def process_opponent(callback_query: types.CallbackQuery, state: FSMContex
     )
     
     await MatchForm.next()
-    await bot.send_message(
+    await safe_send_message(
         callback_query.from_user.id,
         "What was the result of the match?",
         reply_markup=keyboard
     )
 
-@dp.callback_query_handler(lambda c: c.data.startswith('result_'), state=MatchForm.result)
+@dp.callback_query_handler(Text(startswith='result_'), state=MatchForm.result)
 async def process_result(callback_query: types.CallbackQuery, state: FSMContext):
     await bot.answer_callback_query(callback_query.id)
     
@@ -632,7 +1038,7 @@ async def process_result(callback_query: types.CallbackQuery, state: FSMContext)
         data['result'] = result
     
     await MatchForm.next()
-    await bot.send_message(
+    await safe_send_message(
         callback_query.from_user.id,
         "Do you have an OGS game link? If yes, please paste it. If no, type 'none'."
     )
@@ -653,70 +1059,45 @@ async def process_match_ogs_link(message: types.Message, state: FSMContext):
         result = data['result']
         
         # Get user data
-        user = await users_collection.find_one({"telegram_id": user_id})
+        user = await get_user(user_id)
         
         # Create match record
         match_data = {
             "date": datetime.now(),
             "player1_id": user_id,
             "player1_name": user['name'],
-            "player1_rank": user['rank'],
+            **rank_fields(user['rank'], "player1_"),
             "result": result,
             "ogs_link": ogs_link
         }
         
-        # Update player records
-        if result == "win":
-            await users_collection.update_one(
-                {"telegram_id": user_id},
-                {"$inc": {"wins": 1}}
-            )
-            
-            if opponent_id != "external":
-                opponent = await users_collection.find_one({"telegram_id": int(opponent_id)})
-                match_data.update({
-                    "player2_id": int(opponent_id),
-                    "player2_name": opponent['name'],
-                    "player2_rank": opponent['rank']
-                })
-                
-                await users_collection.update_one(
-                    {"telegram_id": int(opponent_id)},
-                    {"$inc": {"losses": 1}}
-                )
-            else:
-                match_data.update({
-                    "player2_id": None,
-                    "player2_name": "External Opponent",
-                    "player2_rank": "Unknown"
-                })
-        else:  # loss
-            await users_collection.update_one(
-                {"telegram_id": user_id},
-                {"$inc": {"losses": 1}}
-            )
+        # Update player records; the opponent gets the mirrored result
+        user_field, opp_field = ("wins", "losses") if result == "win" else ("losses", "wins")
+        ops = [UpdateOne({"telegram_id": user_id}, {"$inc": {user_field: 1}})]
+        
+        if opponent_id != "external":
+            match_data.update({
+                "player2_id": int(opponent_id),
+                "player2_name": data['opponent_name'],
+                **rank_fields(data['opponent_rank'], "player2_")
+            })
             
-            if opponent_id != "external":
-                opponent = await users_collection.find_one({"telegram_id": int(opponent_id)})
-                match_data.update({
-                    "player2_id": int(opponent_id),
-                    "player2_name": opponent['name'],
-                    "player2_rank": opponent['rank']
-                })
-                
-                await users_collection.update_one(
-                    {"telegram_id": int(opponent_id)},
-                    {"$inc": {"wins": 1}}
-                )
-            else:
-                match_data.update({
-                    "player2_id": None,
-                    "player2_name": "External Opponent",
-                    "player2_rank": "Unknown"
-                })
+            ops.append(UpdateOne({"telegram_id": int(opponent_id)}, {"$inc": {opp_field: 1}}))
+        else:
+            match_data.update({
+                "player2_id": None,
+                "player2_name": "External Opponent",
+                **rank_fields("Unknown", "player2_")
+            })
         
-        # Save match to database
-        await matches_collection.insert_one(match_data)
+        # Apply record updates and save the match in parallel
+        await asyncio.gather(
+            users_collection.bulk_write(ops, ordered=False),
+            matches_collection.insert_one(match_data)
+        )
+        invalidate_user_cache(user_id, *([int(opponent_id)] if opponent_id != "external" else []))
+    
+    invalidate_leaderboard_cache()
     
     # Finish the state
     await state.finish()
@@ -729,10 +1110,30 @@ async def setup_bot_commands(bot):
     commands = [
         types.BotCommand(command="start", description="Start the bot"),
         types.BotCommand(command="register", description="Register your account"),
-        types.BotCommand(command="help", description="Get help using the bot")
+        types.BotCommand(command="help", description="Get help using the bot"),
+        types.BotCommand(command="notifications", description="Turn event notifications on or off")
     ]
     await bot.set_my_commands(commands)
 
+@dp.message_handler(commands=['notifications'])
+async def cmd_notifications(message: types.Message, user: Optional[Dict] = None):
+    if not user:
+        await message.answer("You need to register first. Use /register to get started.")
+        return
+    
+    enabled = not user.get("notifications_enabled", True)
+    await users_collection.update_one(
+        {"telegram_id": message.from_user.id},
+        {"$set": {"notifications_enabled": enabled}}
+    )
+    invalidate_user_cache(message.from_user.id)
+    
+    await message.answer(
+        "New event notifications are now turned on."
+        if enabled else
+        "New event notifications are now turned off. Send /notifications again to re-enable them."
+    )
+
 @dp.message_handler(commands=['help'])
 async def cmd_help(message: types.Message):
     help_text = (
@@ -740,7 +1141,8 @@ async def cmd_help(message: types.Message):
         "Here are the available commands:\n"
         "/start - Start the bot and access main menu\n"
         "/register - Register a new account\n"
-        "/help - Show this help message\n\n"
+        "/help - Show this help message\n"
+        "/notifications - Turn new event notifications on or off\n\n"
         "You can also use the keyboard buttons below for navigation."
     )
     
@@ -755,28 +1157,31 @@ async def cmd_help(message: types.Message):
 @dp.message_handler(Text(equals="Find Mentor", ignore_case=True))
 async def find_mentor(message: types.Message):
     # Get available mentors
-    mentors = await users_collection.find(
-        {"is_mentor": True}
-    ).sort("rank", -1).to_list(length=50)
-    
-    if not mentors:
-        await message.answer(
-            "There are no mentors available at the moment. "
-            "Check back later or ask club admins about mentorship opportunities."
-        )
-        return
+    cursor = users_collection.find(
+        {"is_mentor": True},
+        PLAYER_PROJECTION
+    ).sort("rank_index", -1).limit(50)
     
-    # Create mentor selection keyboard
+    # Build the mentor selection keyboard as results stream in
     keyboard = InlineKeyboardMarkup(row_width=1)
+    mentor_count = 0
     
-    for mentor in mentors:
+    async for mentor in cursor:
+        mentor_count += 1
         keyboard.add(
             InlineKeyboardButton(
                 f"{mentor['name']} ({mentor['rank']})",
-                callback_data=f"view_mentor_{mentor['telegram_id']}"
+                callback_data=view_mentor_cb.new(mentor_id=mentor['telegram_id'])
             )
         )
     
+    if not mentor_count:
+        await message.answer(
+            "There are no mentors available at the moment. "
+            "Check back later or ask club admins about mentorship opportunities."
+        )
+        return
+    
     await message.answer(
         "👨‍🏫 *Available Mentors* 👨‍🏫\n\n"
         "Select a mentor to view their profile:",
@@ -784,15 +1189,15 @@ async def find_mentor(message: types.Message):
         parse_mode=ParseMode.MARKDOWN
     )
 
-@dp.callback_query_handler(lambda c: c.data.startswith('view_mentor_'))
-async def view_mentor(callback_query: types.CallbackQuery):
+@dp.callback_query_handler(view_mentor_cb.filter())
+async def view_mentor(callback_query: types.CallbackQuery, callback_data: Dict[str, str]):
     await bot.answer_callback_query(callback_query.id)
     
-    mentor_id = int(callback_query.data.split('_')[2])
-    mentor = await users_collection.find_one({"telegram_id": mentor_id})
+    mentor_id = int(callback_data["mentor_id"])
+    mentor = await get_user(mentor_id)
     
     if not mentor:
-        await bot.send_message(
+        await safe_send_message(
             callback_query.from_user.id,
             "Mentor not found. They may have deactivated their mentorship."
         )
@@ -811,34 +1216,34 @@ async def view_mentor(callback_query: types.CallbackQuery):
     
     if subscription:
         keyboard.add(
-            InlineKeyboardButton("Send Message", callback_data=f"message_mentor_{mentor_id}"),
-            InlineKeyboardButton("Cancel Subscription", callback_data=f"cancel_sub_{subscription['_id']}")
+            InlineKeyboardButton("Send Message", callback_data=message_mentor_cb.new(mentor_id=mentor_id)),
+            InlineKeyboardButton("Cancel Subscription", callback_data=cancel_sub_cb.new(subscription_id=subscription['_id']))
         )
         
         mentor_message += "\n✅ *You are currently subscribed to this mentor*"
     else:
         keyboard.add(
-            InlineKeyboardButton("Subscribe", callback_data=f"subscribe_{mentor_id}")
+            InlineKeyboardButton("Subscribe", callback_data=subscribe_cb.new(mentor_id=mentor_id))
         )
     
     keyboard.add(InlineKeyboardButton("Back to Mentor List", callback_data="find_mentors"))
     
-    await bot.send_message(
+    await safe_send_message(
         callback_query.from_user.id,
         mentor_message,
         reply_markup=keyboard,
         parse_mode=ParseMode.MARKDOWN
     )
 
-@dp.callback_query_handler(lambda c: c.data.startswith('subscribe_'))
-async def subscribe_to_mentor(callback_query: types.CallbackQuery):
+@dp.callback_query_handler(subscribe_cb.filter())
+async def subscribe_to_mentor(callback_query: types.CallbackQuery, callback_data: Dict[str, str]):
     await bot.answer_callback_query(callback_query.id)
     
-    mentor_id = int(callback_query.data.split('_')[1])
-    mentor = await users_collection.find_one({"telegram_id": mentor_id})
+    mentor_id = int(callback_data["mentor_id"])
+    mentor = await get_user(mentor_id)
     
     if not mentor:
-        await bot.send_message(
+        await safe_send_message(
             callback_query.from_user.id,
             "Mentor not found. They may have deactivated their mentorship."
         )
@@ -847,12 +1252,12 @@ async def subscribe_to_mentor(callback_query: types.CallbackQuery):
     # Create payment keyboard
     keyboard = InlineKeyboardMarkup(row_width=1)
     keyboard.add(
-        InlineKeyboardButton("Pay via Bank Transfer", callback_data=f"pay_bank_{mentor_id}"),
-        InlineKeyboardButton("Pay via CryptoCurrency", callback_data=f"pay_crypto_{mentor_id}"),
-        InlineKeyboardButton("Cancel", callback_data=f"view_mentor_{mentor_id}")
+        InlineKeyboardButton("Pay via Bank Transfer", callback_data=pay_cb.new(method="bank", mentor_id=mentor_id)),
+        InlineKeyboardButton("Pay via CryptoCurrency", callback_data=pay_cb.new(method="crypto", mentor_id=mentor_id)),
+        InlineKeyboardButton("Cancel", callback_data=view_mentor_cb.new(mentor_id=mentor_id))
     )
     
-    await bot.send_message(
+    await safe_send_message(
         callback_query.from_user.id,
         f"You are about to subscribe to {mentor['name']} for mentorship.\n\n"
         f"Monthly fee: {mentor.get('mentor_price', 'Not specified')}\n\n"
@@ -860,19 +1265,19 @@ async def subscribe_to_mentor(callback_query: types.CallbackQuery):
         reply_markup=keyboard
     )
 
-@dp.callback_query_handler(lambda c: c.data.startswith('pay_'))
-async def process_payment(callback_query: types.CallbackQuery):
+@dp.callback_query_handler(pay_cb.filter())
+async def process_payment(callback_query: types.CallbackQuery, callback_data: Dict[str, str]):
     await bot.answer_callback_query(callback_query.id)
     
-    parts = callback_query.data.split('_')
-    payment_method = parts[1]
-    mentor_id = int(parts[2])
+    payment_method = callback_data["method"]
+    mentor_id = int(callback_data["mentor_id"])
     
-    mentor = await users_collection.find_one({"telegram_id": mentor_id})
-    user = await users_collection.find_one({"telegram_id": callback_query.from_user.id})
+    users = await get_users(mentor_id, callback_query.from_user.id)
+    mentor = users.get(mentor_id)
+    user = users.get(callback_query.from_user.id)
     
     if not mentor or not user:
-        await bot.send_message(
+        await safe_send_message(
             callback_query.from_user.id,
             "Error processing your request. Please try again later."
         )
@@ -881,7 +1286,8 @@ async def process_payment(callback_query: types.CallbackQuery):
     # Simulate payment process (in a real bot, integrate with payment provider)
     # Here we're just creating the subscription record directly
     
-    subscription_id = f"sub_{mentor_id}_{callback_query.from_user.id}_{int(datetime.now().timestamp())}"
+    now = datetime.now()
+    subscription_id = f"sub_{ObjectId()}"
     
     subscription_data = {
         "_id": subscription_id,
@@ -891,58 +1297,43 @@ async def process_payment(callback_query: types.CallbackQuery):
         "mentee_name": user['name'],
         "status": "active",
         "payment_method": payment_method,
-        "start_date": datetime.now(),
-        "end_date": datetime.now() + timedelta(days=30),
+        "start_date": now,
+        "end_date": now + timedelta(days=30),
         "price": mentor.get('mentor_price', "Not specified")
     }
     
     await subscriptions_collection.insert_one(subscription_data)
     
-    # Notify the mentor
-    try:
-        await bot.send_message(
+    # Provide payment instructions to the user
+    template = PAYMENT_INSTRUCTIONS["bank" if payment_method == "bank" else "crypto"]
+    instructions = template.format(subscription_id=subscription_id)
+    
+    keyboard = InlineKeyboardMarkup()
+    keyboard.add(InlineKeyboardButton("Message Mentor", callback_data=message_mentor_cb.new(mentor_id=mentor_id)))
+    
+    # Notify the mentor and the mentee concurrently
+    await asyncio.gather(
+        safe_send_message(
             mentor_id,
             f"🎉 New subscription!\n\n"
             f"{user['name']} has subscribed to your mentorship services.\n"
             f"You can now communicate directly with them through this bot."
+        ),
+        safe_send_message(
+            callback_query.from_user.id,
+            f"✅ Subscription successful!\n\n"
+            f"You are now subscribed to {mentor['name']} for one month.\n\n"
+            f"Payment Instructions:\n{instructions}\n\n"
+            f"Once your payment is confirmed, you can start messaging your mentor.",
+            reply_markup=keyboard
         )
-    except Exception as e:
-        logging.error(f"Failed to notify mentor: {e}")
-    
-    # Provide payment instructions to the user
-    if payment_method == "bank":
-        instructions = (
-            "Please complete your payment using the following bank details:\n\n"
-            "Bank: Example Bank\n"
-            "Account Name: Go Club\n"
-            "Account Number: 1234567890\n"
-            "Reference: MENTOR-" + subscription_id
-        )
-    else:  # crypto
-        instructions = (
-            "Please complete your payment using the following cryptocurrency address:\n\n"
-            "Bitcoin: 1A1zP1eP5QGefi2DMPTfTL5SLmv7DivfNa\n"
-            "Ethereum: 0x742d35Cc6634C0532925a3b844Bc454e4438f44e\n"
-            "Reference: MENTOR-" + subscription_id
-        )
-    
-    keyboard = InlineKeyboardMarkup()
-    keyboard.add(InlineKeyboardButton("Message Mentor", callback_data=f"message_mentor_{mentor_id}"))
-    
-    await bot.send_message(
-        callback_query.from_user.id,
-        f"✅ Subscription successful!\n\n"
-        f"You are now subscribed to {mentor['name']} for one month.\n\n"
-        f"Payment Instructions:\n{instructions}\n\n"
-        f"Once your payment is confirmed, you can start messaging your mentor.",
-        reply_markup=keyboard
     )
 
-@dp.callback_query_handler(lambda c: c.data.startswith('message_mentor_'))
-async def message_mentor_start(callback_query: types.CallbackQuery):
+@dp.callback_query_handler(message_mentor_cb.filter())
+async def message_mentor_start(callback_query: types.CallbackQuery, callback_data: Dict[str, str]):
     await bot.answer_callback_query(callback_query.id)
     
-    mentor_id = int(callback_query.data.split('_')[2])
+    mentor_id = int(callback_data["mentor_id"])
     
     # Verify subscription
     subscription = await subscriptions_collection.find_one({
@@ -952,7 +1343,7 @@ async def message_mentor_start(callback_query: types.CallbackQuery):
     })
     
     if not subscription:
-        await bot.send_message(
+        await safe_send_message(
             callback_query.from_user.id,
             "You don't have an active subscription with this mentor. "
             "Please subscribe first to send messages."
@@ -966,7 +1357,7 @@ async def message_mentor_start(callback_query: types.CallbackQuery):
     async with state.proxy() as data:
         data['mentor_id'] = mentor_id
     
-    await bot.send_message(
+    await safe_send_message(
         callback_query.from_user.id,
         "What message would you like to send to your mentor? "
         "You can ask questions about Go strategy, game reviews, or schedule a session."
@@ -977,8 +1368,9 @@ async def send_message_to_mentor(message: types.Message, state: FSMContext):
     async with state.proxy() as data:
         mentor_id = data['mentor_id']
     
-    user = await users_collection.find_one({"telegram_id": message.from_user.id})
-    mentor = await users_collection.find_one({"telegram_id": mentor_id})
+    users = await get_users(message.from_user.id, mentor_id)
+    user = users.get(message.from_user.id)
+    mentor = users.get(mentor_id)
     
     if not user or not mentor:
         await message.answer("Error processing your message. Please try again later.")
@@ -986,21 +1378,20 @@ async def send_message_to_mentor(message: types.Message, state: FSMContext):
         return
     
     # Send message to mentor
-    try:
-        await bot.send_message(
-            mentor_id,
-            f"📨 *New message from your mentee {user['name']}*:\n\n"
-            f"{message.text}\n\n"
-            f"Reply with /reply_{message.from_user.id} followed by your message.",
-            parse_mode=ParseMode.MARKDOWN
-        )
-        
+    delivered = await safe_send_message(
+        mentor_id,
+        f"📨 *New message from your mentee {user['name']}*:\n\n"
+        f"{message.text}\n\n"
+        f"Reply with /reply_{message.from_user.id} followed by your message.",
+        parse_mode=ParseMode.MARKDOWN
+    )
+    
+    if delivered:
         await message.answer(
             "Your message has been sent to your mentor. "
             "You will receive their reply directly in this chat."
         )
-    except Exception as e:
-        logging.error(f"Failed to send message to mentor: {e}")
+    else:
         await message.answer(
             "Failed to send your message. The mentor may have blocked the bot. "
             "Please contact club administrators for assistance."
@@ -1040,42 +1431,51 @@ async def reply_to_mentee(message: types.Message):
         )
         return
     
-    # Get mentor info
-    mentor = await users_collection.find_one({"telegram_id": message.from_user.id})
+    # The subscription already records the mentor's name
+    mentor_name = subscription.get("mentor_name", "")
     
     # Send reply to mentee
-    try:
-        await bot.send_message(
-            mentee_id,
-            f"📨 *Reply from your mentor {mentor['name']}*:\n\n"
-            f"{reply_text}",
-            parse_mode=ParseMode.MARKDOWN
-        )
-        
+    delivered = await safe_send_message(
+        mentee_id,
+        f"📨 *Reply from your mentor {mentor_name}*:\n\n"
+        f"{reply_text}",
+        parse_mode=ParseMode.MARKDOWN
+    )
+    
+    if delivered:
         await message.answer("Your reply has been sent to your mentee.")
-    except Exception as e:
-        logging.error(f"Failed to send reply to mentee: {e}")
+    else:
         await message.answer(
             "Failed to send your reply. The mentee may have blocked the bot. "
             "Please contact club administrators for assistance."
         )
 
-@dp.callback_query_handler(lambda c: c.data.startswith('become_mentor'))
+@dp.callback_query_handler(Text(equals='skip_mentor'))
+async def skip_mentor(callback_query: types.CallbackQuery):
+    await bot.answer_callback_query(callback_query.id)
+    await safe_send_message(
+        callback_query.from_user.id,
+        "No problem! You can become a mentor later from your profile.",
+        reply_markup=MAIN_MENU_KEYBOARD
+    )
+
+# Updating a mentor profile runs the same form as creating one
+@dp.callback_query_handler(Text(equals=['become_mentor', 'update_mentor']))
 async def become_mentor_start(callback_query: types.CallbackQuery):
     await bot.answer_callback_query(callback_query.id)
     
     # Verify user rank
-    user = await users_collection.find_one({"telegram_id": callback_query.from_user.id})
+    user = await get_user(callback_query.from_user.id)
     
     if not user:
-        await bot.send_message(
+        await safe_send_message(
             callback_query.from_user.id,
             "You need to register first. Use /register to get started."
         )
         return
     
     if not is_rank_sufficient_for_mentor(user.get('rank', '30k')):
-        await bot.send_message(
+        await safe_send_message(
             callback_query.from_user.id,
             f"Your current rank ({user.get('rank', '30k')}) is not sufficient to become a mentor. "
             f"The minimum required rank is {MENTOR_MINIMUM_RANK}."
@@ -1084,7 +1484,7 @@ async def become_mentor_start(callback_query: types.CallbackQuery):
     
     await MentorForm.description.set()
     
-    await bot.send_message(
+    await safe_send_message(
         callback_query.from_user.id,
         "Let's set up your mentor profile. "
         "First, please provide a brief description of your teaching approach, "
@@ -1123,14 +1523,18 @@ async def process_mentor_price(message: types.Message, state: FSMContext):
         # Update user as mentor
         await users_collection.update_one(
             {"telegram_id": message.from_user.id},
-            {"$set": {
-                "is_mentor": True,
-                "mentor_description": data['description'],
-                "mentor_availability": data['availability'],
-                "mentor_price": price,
-                "mentor_since": datetime.now()
-            }}
+            {
+                "$set": {
+                    "is_mentor": True,
+                    "mentor_description": data['description'],
+                    "mentor_availability": data['availability'],
+                    "mentor_price": price
+                },
+                # Keep the original date when an existing profile is updated
+                "$min": {"mentor_since": datetime.now()}
+            }
         )
+        invalidate_user_cache(message.from_user.id)
     
     await state.finish()
     
@@ -1141,38 +1545,26 @@ async def process_mentor_price(message: types.Message, state: FSMContext):
     )
 
 @dp.message_handler(Text(equals="Admin Panel", ignore_case=True))
-async def admin_panel(message: types.Message):
+async def admin_panel(message: types.Message, user: Optional[Dict] = None):
     # Verify user is admin
-    user = await users_collection.find_one({"telegram_id": message.from_user.id})
-    
     if not user or not user.get("is_admin", False):
         await message.answer("You don't have permission to access the admin panel.")
         return
     
-    keyboard = InlineKeyboardMarkup(row_width=1)
-    keyboard.add(
-        InlineKeyboardButton("Create Event", callback_data="create_event"),
-        InlineKeyboardButton("Broadcast Announcement", callback_data="broadcast"),
-        InlineKeyboardButton("Manage Users", callback_data="manage_users"),
-        InlineKeyboardButton("View Subscriptions", callback_data="view_subscriptions")
-    )
-    
     await message.answer(
         "👑 *Admin Panel* 👑\n\n"
         "Select an action:",
-        reply_markup=keyboard,
+        reply_markup=ADMIN_PANEL_KEYBOARD,
         parse_mode=ParseMode.MARKDOWN
     )
 
-@dp.callback_query_handler(lambda c: c.data == "create_event")
-async def create_event_start(callback_query: types.CallbackQuery):
+@dp.callback_query_handler(Text(equals="create_event"))
+async def create_event_start(callback_query: types.CallbackQuery, user: Optional[Dict] = None):
     await bot.answer_callback_query(callback_query.id)
     
     # Verify user is admin
-    user = await users_collection.find_one({"telegram_id": callback_query.from_user.id})
-    
     if not user or not user.get("is_admin", False):
-        await bot.send_message(
+        await safe_send_message(
             callback_query.from_user.id,
             "You don't have permission to create events."
         )
@@ -1180,7 +1572,7 @@ async def create_event_start(callback_query: types.CallbackQuery):
     
     await EventForm.title.set()
     
-    await bot.send_message(
+    await safe_send_message(
         callback_query.from_user.id,
         "Let's create a new event. What's the title of the event?"
     )
@@ -1250,9 +1642,8 @@ async def process_event_location(message: types.Message, state: FSMContext):
     async with state.proxy() as data:
         data['location'] = location
         
-        # Create event document
+        # Create event document; Mongo assigns the ObjectId _id
         event_data = {
-            "_id": f"event_{int(datetime.now().timestamp())}",
             "title": data['title'],
             "description": data['description'],
             "date": data['date'],
@@ -1270,147 +1661,116 @@ async def process_event_location(message: types.Message, state: FSMContext):
     await state.finish()
     
     # Notify club members about the new event
-    all_users = await users_collection.find().to_list(length=1000)
-    
-    event_notification = (
-        f"📅 *New Event: {data['title']}* 📅\n\n"
-        f"📆 *Date*: {data['date']}\n"
-        f"🕒 *Time*: {data['time']}\n"
-        f"📍 *Location*: {location}\n\n"
-        f"Check the Events section for more details!"
+    event_notification = EVENT_NOTIFICATION_TEMPLATE.format(
+        title=data['title'], date=data['date'], time=data['time'], location=location
     )
     
-    for user in all_users:
-        try:
-            await bot.send_message(
-                user['telegram_id'],
-                event_notification,
-                parse_mode=ParseMode.MARKDOWN
-            )
-        except Exception as e:
-            logging.error(f"Failed to notify user {user['telegram_id']}: {e}")
+    # Fan out in the background so the admin is not kept waiting
+    run_in_background(broadcast_to_users(
+        event_notification, EVENT_NOTIFICATION_QUERY, parse_mode=ParseMode.MARKDOWN
+    ))
     
     await message.answer(
-        "Event created successfully! All club members have been notified."
+        "Event created successfully! All club members are being notified."
     )
 
-@dp.callback_query_handler(lambda c: c.data == "broadcast")
-async def broadcast_start(callback_query: types.CallbackQuery):
+@dp.callback_query_handler(Text(equals="broadcast"))
+async def broadcast_start(callback_query: types.CallbackQuery, user: Optional[Dict] = None):
     await bot.answer_callback_query(callback_query.id)
     
     # Verify user is admin
-    user = await users_collection.find_one({"telegram_id": callback_query.from_user.id})
-    
     if not user or not user.get("is_admin", False):
-        await bot.send_message(
+        await safe_send_message(
             callback_query.from_user.id,
             "You don't have permission to broadcast announcements."
         )
         return
     
-    # Create a state for broadcast message
-    class BroadcastForm(StatesGroup):
-        message = State()
-    
     await BroadcastForm.message.set()
     
-    await bot.send_message(
+    await safe_send_message(
         callback_query.from_user.id,
         "Please enter the announcement message you want to broadcast to all club members. "
         "You can use Markdown formatting."
     )
+
+@dp.message_handler(state=BroadcastForm.message)
+async def process_broadcast_message(message: types.Message, state: FSMContext):
+    broadcast_message = message.text
     
-    @dp.message_handler(state=BroadcastForm.message)
-    async def process_broadcast_message(message: types.Message, state: FSMContext):
-        broadcast_message = message.text
-        
-        # Get all users
-        all_users = await users_collection.find().to_list(length=1000)
-        
-        # Send confirmation
-        await message.answer(
-            f"You are about to broadcast the following message to {len(all_users)} members:\n\n"
-            f"{broadcast_message}\n\n"
-            f"Are you sure? (yes/no)"
-        )
-        
-        # Create a state for confirmation
-        class ConfirmBroadcast(StatesGroup):
-            confirm = State()
-        
-        await ConfirmBroadcast.confirm.set()
-        
-        async with state.proxy() as data:
-            data['message'] = broadcast_message
-        
-        @dp.message_handler(state=ConfirmBroadcast.confirm)
-        async def confirm_broadcast(message: types.Message, state: FSMContext):
-            if message.text.lower() != "yes":
-                await message.answer("Broadcast cancelled.")
-                await state.finish()
-                return
-            
-            async with state.proxy() as data:
-                broadcast_message = data['message']
-            
-            # Get all users
-            all_users = await users_collection.find().to_list(length=1000)
-            
-            # Send the broadcast
-            success_count = 0
-            fail_count = 0
-            
-            await message.answer("Broadcasting message... Please wait.")
-            
-            for user in all_users:
-                try:
-                    await bot.send_message(
-                        user['telegram_id'],
-                        f"📢 *ANNOUNCEMENT* 📢\n\n{broadcast_message}",
-                        parse_mode=ParseMode.MARKDOWN
-                    )
-                    success_count += 1
-                except Exception as e:
-                    logging.error(f"Failed to send broadcast to user {user['telegram_id']}: {e}")
-                    fail_count += 1
-            
-            await message.answer(
-                f"Broadcast complete!\n\n"
-                f"✅ Successfully sent to {success_count} members\n"
-                f"❌ Failed to send to {fail_count} members"
-            )
-            
-            await state.finish()
+    # Count recipients
+    member_count = await users_collection.count_documents({})
+    
+    # Send confirmation
+    await message.answer(
+        f"You are about to broadcast the following message to {member_count} members:\n\n"
+        f"{broadcast_message}\n\n"
+        f"Are you sure? (yes/no)"
+    )
+    
+    async with state.proxy() as data:
+        data['message'] = broadcast_message
+    
+    await BroadcastForm.next()
+
+@dp.message_handler(state=BroadcastForm.confirm)
+async def confirm_broadcast(message: types.Message, state: FSMContext):
+    if message.text.lower() != "yes":
+        await message.answer("Broadcast cancelled.")
+        await state.finish()
+        return
+    
+    async with state.proxy() as data:
+        broadcast_message = data['message']
+    
+    await message.answer("Broadcasting message... Please wait.")
+    
+    # Send the broadcast concurrently within Telegram's rate limits
+    announcement = ANNOUNCEMENT_TEMPLATE.format(message=broadcast_message)
+    success_count, fail_count = await broadcast_to_users(
+        announcement, parse_mode=ParseMode.MARKDOWN
+    )
+    
+    await message.answer(
+        f"Broadcast complete!\n\n"
+        f"✅ Successfully sent to {success_count} members\n"
+        f"❌ Failed to send to {fail_count} members"
+    )
+    
+    await state.finish()
 
-@dp.callback_query_handler(lambda c: c.data == "find_mentors")
+@dp.callback_query_handler(Text(equals="find_mentors"))
 async def find_mentors_callback(callback_query: types.CallbackQuery):
     await bot.answer_callback_query(callback_query.id)
     
     # Get available mentors
-    mentors = await users_collection.find(
-        {"is_mentor": True}
-    ).sort("rank", -1).to_list(length=50)
+    cursor = users_collection.find(
+        {"is_mentor": True},
+        PLAYER_PROJECTION
+    ).sort("rank_index", -1).limit(50)
     
-    if not mentors:
-        await bot.send_message(
-            callback_query.from_user.id,
-            "There are no mentors available at the moment. "
-            "Check back later or ask club admins about mentorship opportunities."
-        )
-        return
-    
-    # Create mentor selection keyboard
+    # Build the mentor selection keyboard as results stream in
     keyboard = InlineKeyboardMarkup(row_width=1)
+    mentor_count = 0
     
-    for mentor in mentors:
+    async for mentor in cursor:
+        mentor_count += 1
         keyboard.add(
             InlineKeyboardButton(
                 f"{mentor['name']} ({mentor['rank']})",
-                callback_data=f"view_mentor_{mentor['telegram_id']}"
+                callback_data=view_mentor_cb.new(mentor_id=mentor['telegram_id'])
             )
         )
     
-    await bot.send_message(
+    if not mentor_count:
+        await safe_send_message(
+            callback_query.from_user.id,
+            "There are no mentors available at the moment. "
+            "Check back later or ask club admins about mentorship opportunities."
+        )
+        return
+    
+    await safe_send_message(
         callback_query.from_user.id,
         "👨‍🏫 *Available Mentors* 👨‍🏫\n\n"
         "Select a mentor to view their profile:",
@@ -1418,55 +1778,56 @@ async def find_mentors_callback(callback_query: types.CallbackQuery):
         parse_mode=ParseMode.MARKDOWN
     )
 
-@dp.callback_query_handler(lambda c: c.data == "show_events")
-async def show_events_callback(callback_query: types.CallbackQuery):
+@dp.callback_query_handler(Text(equals="show_events"))
+async def show_events_callback(callback_query: types.CallbackQuery, user: Optional[Dict] = None):
     await bot.answer_callback_query(callback_query.id)
     
     # Get upcoming events
     current_date = datetime.now()
-    upcoming_events = await events_collection.find(
-        {"date_time": {"$gte": current_date}}
-    ).sort("date_time", 1).to_list(length=10)
+    cursor = events_collection.find(
+        {"date_time": {"$gte": current_date}},
+        EVENT_LIST_PROJECTION
+    ).sort("date_time", 1).limit(10)
+    
+    # Build the events list as results stream in from the cursor
+    events_keyboard = InlineKeyboardMarkup(row_width=1)
+    event_count = 0
+    
+    async for event in cursor:
+        event_count += 1
+        event_date = event.get("date", "TBD")
+        event_title = event.get("title", "Event")
+        events_keyboard.add(
+            InlineKeyboardButton(
+                f"{event_date} - {event_title}",
+                callback_data=event_cb.new(event_id=event['_id'])
+            )
+        )
     
-    if not upcoming_events:
+    if not event_count:
         keyboard = InlineKeyboardMarkup()
         
         # Add button to create event if user is admin
-        user = await users_collection.find_one({"telegram_id": callback_query.from_user.id})
         if user and user.get("is_admin", False):
             keyboard.add(InlineKeyboardButton("Create Event", callback_data="create_event"))
-            await bot.send_message(
+            await safe_send_message(
                 callback_query.from_user.id,
                 "There are no upcoming events. As an admin, you can create one!",
                 reply_markup=keyboard
             )
         else:
-            await bot.send_message(
+            await safe_send_message(
                 callback_query.from_user.id,
                 "There are no upcoming events currently. Check back later!"
             )
         
         return
     
-    # Create events list with navigation
-    events_keyboard = InlineKeyboardMarkup(row_width=1)
-    
-    for event in upcoming_events:
-        event_date = event.get("date", "TBD")
-        event_title = event.get("title", "Event")
-        events_keyboard.add(
-            InlineKeyboardButton(
-                f"{event_date} - {event_title}",
-                callback_data=f"event_{event['_id']}"
-            )
-        )
-    
     # Add button to create event if user is admin
-    user = await users_collection.find_one({"telegram_id": callback_query.from_user.id})
     if user and user.get("is_admin", False):
         events_keyboard.add(InlineKeyboardButton("Create Event", callback_data="create_event"))
     
-    await bot.send_message(
+    await safe_send_message(
         callback_query.from_user.id,
         "📅 *Upcoming Events* 📅\n\n"
         "Select an event to view details:",
@@ -1474,62 +1835,40 @@ async def show_events_callback(callback_query: types.CallbackQuery):
         parse_mode=ParseMode.MARKDOWN
     )
 
-@dp.callback_query_handler(lambda c: c.data.startswith('rsvp_'))
-async def rsvp_event(callback_query: types.CallbackQuery):
+@dp.callback_query_handler(rsvp_cb.filter())
+async def rsvp_event(callback_query: types.CallbackQuery, callback_data: Dict[str, str]):
     await bot.answer_callback_query(callback_query.id)
     
-    event_id = callback_query.data.split('_')[1]
+    event_id = parse_event_id(callback_data["event_id"])
     user_id = callback_query.from_user.id
     
-    # Check if event exists
-    event = await events_collection.find_one({"_id": event_id})
-    if not event:
-        await bot.send_message(
+    user = await get_user(user_id)
+    if not user:
+        await safe_send_message(
             user_id,
-            "The event no longer exists. It may have been cancelled."
+            "You need to register first. Use /register to get started."
         )
         return
     
-    # Check if user is already RSVP'd
-    participants = event.get("participants", [])
-    user_ids = [p["user_id"] for p in participants]
+    participant_info = {
+        "user_id": user_id,
+        "name": user["name"],
+        **rank_fields(user["rank"]),
+        "rsvp_time": datetime.now()
+    }
     
-    if user_id in user_ids:
-        # Remove user from participants
-        await events_collection.update_one(
-            {"_id": event_id},
-            {"$pull": {"participants": {"user_id": user_id}}}
-        )
-        
-        await bot.send_message(
-            user_id,
-            f"You have cancelled your RSVP for the event '{event['title']}'."
-        )
-    else:
-        # Get user info
-        user = await users_collection.find_one({"telegram_id": user_id})
-        if not user:
-            await bot.send_message(
-                user_id,
-                "You need to register first. Use /register to get started."
-            )
-            return
-        
-        # Add user to participants
-        participant_info = {
-            "user_id": user_id,
-            "name": user["name"],
-            "rank": user["rank"],
-            "rsvp_time": datetime.now()
-        }
-        
-        await events_collection.update_one(
-            {"_id": event_id},
-            {"$push": {"participants": participant_info}}
-        )
-        
+    # Add the user only if they are not already attending; the server applies
+    # the check and the push atomically, so double clicks cannot duplicate an RSVP
+    event = await events_collection.find_one_and_update(
+        {"_id": event_id, "participants.user_id": {"$ne": user_id}},
+        {"$push": {"participants": participant_info}},
+        projection=EVENT_SUMMARY_PROJECTION,
+        return_document=ReturnDocument.AFTER
+    )
+    
+    if event:
         # Send confirmation
-        await bot.send_message(
+        await safe_send_message(
             user_id,
             f"You have successfully RSVP'd for the event '{event['title']}'.\n"
             f"Date: {event['date']}\n"
@@ -1537,30 +1876,47 @@ async def rsvp_event(callback_query: types.CallbackQuery):
             f"Location: {event['location']}"
         )
         
-        # Notify event creator
+        # Notify event creator in the background
         creator_id = event.get("created_by")
         if creator_id:
-            try:
-                await bot.send_message(
-                    creator_id,
-                    f"New RSVP for '{event['title']}'!\n"
-                    f"{user['name']} ({user['rank']}) will be attending."
-                )
-            except Exception as e:
-                logging.error(f"Failed to notify event creator: {e}")
+            send_in_background(
+                creator_id,
+                f"New RSVP for '{event['title']}'!\n"
+                f"{user['name']} ({user['rank']}) will be attending."
+            )
+        return
+    
+    # Already attending: remove user from participants
+    event = await events_collection.find_one_and_update(
+        {"_id": event_id, "participants.user_id": user_id},
+        {"$pull": {"participants": {"user_id": user_id}}},
+        projection=EVENT_SUMMARY_PROJECTION
+    )
+    
+    if not event:
+        await safe_send_message(
+            user_id,
+            "The event no longer exists. It may have been cancelled."
+        )
+        return
+    
+    await safe_send_message(
+        user_id,
+        f"You have cancelled your RSVP for the event '{event['title']}'."
+    )
 
-@dp.callback_query_handler(lambda c: c.data.startswith('cancel_sub_'))
-async def cancel_subscription(callback_query: types.CallbackQuery):
+@dp.callback_query_handler(cancel_sub_cb.filter())
+async def cancel_subscription(callback_query: types.CallbackQuery, callback_data: Dict[str, str]):
     await bot.answer_callback_query(callback_query.id)
     
-    subscription_id = callback_query.data.split('_')[2]
+    subscription_id = callback_data["subscription_id"]
     user_id = callback_query.from_user.id
     
-    # Get subscription details
-    subscription = await subscriptions_collection.find_one({"_id": ObjectId(subscription_id)})
+    # Get subscription details; ids are the strings built in process_payment
+    subscription = await subscriptions_collection.find_one({"_id": subscription_id})
     
     if not subscription:
-        await bot.send_message(
+        await safe_send_message(
             user_id,
             "Subscription not found. It may have already been cancelled."
         )
@@ -1568,53 +1924,39 @@ async def cancel_subscription(callback_query: types.CallbackQuery):
     
     # Verify the user is the mentee
     if subscription["mentee_id"] != user_id:
-        await bot.send_message(
+        await safe_send_message(
             user_id,
             "You don't have permission to cancel this subscription."
         )
         return
     
     # Mark subscription as cancelled
-    try:
-        await subscriptions_collection.update_one(
-            {"_id": ObjectId(subscription_id)},
-            {"$set": {
-                "status": "cancelled",
-                "cancelled_at": datetime.now()
-            }}
-        )
-    except:
-    # In case _id is stored as a string
-        await subscriptions_collection.update_one(
-            {"_id": subscription_id},
-            {"$set": {
-                "status": "cancelled",
-                "cancelled_at": datetime.now()
-            }}
-        )
+    now = datetime.now()
+    await subscriptions_collection.update_one(
+        {"_id": subscription_id},
+        {"$set": {
+            "status": "cancelled",
+            "cancelled_at": now
+        }}
+    )
     
-    # Get mentor details
+    # The subscription already records both names, so no user lookups are needed
     mentor_id = subscription["mentor_id"]
-    mentor = await users_collection.find_one({"user_id": mentor_id})
-    mentee = await users_collection.find_one({"user_id": user_id})
+    start_date = subscription.get("start_date")
     
     # Format mentor's notification
     mentor_message = (
         f"❌ Subscription Cancelled\n\n"
-        f"Mentee: {mentee.get('first_name', 'Unknown')}\n"
-        f"Duration: {subscription.get('duration', 'Unknown')}\n"
-        f"Started: {subscription.get('created_at').strftime('%Y-%m-%d')}\n"
-        f"Cancelled: {datetime.now().strftime('%Y-%m-%d')}"
+        f"Mentee: {subscription.get('mentee_name', 'Unknown')}\n"
+        f"Started: {start_date.strftime('%Y-%m-%d') if start_date else 'Unknown'}\n"
+        f"Cancelled: {now.strftime('%Y-%m-%d')}"
     )
     
     # Notify mentor
-    try:
-        await bot.send_message(mentor_id, mentor_message)
-    except Exception as e:
-        logging.error(f"Failed to notify mentor {mentor_id}: {e}")
+    await safe_send_message(mentor_id, mentor_message)
     
     # Confirm cancellation to mentee
-    await bot.send_message(
+    await safe_send_message(
         user_id,
         "Your subscription has been cancelled successfully. "
         "Thank you for using our mentorship service."
@@ -0,0 +1,14 @@
+import os
+import re
+from typing import Tuple
+
+from dotenv import load_dotenv
+
+# Load environment variables
+load_dotenv()
+
+# Admin Telegram chat IDs, parsed once at import; blanks and stray
+# separators in the comma-separated env var are ignored
+ADMIN_CHAT_IDS: Tuple[int, ...] = tuple(
+    map(int, re.findall(r"-?\d+", os.getenv("ADMIN_CHAT_IDS", "")))
+)
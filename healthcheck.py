@@ -1,9 +1,13 @@
+import atexit
 import logging
 import os
+import queue
+import random
 import time
 import json
 import asyncio
 from datetime import datetime, timedelta
+from logging.handlers import QueueHandler, QueueListener
 from typing import Dict, List, Optional, Tuple
 
 import aiohttp
@@ -17,26 +21,58 @@ from aiogram.utils.exceptions import (
 )
 from dotenv import load_dotenv
 
+from bot import SendRateLimiter, bot as club_bot
+from config import ADMIN_CHAT_IDS
+
 # Load environment variables
 load_dotenv()
 API_TOKEN = os.getenv("TELEGRAM_BOT_TOKEN")
 MONGO_URI = os.getenv("MONGO_URI")
 OGS_API_URL = "https://online-go.com/api/v1"
-ADMIN_CHAT_IDS = os.getenv("ADMIN_CHAT_IDS", "").split(",")
 
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler("healthcheck.log"),
-        logging.StreamHandler()
-    ]
-)
+# Scheduler polling: back off from 1 minute to 1 hour while healthy
+HEALTH_MIN_INTERVAL = 60
+HEALTH_MAX_INTERVAL = 60 * 60
+HEALTH_BACKOFF_BASE = 1.3
+COMPREHENSIVE_INTERVAL = 24 * 60 * 60
+
+PROBE_TIMEOUT = 5  # Seconds before an external probe counts as failed
+INACTIVE_USER_PROJECTION = {"telegram_id": 1, "name": 1, "last_activity": 1}
+EVENT_CHECK_PROJECTION = {"title": 1, "date_time": 1, "location": 1, "created_by": 1}
+PROBE_CONCURRENCY = 5  # Parallel get_chat probes per communications check
+HEALTH_LOG_BATCH_SIZE = 20  # Buffered health log entries per insert_many
+BLOCKED_RECHECK_INTERVAL = timedelta(days=7)  # How often known-dead chats are re-probed
+ALERT_RATE_PER_SECOND = 25  # Stay below Telegram's 30 msg/s global bot limit
+
+# Configure logging; records are queued and written by a background thread
+# so the checks never block the event loop on disk I/O
+log_formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+log_handlers = [
+    logging.FileHandler("healthcheck.log"),
+    logging.StreamHandler()
+]
+for handler in log_handlers:
+    handler.setFormatter(log_formatter)
+
+log_queue = queue.Queue(-1)
+log_listener = QueueListener(log_queue, *log_handlers)
+log_listener.start()
+atexit.register(log_listener.stop)
+
 logger = logging.getLogger('go_club_healthcheck')
+logger.setLevel(logging.INFO)
+logger.handlers = [QueueHandler(log_queue)]
+logger.propagate = False
 
 # Initialize MongoDB connection
-client = motor.motor_asyncio.AsyncIOMotorClient(MONGO_URI)
+client = motor.motor_asyncio.AsyncIOMotorClient(
+    MONGO_URI,
+    serverSelectionTimeoutMS=3000,
+    connectTimeoutMS=3000,
+    socketTimeoutMS=5000,
+    appname="go_club_healthcheck",
+    maxPoolSize=20
+)
 db = client.go_club_db
 users_collection = db.users
 events_collection = db.events
@@ -44,11 +80,37 @@ matches_collection = db.matches
 subscriptions_collection = db.subscriptions
 health_logs_collection = db.health_logs
 
+async def _timed(coro, seconds: float = PROBE_TIMEOUT):
+    """Await a probe, raising asyncio.TimeoutError if it takes too long."""
+    try:
+        return await asyncio.wait_for(coro, timeout=seconds)
+    except asyncio.TimeoutError:
+        raise asyncio.TimeoutError(f"timed out after {seconds}s") from None
+
+def _jittered(seconds: float) -> float:
+    """Spread a delay by ±10% so separate instances don't poll in lockstep."""
+    return seconds * (0.9 + 0.2 * random.random())
+
+async def _update_blocked_flags(dead_ids: List[int], reachable_ids: List[int], now: datetime):
+    """Flag dead chats so later samples skip them; unflag ones reachable again."""
+    if dead_ids:
+        await users_collection.update_many(
+            {"telegram_id": {"$in": dead_ids}},
+            {"$set": {"bot_blocked": True, "last_blocked_check": now}}
+        )
+    
+    if reachable_ids:
+        await users_collection.update_many(
+            {"telegram_id": {"$in": reachable_ids}},
+            {"$set": {"bot_blocked": False}, "$unset": {"last_blocked_check": ""}}
+        )
+
 class HealthCheck:
     """Monitors and checks the health of the Go Club bot system."""
     
-    def __init__(self):
-        self.bot = Bot(token=API_TOKEN)
+    def __init__(self, bot: Optional[Bot] = None):
+        # Share the bot's client session unless a bot is injected
+        self.bot = bot or club_bot
         self.start_time = datetime.now()
         self.api_call_counts = {
             "telegram": 0,
@@ -59,21 +121,52 @@ class HealthCheck:
             "ogs": 0
         }
         self.inactive_users = set()
+        self._http: Optional[aiohttp.ClientSession] = None
+        self._bot_me = None
+        self._tg_limiter = SendRateLimiter(ALERT_RATE_PER_SECOND)
+        self._log_buf: List[Dict] = []
+        self._log_buf_lock = asyncio.Lock()
+    
+    async def _get_session(self) -> aiohttp.ClientSession:
+        """Return the shared HTTP session, creating it on first use."""
+        if self._http is None or self._http.closed:
+            self._http = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=20, keepalive_timeout=60),
+                timeout=aiohttp.ClientTimeout(total=10)
+            )
+        return self._http
+    
+    async def close(self):
+        """Flush buffered health logs and close the shared HTTP session."""
+        await self.flush_health_logs()
+        if self._http is not None and not self._http.closed:
+            await self._http.close()
+        self._http = None
         
     async def log_health_check(self, check_type: str, details: Dict, status: str = "ok"):
-        """Log a health check to the database."""
-        log_entry = {
+        """Buffer a health check log entry, writing the buffer once it fills up."""
+        self._log_buf.append({
             "type": check_type,
             "details": details,
             "status": status,
             "timestamp": datetime.now()
-        }
+        })
+        logger.debug(f"Health check logged: {check_type} - {status}")
         
-        try:
-            await health_logs_collection.insert_one(log_entry)
-            logger.debug(f"Health check logged: {check_type} - {status}")
-        except Exception as e:
-            logger.error(f"Failed to log health check: {e}")
+        if len(self._log_buf) >= HEALTH_LOG_BATCH_SIZE:
+            await self.flush_health_logs()
+    
+    async def flush_health_logs(self):
+        """Write buffered health check log entries to the database."""
+        async with self._log_buf_lock:
+            if not self._log_buf:
+                return
+            entries, self._log_buf = self._log_buf, []
+            
+            try:
+                await health_logs_collection.insert_many(entries, ordered=False)
+            except Exception as e:
+                logger.error(f"Failed to log health checks: {e}")
     
     async def send_admin_alert(self, message: str, level: str = "info"):
         """Send alert messages to admin chat IDs."""
@@ -85,32 +178,40 @@ class HealthCheck:
         }
         
         emoji = emoji_map.get(level.lower(), "ℹ️")
-        formatted_message = f"{emoji} *Health Alert*\n\n{message}"
+        # Sent as plain text so names and error strings never need escaping
+        formatted_message = f"{emoji} HEALTH ALERT\n\n{message}"
         
-        for admin_id in ADMIN_CHAT_IDS:
-            if admin_id:
-                try:
-                    await self.bot.send_message(
-                        admin_id, 
-                        formatted_message, 
-                        parse_mode="Markdown"
-                    )
-                    self.api_call_counts["telegram"] += 1
-                except Exception as e:
-                    self.api_errors["telegram"] += 1
-                    logger.error(f"Failed to send alert to admin {admin_id}: {e}")
+        async def _send(admin_id):
+            async with self._tg_limiter:
+                await self.bot.send_message(admin_id, formatted_message)
+        
+        results = await asyncio.gather(
+            *[_send(admin_id) for admin_id in ADMIN_CHAT_IDS],
+            return_exceptions=True
+        )
+        
+        for admin_id, result in zip(ADMIN_CHAT_IDS, results):
+            if isinstance(result, BaseException):
+                self.api_errors["telegram"] += 1
+                logger.error(f"Failed to send alert to admin {admin_id}: {result}")
+            else:
+                self.api_call_counts["telegram"] += 1
     
     async def check_telegram_api(self):
         """Check if the Telegram Bot API is working properly."""
         start_time = time.time()
         try:
-            # Get bot info as a simple API check
-            me = await self.bot.get_me()
+            # The bot profile never changes, so fetch it once and afterwards
+            # use the lighter webhook info call as the reachability probe
+            if self._bot_me is None:
+                self._bot_me = await _timed(self.bot.get_me())
+            else:
+                await _timed(self.bot.get_webhook_info())
             response_time = time.time() - start_time
             
             details = {
-                "bot_username": me.username,
-                "bot_id": me.id,
+                "bot_username": self._bot_me.username,
+                "bot_id": self._bot_me.id,
                 "response_time_ms": int(response_time * 1000)
             }
             
@@ -119,7 +220,7 @@ class HealthCheck:
             self.api_call_counts["telegram"] += 1
             return True
             
-        except TelegramAPIError as e:
+        except (TelegramAPIError, asyncio.TimeoutError) as e:
             response_time = time.time() - start_time
             error_details = {
                 "error": str(e),
@@ -142,7 +243,7 @@ class HealthCheck:
         start_time = time.time()
         try:
             # Ping the database
-            result = await db.command("ping")
+            result = await _timed(db.command("ping"))
             response_time = time.time() - start_time
             
             details = {
@@ -175,24 +276,24 @@ class HealthCheck:
         """Check if the Online Go Server API is working properly."""
         start_time = time.time()
         try:
-            async with aiohttp.ClientSession() as session:
-                async with session.get(f"{OGS_API_URL}/ui/config") as resp:
-                    response_time = time.time() - start_time
-                    
-                    if resp.status != 200:
-                        raise Exception(f"API returned status code {resp.status}")
-                    
-                    data = await resp.json()
-                    
-                    details = {
-                        "response_time_ms": int(response_time * 1000),
-                        "status_code": resp.status
-                    }
-                    
-                    await self.log_health_check("ogs_api", details)
-                    logger.info(f"OGS API check: OK ({details['response_time_ms']}ms)")
-                    self.api_call_counts["ogs"] += 1
-                    return True
+            session = await self._get_session()
+            async with await _timed(session.get(f"{OGS_API_URL}/ui/config")) as resp:
+                response_time = time.time() - start_time
+                
+                if resp.status != 200:
+                    raise Exception(f"API returned status code {resp.status}")
+                
+                data = await resp.json()
+                
+                details = {
+                    "response_time_ms": int(response_time * 1000),
+                    "status_code": resp.status
+                }
+                
+                await self.log_health_check("ogs_api", details)
+                logger.info(f"OGS API check: OK ({details['response_time_ms']}ms)")
+                self.api_call_counts["ogs"] += 1
+                return True
                     
         except Exception as e:
             response_time = time.time() - start_time
@@ -216,58 +317,49 @@ class HealthCheck:
     async def check_inactive_users(self, days: int = 30):
         """Check for users who haven't interacted with the bot in a while."""
         try:
-            cutoff_date = datetime.now() - timedelta(days=days)
-            
-            # Find users who haven't logged in recently
-            inactive_pipeline = [
-                {
-                    "$match": {
-                        "last_activity": {"$lt": cutoff_date}
-                    }
-                },
-                {
-                    "$project": {
-                        "telegram_id": 1,
-                        "name": 1,
-                        "days_inactive": {
-                            "$divide": [
-                                {"$subtract": [{"$toDate": datetime.now()}, "$last_activity"]},
-                                    1000 * 60 * 60 * 24  # Convert ms to days
-                                        ]
-                        }
-                    }
-                }
-            ]
-            
-            inactive_users = await users_collection.aggregate(inactive_pipeline).to_list(length=None)
+            now = datetime.now()
+            query = {"last_activity": {"$lt": now - timedelta(days=days)}}
+            
+            # Stream the matches oldest first, keeping only the ten shown to
+            # admins plus the id set instead of materializing every document
+            total = 0
+            oldest = []
+            inactive_ids = set()
+            async for doc in users_collection.find(
+                query, INACTIVE_USER_PROJECTION
+            ).sort("last_activity", 1):
+                total += 1
+                if len(oldest) < 10:
+                    oldest.append(doc)
+                inactive_ids.add(doc["telegram_id"])
             
             details = {
-                "inactive_user_count": len(inactive_users),
+                "inactive_user_count": total,
                 "days_threshold": days
             }
             
             await self.log_health_check("inactive_users", details)
             
-            if inactive_users:
+            if total:
                 inactive_list = "\n".join([
-                    f"• {user['name']} - {int(user['days_inactive'])} days"
-                    for user in inactive_users[:10]  # Show only first 10
+                    f"• {user['name']} - {(now - user['last_activity']).days} days"
+                    for user in oldest  # Show only first 10
                 ])
                 
-                if len(inactive_users) > 10:
-                    inactive_list += f"\n...and {len(inactive_users) - 10} more"
+                if total > 10:
+                    inactive_list += f"\n...and {total - 10} more"
                 
                 await self.send_admin_alert(
-                    f"Found {len(inactive_users)} users inactive for more than {days} days:\n\n"
+                    f"Found {total} users inactive for more than {days} days:\n\n"
                     f"{inactive_list}\n\n"
                     f"Consider sending a re-engagement message.",
                     level="info"
                 )
-                
-                # Update our set of inactive users
-                self.inactive_users = set(user["telegram_id"] for user in inactive_users)
             
-            return inactive_users
+            # Update our set of inactive users
+            self.inactive_users = inactive_ids
+            
+            return self.inactive_users
             
         except Exception as e:
             error_details = {"error": str(e)}
@@ -275,47 +367,94 @@ class HealthCheck:
             logger.error(f"Failed to check inactive users: {e}")
             return []
     
+    def _tally_probe_results(
+        self, results: List, previously_blocked: set
+    ) -> Tuple[Dict[str, int], List[int], List[int]]:
+        """Count probe outcomes and split out chats that died or came back."""
+        counts = {"success": 0, "blocked": 0, "deactivated": 0}
+        dead_ids = []
+        reachable_ids = []
+        for result in results:
+            if isinstance(result, BaseException):
+                logger.error(f"Communication probe raised: {result}")
+                continue
+            
+            status, user_id = result
+            if status is None:
+                continue
+            
+            if status in counts:
+                counts[status] += 1
+            if status in ("blocked", "deactivated"):
+                dead_ids.append(user_id)
+            elif status == "success" and user_id in previously_blocked:
+                reachable_ids.append(user_id)
+            
+            self.api_call_counts["telegram"] += 1
+        return counts, dead_ids, reachable_ids
+    
     async def verify_user_communications(self, sample_size: int = 5):
         """Test if the bot can communicate with a sample of users."""
         try:
-            # Get a sample of recent users
-            recent_users = await users_collection.find().sort(
-                "last_activity", -1
-            ).limit(sample_size).to_list(length=None)
+            # Get a sample of recent users, skipping chats already known to be
+            # dead unless they are due for an occasional re-check
+            now = datetime.now()
+            recent_users = await users_collection.find(
+                {"$or": [
+                    {"bot_blocked": {"$ne": True}},
+                    {"last_blocked_check": {"$lt": now - BLOCKED_RECHECK_INTERVAL}}
+                ]},
+                {"telegram_id": 1, "bot_blocked": 1}
+            ).sort("last_activity", -1).limit(sample_size).to_list(length=None)
             
             if not recent_users:
                 logger.warning("No users found to verify communications")
                 return True
             
-            blocked_count = 0
-            deactivated_count = 0
-            success_count = 0
+            # Bound concurrent probes to stay well under Telegram's rate limits
+            sem = asyncio.Semaphore(PROBE_CONCURRENCY)
             
-            for user in recent_users:
+            async def _probe(user):
                 user_id = user.get("telegram_id")
                 if not user_id:
-                    continue
-                
-                try:
-                    # Try to get chat info as a lightweight check
-                    await self.bot.get_chat(user_id)
-                    success_count += 1
-                    
-                except BotBlocked:
-                    blocked_count += 1
-                    logger.info(f"User {user_id} has blocked the bot")
-                    
-                except UserDeactivated:
-                    deactivated_count += 1
-                    logger.info(f"User {user_id} has deactivated their account")
-                    
-                except ChatNotFound:
-                    logger.info(f"Chat with user {user_id} not found")
-                    
-                except Exception as e:
-                    logger.error(f"Error checking communication with user {user_id}: {e}")
+                    return None, user_id
                 
-                self.api_call_counts["telegram"] += 1
+                async with sem:
+                    try:
+                        # Try to get chat info as a lightweight check
+                        await _timed(self.bot.get_chat(user_id))
+                        return "success", user_id
+                        
+                    except BotBlocked:
+                        logger.info(f"User {user_id} has blocked the bot")
+                        return "blocked", user_id
+                        
+                    except UserDeactivated:
+                        logger.info(f"User {user_id} has deactivated their account")
+                        return "deactivated", user_id
+                        
+                    except ChatNotFound:
+                        logger.info(f"Chat with user {user_id} not found")
+                        return "not_found", user_id
+                        
+                    except Exception as e:
+                        logger.error(f"Error checking communication with user {user_id}: {e}")
+                        return "error", user_id
+            
+            results = await asyncio.gather(
+                *[_probe(user) for user in recent_users],
+                return_exceptions=True
+            )
+            
+            previously_blocked = {
+                user.get("telegram_id") for user in recent_users if user.get("bot_blocked")
+            }
+            counts, dead_ids, reachable_ids = self._tally_probe_results(results, previously_blocked)
+            success_count = counts["success"]
+            blocked_count = counts["blocked"]
+            deactivated_count = counts["deactivated"]
+            
+            await _update_blocked_flags(dead_ids, reachable_ids, now)
             
             details = {
                 "sample_size": sample_size,
@@ -349,18 +488,17 @@ class HealthCheck:
         try:
             cutoff_date = datetime.now() + timedelta(days=days)
             
-            # Find upcoming events
-            upcoming_events = await events_collection.find({
-                "date_time": {"$gte": datetime.now(), "$lte": cutoff_date}
-            }).sort("date_time", 1).to_list(length=None)
-            
-            if not upcoming_events:
-                logger.info(f"No upcoming events in the next {days} days")
-                return True
-            
+            # Stream upcoming events, keeping only what the checks need
+            events_count = 0
             issues_found = []
+            creators: Dict[int, List] = {}
             
-            for event in upcoming_events:
+            async for event in events_collection.find(
+                {"date_time": {"$gte": datetime.now(), "$lte": cutoff_date}},
+                EVENT_CHECK_PROJECTION
+            ).sort("date_time", 1):
+                events_count += 1
+                
                 # Check for missing or invalid fields
                 if not event.get("title"):
                     issues_found.append(f"Event {event['_id']} has no title")
@@ -371,15 +509,31 @@ class HealthCheck:
                 if not event.get("location"):
                     issues_found.append(f"Event {event['_id']} has no location")
                 
-                # Check for valid creator
                 creator_id = event.get("created_by")
                 if creator_id:
-                    creator = await users_collection.find_one({"telegram_id": creator_id})
-                    if not creator:
-                        issues_found.append(f"Event {event['_id']} has invalid creator ID {creator_id}")
+                    creators.setdefault(creator_id, []).append(event["_id"])
+            
+            if not events_count:
+                logger.info(f"No upcoming events in the next {days} days")
+                return True
+            
+            # Check for valid creators with a single query
+            if creators:
+                known_creators = {
+                    doc["telegram_id"]
+                    async for doc in users_collection.find(
+                        {"telegram_id": {"$in": list(creators)}}, {"telegram_id": 1}
+                    )
+                }
+                for creator_id, event_ids in creators.items():
+                    if creator_id not in known_creators:
+                        issues_found.extend(
+                            f"Event {event_id} has invalid creator ID {creator_id}"
+                            for event_id in event_ids
+                        )
             
             details = {
-                "events_count": len(upcoming_events),
+                "events_count": events_count,
                 "days_ahead": days,
                 "issues_count": len(issues_found)
             }
@@ -394,7 +548,7 @@ class HealthCheck:
                 )
                 return False
             else:
-                logger.info(f"Found {len(upcoming_events)} valid upcoming events")
+                logger.info(f"Found {events_count} valid upcoming events")
                 return True
                 
         except Exception as e:
@@ -407,16 +561,35 @@ class HealthCheck:
         """Run all health checks and generate a report."""
         logger.info("Starting comprehensive health check")
         
+        # The checks are independent, so run them concurrently
+        telegram, mongodb, ogs, comms, events, inactive_users = await asyncio.gather(
+            self.check_telegram_api(),
+            self.check_mongodb_connection(),
+            self.check_ogs_api(),
+            self.verify_user_communications(),
+            self.check_upcoming_events(),
+            self.check_inactive_users(),
+            return_exceptions=True
+        )
+        
         results = {
-            "telegram_api": await self.check_telegram_api(),
-            "mongodb": await self.check_mongodb_connection(),
-            "ogs_api": await self.check_ogs_api(),
-            "user_communications": await self.verify_user_communications(),
-            "upcoming_events": await self.check_upcoming_events()
+            "telegram_api": telegram,
+            "mongodb": mongodb,
+            "ogs_api": ogs,
+            "user_communications": comms,
+            "upcoming_events": events
         }
         
-        # Get inactive users but don't include in results dict
-        inactive_users = await self.check_inactive_users()
+        # A check that raised counts as failed
+        for component, status in results.items():
+            if isinstance(status, BaseException):
+                logger.error(f"Health check {component} raised: {status}")
+                results[component] = False
+        
+        # Inactive users are reported separately from the results dict
+        if isinstance(inactive_users, BaseException):
+            logger.error(f"Inactive users check raised: {inactive_users}")
+            inactive_users = []
         
         # Calculate overall status
         overall_status = "Healthy" if all(results.values()) else "Issues Detected"
@@ -425,26 +598,26 @@ class HealthCheck:
         uptime = datetime.now() - self.start_time
         uptime_str = str(uptime).split('.')[0]  # Remove microseconds
         
-        report = f"*Go Club Bot Health Report*\n\n"
-        report += f"📊 *Overall Status:* {overall_status}\n"
-        report += f"⏱️ *Uptime:* {uptime_str}\n"
-        report += f"🔄 *API Calls:* Telegram: {self.api_call_counts['telegram']}, OGS: {self.api_call_counts['ogs']}\n"
-        report += f"⚠️ *API Errors:* Telegram: {self.api_errors['telegram']}, OGS: {self.api_errors['ogs']}\n\n"
+        report = f"GO CLUB BOT HEALTH REPORT\n\n"
+        report += f"📊 Overall Status: {overall_status}\n"
+        report += f"⏱️ Uptime: {uptime_str}\n"
+        report += f"🔄 API Calls: Telegram: {self.api_call_counts['telegram']}, OGS: {self.api_call_counts['ogs']}\n"
+        report += f"⚠️ API Errors: Telegram: {self.api_errors['telegram']}, OGS: {self.api_errors['ogs']}\n\n"
         
-        report += "*Component Status:*\n"
+        report += "COMPONENT STATUS\n"
         for component, status in results.items():
             emoji = "✅" if status else "❌"
             report += f"{emoji} {component.replace('_', ' ').title()}\n"
         
-        report += f"\n*Inactive Users:* {len(inactive_users)}\n"
+        report += f"\n👥 Inactive Users: {len(inactive_users)}\n"
         
         # Log the comprehensive check
         await self.log_health_check("comprehensive", {
             "results": results,
             "overall_status": overall_status,
             "uptime_seconds": uptime.total_seconds(),
-            "api_calls": self.api_call_counts,
-            "api_errors": self.api_errors,
+            "api_calls": dict(self.api_call_counts),
+            "api_errors": dict(self.api_errors),
             "inactive_users_count": len(inactive_users)
         })
         
@@ -452,38 +625,62 @@ class HealthCheck:
         level = "success" if overall_status == "Healthy" else "warning"
         await self.send_admin_alert(report, level=level)
         
+        await self.flush_health_logs()
         logger.info(f"Health check completed: {overall_status}")
         return overall_status == "Healthy"
 
 
-async def run_health_check_schedule():
-    """Run health checks on a schedule."""
-    checker = HealthCheck()
+async def _run_schedule(checker: HealthCheck):
+    """Run the comprehensive check, then poll the API endpoints adaptively."""
+    # Run an initial comprehensive check
+    await checker.run_all_health_checks()
+    comprehensive_due = time.monotonic() + _jittered(COMPREHENSIVE_INTERVAL)
+    interval = HEALTH_MIN_INTERVAL
+    
+    while True:
+        await asyncio.sleep(_jittered(interval))
+        
+        if time.monotonic() >= comprehensive_due:
+            # Once a day, run comprehensive check
+            healthy = await checker.run_all_health_checks()
+            comprehensive_due = time.monotonic() + _jittered(COMPREHENSIVE_INTERVAL)
+        else:
+            # Otherwise just check API endpoints
+            results = await asyncio.gather(
+                checker.check_telegram_api(),
+                checker.check_ogs_api(),
+                checker.check_mongodb_connection(),
+                return_exceptions=True
+            )
+            healthy = all(result is True for result in results)
+            await checker.flush_health_logs()
+        
+        # Poll quickly after a failure and back off while healthy
+        if healthy:
+            interval = min(HEALTH_MAX_INTERVAL, interval * HEALTH_BACKOFF_BASE)
+        else:
+            interval = HEALTH_MIN_INTERVAL
+
+
+async def run_health_check_schedule(checker: Optional[HealthCheck] = None):
+    """Run health checks on a schedule, restarting the loop after errors."""
+    checker = checker or HealthCheck()
     
     logger.info("Starting health check scheduler")
     
     try:
-        # Run an initial comprehensive check
-        await checker.run_all_health_checks()
-        
         while True:
-            # Every hour, check API endpoints
-            for _ in range(24):  # 24 hours
-                await asyncio.sleep(60 * 60)  # 1 hour
-                await checker.check_telegram_api()
-                await checker.check_ogs_api()
-                await checker.check_mongodb_connection()
-            
-            # Once a day, run comprehensive check
-            await checker.run_all_health_checks()
-            
-    except asyncio.CancelledError:
-        logger.info("Health check scheduler stopped")
-    except Exception as e:
-        logger.error(f"Error in health check scheduler: {e}")
-        # Wait a bit and restart
-        await asyncio.sleep(60)
-        await run_health_check_schedule()
+            try:
+                await _run_schedule(checker)
+            except asyncio.CancelledError:
+                logger.info("Health check scheduler stopped")
+                raise
+            except Exception as e:
+                logger.error(f"Error in health check scheduler: {e}")
+                # Wait a bit and restart
+                await asyncio.sleep(60)
+    finally:
+        await checker.close()
 
 
 if __name__ == "__main__":
@@ -494,6 +691,7 @@ if __name__ == "__main__":
         # Run a one-time comprehensive check
         checker = HealthCheck()
         loop.run_until_complete(checker.run_all_health_checks())
+        loop.run_until_complete(checker.close())
     except KeyboardInterrupt:
         logger.info("Health check interrupted by user")
     finally:
@@ -1,7 +1,11 @@
+import atexit
 import logging
 import asyncio
 import os
 import argparse
+import queue
+from logging.handlers import QueueHandler, QueueListener
+from typing import List, Optional
 from aiogram import Bot, Dispatcher, executor
 from aiogram.contrib.fsm_storage.memory import MemoryStorage
 from dotenv import load_dotenv
@@ -12,95 +16,173 @@ API_TOKEN = os.getenv("TELEGRAM_BOT_TOKEN")
 MONGO_URI = os.getenv("MONGO_URI")
 DEBUG_MODE = os.getenv("DEBUG_MODE", "False").lower() == "true"
 
+# Webhook settings; polling is used when WEBHOOK_HOST is not set
+WEBHOOK_HOST = os.getenv("WEBHOOK_HOST")  # e.g. https://bot.example.com
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", f"/tg/{API_TOKEN}")
+WEBHOOK_URL = f"{WEBHOOK_HOST}{WEBHOOK_PATH}" if WEBHOOK_HOST else None
+WEBAPP_HOST = os.getenv("WEBAPP_HOST", "0.0.0.0")
+WEBAPP_PORT = int(os.getenv("WEBAPP_PORT", "8080"))
+
 # Import original bot file as a module
-from bot import dp, bot, setup_bot_commands, register_all_handlers
+from bot import (
+    dp, bot, setup_bot_commands, register_all_handlers,
+    get_ogs_session, close_ogs_session, backfill_rank_indexes
+)
 
 # Import maintenance modules
 from maintenance import MaintenanceManager, run_maintenance_schedule
 from healthcheck import HealthCheck, run_health_check_schedule
-from security import setup_security_for_bot
+from security import SecurityManager, setup_security_for_bot
+from config import ADMIN_CHAT_IDS
 
 # Configure logging
 logging_level = logging.DEBUG if DEBUG_MODE else logging.INFO
-logging.basicConfig(
-    level=logging_level,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler("go_club_bot.log"),
-        logging.StreamHandler()
-    ]
-)
+log_formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+log_handlers = [
+    logging.FileHandler("go_club_bot.log"),
+    logging.StreamHandler()
+]
+for handler in log_handlers:
+    handler.setFormatter(log_formatter)
+
+# Handlers run on a listener thread so logging never blocks the event loop;
+# this replaces the root handler installed when bot.py was imported
+log_queue = queue.Queue(-1)
+log_listener = QueueListener(log_queue, *log_handlers)
+log_listener.start()
+atexit.register(log_listener.stop)
+
+root_logger = logging.getLogger()
+root_logger.setLevel(logging_level)
+root_logger.handlers = [QueueHandler(log_queue)]
 
 logger = logging.getLogger('go_club_bot')
 
+SHUTDOWN_TIMEOUT = 10  # Seconds allowed for closing sessions and storage
+
+# Checker shared with the health check scheduler, closed on shutdown
+health_checker: Optional[HealthCheck] = None
+# Security manager whose buffered writes are flushed on shutdown
+security_manager: Optional[SecurityManager] = None
+
 async def startup(dispatcher: Dispatcher):
     """Perform startup actions."""
+    global health_checker, security_manager
     logger.info("Starting Go Club Bot")
     
     # Setup commands
     await setup_bot_commands(bot)
     
+    # Register the webhook so Telegram pushes updates instead of being polled
+    if WEBHOOK_URL:
+        logger.info("Setting webhook")
+        await bot.set_webhook(WEBHOOK_URL, drop_pending_updates=True)
+    
+    # Open shared HTTP session for OGS API requests
+    await get_ogs_session()
+    
     # Setup security module
     logger.info("Initializing security module")
-    await setup_security_for_bot(dispatcher)
+    security_manager = await setup_security_for_bot(dispatcher)
     
     # Initialize maintenance module (but don't start scheduler yet)
     logger.info("Initializing maintenance module")
-    maintenance = MaintenanceManager()
+    maintenance = MaintenanceManager(bot=bot)
     await maintenance.initialize_bot()
     
     # Create database indexes
     await maintenance.create_database_indexes()
+    await maintenance.flush_logs()
+    
+    # Store numeric rank indexes used for leaderboard sorting
+    await backfill_rank_indexes()
     
     # Run initial health check
     logger.info("Running initial health check")
-    health = HealthCheck()
+    health = HealthCheck(bot=bot)
     await health.check_mongodb_connection()
     await health.check_telegram_api()
     
     # Start the background tasks if not in debug mode
     if not DEBUG_MODE:
         logger.info("Starting background tasks")
-        asyncio.create_task(run_maintenance_schedule())
-        asyncio.create_task(run_health_check_schedule())
+        asyncio.create_task(run_maintenance_schedule(maintenance))
+        # The scheduler keeps using this checker; shutdown closes it
+        health_checker = health
+        asyncio.create_task(run_health_check_schedule(health))
+    else:
+        await health.close()
     
     # Send startup notification to admins
-    admin_chat_ids = os.getenv("ADMIN_CHAT_IDS", "").split(",")
-    for admin_id in admin_chat_ids:
-        if admin_id:
-            try:
-                await bot.send_message(
-                    admin_id,
-                    "🚀 Go Club Bot has started successfully!\n\n"
-                    f"Debug mode: {'Enabled' if DEBUG_MODE else 'Disabled'}"
-                )
-            except Exception as e:
-                logger.error(f"Failed to send startup notification to admin {admin_id}: {e}")
+    for admin_id in ADMIN_CHAT_IDS:
+        try:
+            await bot.send_message(
+                admin_id,
+                "🚀 Go Club Bot has started successfully!\n\n"
+                f"Debug mode: {'Enabled' if DEBUG_MODE else 'Disabled'}"
+            )
+        except Exception as e:
+            logger.error(f"Failed to send startup notification to admin {admin_id}: {e}")
+
+async def notify_admins_of_shutdown():
+    """Tell the admins the bot is going down; failures are only logged."""
+    for admin_id in ADMIN_CHAT_IDS:
+        try:
+            await bot.send_message(
+                admin_id,
+                "🛑 Go Club Bot is shutting down. Maintenance or restart in progress."
+            )
+        except Exception as e:
+            logger.error(f"Failed to send shutdown notification to admin {admin_id}: {e}")
+
+async def close_storage(dispatcher: Dispatcher):
+    """Close the FSM storage and wait for its connections to drop."""
+    await dispatcher.storage.close()
+    await dispatcher.storage.wait_closed()
+
+async def close_bot_session():
+    """Close the bot's HTTP session only if one was opened, never creating one."""
+    await bot.close()
+
+def shutdown_teardown(dispatcher: Dispatcher) -> List:
+    """Return the close steps for every resource opened during startup."""
+    teardown = [close_ogs_session(), close_storage(dispatcher), close_bot_session()]
+    if health_checker is not None:
+        teardown.append(health_checker.close())
+    if security_manager is not None:
+        teardown.append(security_manager.close())
+    return teardown
+
+async def run_teardown(teardown: List):
+    """Run the close steps concurrently within SHUTDOWN_TIMEOUT, logging failures."""
+    try:
+        results = await asyncio.wait_for(
+            asyncio.gather(*teardown, return_exceptions=True),
+            timeout=SHUTDOWN_TIMEOUT
+        )
+    except asyncio.TimeoutError:
+        logger.error(f"Shutdown cleanup did not finish within {SHUTDOWN_TIMEOUT}s")
+        return
+    
+    for result in results:
+        if isinstance(result, Exception):
+            logger.error(f"Error during shutdown cleanup: {result}")
 
 async def shutdown(dispatcher: Dispatcher):
     """Perform shutdown actions."""
     logger.info("Shutting down Go Club Bot")
     
     # Send shutdown notification to admins
-    admin_chat_ids = os.getenv("ADMIN_CHAT_IDS", "").split(",")
-    for admin_id in admin_chat_ids:
-        if admin_id:
-            try:
-                await bot.send_message(
-                    admin_id,
-                    "🛑 Go Club Bot is shutting down. Maintenance or restart in progress."
-                )
-            except Exception as e:
-                logger.error(f"Failed to send shutdown notification to admin {admin_id}: {e}")
-    
-    # Close storage
-    await dispatcher.storage.close()
-    await dispatcher.storage.wait_closed()
+    await notify_admins_of_shutdown()
     
-    # Close bot session
-    session = await bot.get_session()
-    if session:
-        await session.close()
+    # Stop Telegram from delivering updates to this instance
+    if WEBHOOK_URL:
+        await bot.delete_webhook()
+    
+    # Close the OGS and health check HTTP sessions, storage and the bot session
+    # and flush buffered security writes concurrently, so one slow or failing
+    # teardown does not hold up the rest
+    await run_teardown(shutdown_teardown(dispatcher))
 
 def start_bot():
     """Start the bot normally."""
@@ -108,19 +190,32 @@ def start_bot():
     register_all_handlers(dp)
     
     # Start the bot with startup and shutdown handlers
-    executor.start_polling(
-        dp, 
-        on_startup=startup, 
-        on_shutdown=shutdown,
-        skip_updates=True
-    )
+    if WEBHOOK_URL:
+        executor.start_webhook(
+            dispatcher=dp,
+            webhook_path=WEBHOOK_PATH,
+            on_startup=startup,
+            on_shutdown=shutdown,
+            host=WEBAPP_HOST,
+            port=WEBAPP_PORT
+        )
+    else:
+        executor.start_polling(
+            dp, 
+            on_startup=startup, 
+            on_shutdown=shutdown,
+            skip_updates=True
+        )
 
 def start_maintenance_only():
     """Start only the maintenance module without the full bot."""
     async def run_once():
         maintenance = MaintenanceManager()
         await maintenance.initialize_bot()
-        await maintenance.run_all_maintenance()
+        try:
+            await maintenance.run_all_maintenance()
+        finally:
+            await maintenance.close()
     
     # Run maintenance synchronously
     loop = asyncio.get_event_loop()
@@ -130,7 +225,10 @@ def start_healthcheck_only():
     """Run a standalone health check without starting the full bot."""
     async def run_once():
         health = HealthCheck()
-        await health.run_all_health_checks()
+        try:
+            await health.run_all_health_checks()
+        finally:
+            await health.close()
     
     # Run health check synchronously
     loop = asyncio.get_event_loop()
@@ -2,92 +2,220 @@ import logging
 import os
 import time
 import json
+import hashlib
 import signal
 import asyncio
 import platform
 import psutil
+from dataclasses import dataclass
 from datetime import datetime, timedelta
-from typing import Dict, List, Optional, Union
+from typing import Dict, List, Optional, Tuple, Union
+from urllib.parse import urlsplit
 
 import motor.motor_asyncio
 import aiohttp
 import aiogram
-from pymongo import MongoClient
+from aiogram.utils.exceptions import RetryAfter
+from pymongo import ASCENDING, DESCENDING, IndexModel
+from pymongo.errors import OperationFailure
 from dotenv import load_dotenv
 
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler("go_club_bot.log"),
-        logging.StreamHandler()
-    ]
-)
+from bot import SendRateLimiter, bot as club_bot
+from config import ADMIN_CHAT_IDS
 
 logger = logging.getLogger('go_club_maintenance')
 
+
+def configure_logging():
+    """Log to go_club_bot.log when maintenance runs as its own process.
+
+    Under main.py the records propagate to the bot's root handlers instead,
+    so this is only called from the ``__main__`` path.
+    """
+    if logger.handlers:
+        return
+    log_formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    for handler in (logging.FileHandler("go_club_bot.log"), logging.StreamHandler()):
+        handler.setFormatter(log_formatter)
+        logger.addHandler(handler)
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+
+
 # Load environment variables
 load_dotenv()
-MONGO_URI = os.getenv("MONGO_URI")
-TELEGRAM_BOT_TOKEN = os.getenv("TELEGRAM_BOT_TOKEN")
-ADMIN_CHAT_IDS = os.getenv("ADMIN_CHAT_IDS", "").split(",")
-BACKUP_DIR = os.getenv("BACKUP_DIR", "./backups")
-MAX_BACKUP_AGE_DAYS = int(os.getenv("MAX_BACKUP_AGE_DAYS", "30"))
+
+
+@dataclass(frozen=True)
+class MaintenanceConfig:
+    """Maintenance settings, read from the environment once at import."""
+    mongo_uri: Optional[str]
+    admin_chat_ids: Tuple[int, ...]
+    backup_dir: str
+    max_backup_age_days: int
+    health_log_retention_days: int
+    maintenance_log_retention_days: int
+    security_log_retention_days: int
+    
+    @classmethod
+    def from_env(cls) -> "MaintenanceConfig":
+        return cls(
+            mongo_uri=os.getenv("MONGO_URI"),
+            admin_chat_ids=ADMIN_CHAT_IDS,
+            backup_dir=os.getenv("BACKUP_DIR", "./backups"),
+            max_backup_age_days=int(os.getenv("MAX_BACKUP_AGE_DAYS", "30")),
+            health_log_retention_days=int(os.getenv("HEALTH_LOG_RETENTION_DAYS", "30")),
+            maintenance_log_retention_days=int(os.getenv("MAINTENANCE_LOG_RETENTION_DAYS", "90")),
+            security_log_retention_days=int(os.getenv("SECURITY_LOG_RETENTION_DAYS", "30"))
+        )
+
+
+CONFIG = MaintenanceConfig.from_env()
+
+BACKUP_CHUNK_SIZE = 1 << 20  # Bytes read from mongodump per write
+NOTIFY_RATE_PER_SECOND = 30  # Telegram's global bot message limit
+NOTIFY_CONCURRENCY = 25  # User notifications in flight at once
+LOG_BATCH_SIZE = 64  # Buffered maintenance log entries per insert_many
+LOG_FLUSH_INTERVAL = 30  # Seconds before a non-full log buffer is written
+EXPIRED_SUBSCRIPTION_PROJECTION = {"mentee_id": 1, "mentor_id": 1, "mentee_name": 1, "mentor_name": 1}
+
+# Admin alert formatting
+ALERT_EMOJI = {
+    "info": "ℹ️",
+    "warning": "⚠️",
+    "error": "🚨",
+    "success": "✅"
+}
+ALERT_TEMPLATE = "{emoji} *Maintenance Alert*\n\n{message}"
+
+def escape_markdown(text: str) -> str:
+    """Escape the characters Telegram's legacy Markdown treats as entity markers."""
+    for char in ("_", "*", "`", "["):
+        text = text.replace(char, "\\" + char)
+    return text
 
 # Ensure backup directory exists
-os.makedirs(BACKUP_DIR, exist_ok=True)
+os.makedirs(CONFIG.backup_dir, exist_ok=True)
 
 # Initialize MongoDB connection
-client = motor.motor_asyncio.AsyncIOMotorClient(MONGO_URI)
+client = motor.motor_asyncio.AsyncIOMotorClient(CONFIG.mongo_uri)
 db = client.go_club_db
 users_collection = db.users
 events_collection = db.events
 matches_collection = db.matches
 subscriptions_collection = db.subscriptions
 maintenance_collection = db.maintenance_logs
+health_logs_collection = db.health_logs
+rate_limits_collection = db.rate_limits
+security_logs_collection = db.security_logs
+
+def _sample_system_stats():
+    """Collect CPU, memory and disk usage; blocks for the 1s CPU sample."""
+    return psutil.cpu_percent(interval=1), psutil.virtual_memory(), psutil.disk_usage('/')
+
+def _sha256_file(path: str) -> str:
+    """Return the hex SHA-256 digest of a file, read in chunks."""
+    hasher = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(BACKUP_CHUNK_SIZE), b""):
+            hasher.update(chunk)
+    return hasher.hexdigest()
+
+def _remove_old_backup_files() -> int:
+    """Delete backups older than MAX_BACKUP_AGE_DAYS; return how many were removed."""
+    count = 0
+    cutoff_ts = time.time() - CONFIG.max_backup_age_days * 24 * 60 * 60
+    
+    with os.scandir(CONFIG.backup_dir) as entries:
+        for entry in entries:
+            if not entry.name.startswith("go_club_backup_"):
+                continue
+            
+            # If the file was created more than MAX_BACKUP_AGE_DAYS days ago, delete it
+            if entry.stat().st_ctime < cutoff_ts:
+                os.remove(entry.path)
+                count += 1
+                logger.info(f"Removed old backup file: {entry.path}")
+    
+    return count
+
+def _remove_partial_archive(path: str):
+    """Delete an incomplete backup archive if one was written."""
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+async def _drop_index_if_exists(collection, name: str):
+    """Drop an index by name, ignoring it if it was never created."""
+    try:
+        await collection.drop_index(name)
+    except OperationFailure as e:
+        # NamespaceNotFound (26) or IndexNotFound (27)
+        if e.code not in (26, 27):
+            raise
+
 
 class MaintenanceManager:
     """Handles database maintenance, backups, and system monitoring."""
     
-    def __init__(self):
-        self.bot = None
+    def __init__(self, bot: Optional[aiogram.Bot] = None):
+        self.bot = bot
         self.start_time = datetime.now()
-        self.sync_client = MongoClient(MONGO_URI)
-        self.sync_db = self.sync_client.go_club_db
+        self._send_limiter = SendRateLimiter(NOTIFY_RATE_PER_SECOND)
+        self._send_sem = asyncio.Semaphore(NOTIFY_CONCURRENCY)
+        self._log_buf: List[Dict] = []
+        self._log_lock = asyncio.Lock()
+        self._log_flushed_at = time.monotonic()
         
     async def initialize_bot(self):
-        """Initialize bot connection for sending alerts."""
+        """Use the club bot for alerts unless one was passed in, so every
+        message goes over the same pooled keep-alive session."""
         if not self.bot:
-            self.bot = aiogram.Bot(token=TELEGRAM_BOT_TOKEN)
+            self.bot = club_bot
+    
+    async def close(self):
+        """Flush buffered logs and close the bot's HTTP session."""
+        await self.flush_logs()
+        if self.bot is not None:
+            # Closes the session only if one was opened, never creating one
+            await self.bot.close()
     
     async def send_admin_alert(self, message: str, level: str = "info"):
         """Send alert messages to admin chat IDs."""
         await self.initialize_bot()
         
-        emoji_map = {
-            "info": "ℹ️",
-            "warning": "⚠️",
-            "error": "🚨",
-            "success": "✅"
-        }
+        formatted_message = ALERT_TEMPLATE.format_map({
+            "emoji": ALERT_EMOJI.get(level.lower(), "ℹ️"),
+            "message": message
+        })
         
-        emoji = emoji_map.get(level.lower(), "ℹ️")
-        formatted_message = f"{emoji} *Maintenance Alert*\n\n{message}"
+        admin_ids = CONFIG.admin_chat_ids
+        results = await asyncio.gather(
+            *[
+                self.bot.send_message(admin_id, formatted_message, parse_mode="Markdown")
+                for admin_id in admin_ids
+            ],
+            return_exceptions=True
+        )
         
-        for admin_id in ADMIN_CHAT_IDS:
-            if admin_id:
-                try:
-                    await self.bot.send_message(
-                        admin_id, 
-                        formatted_message, 
-                        parse_mode="Markdown"
-                    )
-                except Exception as e:
-                    logger.error(f"Failed to send alert to admin {admin_id}: {e}")
+        for admin_id, result in zip(admin_ids, results):
+            if isinstance(result, Exception):
+                logger.error(f"Failed to send alert to admin {admin_id}: {result}")
+    
+    async def send_user_notification(self, chat_id: int, text: str):
+        """Send a message within Telegram's rate limits, retrying flood control once."""
+        async with self._send_sem:
+            try:
+                async with self._send_limiter:
+                    return await self.bot.send_message(chat_id, text)
+            except RetryAfter as e:
+                await asyncio.sleep(e.timeout)
+                async with self._send_limiter:
+                    return await self.bot.send_message(chat_id, text)
     
     async def log_maintenance_action(self, action: str, details: Dict, success: bool = True):
-        """Log maintenance actions to the database."""
+        """Buffer a maintenance log entry, writing the buffer when it fills or ages."""
         log_entry = {
             "action": action,
             "details": details,
@@ -95,81 +223,96 @@ class MaintenanceManager:
             "timestamp": datetime.now()
         }
         
-        try:
-            await maintenance_collection.insert_one(log_entry)
-            logger.info(f"Maintenance log recorded: {action}")
-        except Exception as e:
-            logger.error(f"Failed to log maintenance action: {e}")
+        self._log_buf.append(log_entry)
+        logger.info(f"Maintenance log recorded: {action}")
+        
+        if (len(self._log_buf) >= LOG_BATCH_SIZE
+                or time.monotonic() - self._log_flushed_at >= LOG_FLUSH_INTERVAL):
+            await self.flush_logs()
+    
+    async def flush_logs(self):
+        """Write buffered maintenance log entries to the database."""
+        async with self._log_lock:
+            self._log_flushed_at = time.monotonic()
+            if not self._log_buf:
+                return
+            entries, self._log_buf = self._log_buf, []
+            
+            try:
+                await maintenance_collection.insert_many(entries, ordered=False)
+            except Exception as e:
+                logger.error(f"Failed to log maintenance actions: {e}")
     
     async def create_database_backup(self):
         """Create a backup of the MongoDB database."""
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        backup_path = os.path.join(BACKUP_DIR, f"go_club_backup_{timestamp}")
+        archive_name = os.path.join(CONFIG.backup_dir, f"go_club_backup_{timestamp}.archive.gz")
         
         try:
-            # Run mongodump command
-            os.makedirs(backup_path, exist_ok=True)
-            
-            # Construct mongodump command based on URI
-            # Extract credentials and host info from MONGO_URI
-            uri_parts = MONGO_URI.split('@')
-            if len(uri_parts) > 1:
-                auth_parts = uri_parts[0].split('://')[-1].split(':')
-                if len(auth_parts) > 1:
-                    username = auth_parts[0]
-                    password = auth_parts[1]
-                    host_parts = uri_parts[1].split('/')
-                    host = host_parts[0]
-                    
-                    cmd = f"mongodump --host {host} --username {username} --password {password} " \
-                          f"--db go_club_db --out {backup_path}"
-                else:
-                    cmd = f"mongodump --uri \"{MONGO_URI}\" --out {backup_path}"
-            else:
-                cmd = f"mongodump --uri \"{MONGO_URI}\" --out {backup_path}"
-                
-            start_time = time.time()
-            result = os.system(cmd)
-            end_time = time.time()
-            
-            if result == 0:
-                # Compress the backup
-                archive_name = f"{backup_path}.tar.gz"
-                compress_cmd = f"tar -czf {archive_name} -C {BACKUP_DIR} {os.path.basename(backup_path)}"
-                compress_result = os.system(compress_cmd)
-                
-                if compress_result == 0:
-                    # Remove the uncompressed directory
-                    os.system(f"rm -rf {backup_path}")
-                    
-                    backup_size = os.path.getsize(archive_name)
-                    details = {
-                        "path": archive_name,
-                        "size_bytes": backup_size,
-                        "duration_seconds": end_time - start_time
-                    }
-                    
-                    await self.log_maintenance_action(
-                        "database_backup", 
-                        details, 
-                        success=True
-                    )
-                    
-                    logger.info(f"Database backup created at {archive_name} ({backup_size} bytes)")
-                    await self.send_admin_alert(
-                        f"Database backup created successfully.\n"
-                        f"Location: {archive_name}\n"
-                        f"Size: {backup_size / (1024 * 1024):.2f} MB\n"
-                        f"Duration: {end_time - start_time:.2f} seconds",
-                        level="success"
-                    )
-                    return True
-                else:
-                    raise Exception("Failed to compress backup")
-            else:
+            # mongodump writes a gzipped archive to stdout, which is streamed
+            # straight into the backup file without a dump directory or tar pass
+            start_time = time.monotonic()
+            dump_args = ["--uri", CONFIG.mongo_uri]
+            # mongodump refuses --db when the URI already names a database
+            if not urlsplit(CONFIG.mongo_uri).path.strip("/"):
+                dump_args += ["--db", "go_club_db"]
+            proc = await asyncio.create_subprocess_exec(
+                "mongodump", *dump_args, "--archive", "--gzip",
+                stdout=asyncio.subprocess.PIPE
+            )
+            
+            # Hash and size the archive while it streams, so it needn't be re-read
+            hasher = hashlib.sha256()
+            backup_size = 0
+            try:
+                with open(archive_name, "wb") as archive:
+                    while True:
+                        chunk = await proc.stdout.read(BACKUP_CHUNK_SIZE)
+                        if not chunk:
+                            break
+                        hasher.update(chunk)
+                        backup_size += len(chunk)
+                        await asyncio.to_thread(archive.write, chunk)
+            finally:
+                # Kill mongodump on any early exit, cancellation included, so
+                # wait() never blocks on a process stuck writing to the pipe
+                if proc.returncode is None and not proc.stdout.at_eof():
+                    proc.kill()
+                result = await proc.wait()
+            end_time = time.monotonic()
+            
+            if result != 0:
                 raise Exception(f"mongodump command failed with exit code {result}")
-                
+            
+            details = {
+                "path": archive_name,
+                "size_bytes": backup_size,
+                "sha256": hasher.hexdigest(),
+                "duration_seconds": end_time - start_time
+            }
+            
+            await self.log_maintenance_action(
+                "database_backup", 
+                details, 
+                success=True
+            )
+            
+            logger.info(f"Database backup created at {archive_name} ({backup_size} bytes)")
+            await self.send_admin_alert(
+                f"Database backup created successfully.\n"
+                f"Location: {archive_name}\n"
+                f"Size: {backup_size / (1024 * 1024):.2f} MB\n"
+                f"Duration: {end_time - start_time:.2f} seconds",
+                level="success"
+            )
+            return True
+            
+        except asyncio.CancelledError:
+            await asyncio.to_thread(_remove_partial_archive, archive_name)
+            raise
         except Exception as e:
+            # Never leave a partial archive for cleanup or restore to pick up
+            await asyncio.to_thread(_remove_partial_archive, archive_name)
             error_msg = f"Database backup failed: {str(e)}"
             logger.error(error_msg)
             await self.log_maintenance_action(
@@ -183,20 +326,9 @@ class MaintenanceManager:
     async def cleanup_old_backups(self):
         """Remove backup files older than MAX_BACKUP_AGE_DAYS."""
         try:
-            count = 0
-            now = datetime.now()
-            backup_files = [f for f in os.listdir(BACKUP_DIR) if f.startswith("go_club_backup_")]
-            
-            for backup_file in backup_files:
-                file_path = os.path.join(BACKUP_DIR, backup_file)
-                # Get the file's creation time
-                file_time = datetime.fromtimestamp(os.path.getctime(file_path))
-                
-                # If the file is older than MAX_BACKUP_AGE_DAYS days, delete it
-                if now - file_time > timedelta(days=MAX_BACKUP_AGE_DAYS):
-                    os.remove(file_path)
-                    count += 1
-                    logger.info(f"Removed old backup file: {file_path}")
+            # Scanning and unlinking run in a worker thread so a large or slow
+            # backup directory doesn't block the event loop
+            count = await asyncio.to_thread(_remove_old_backup_files)
             
             if count > 0:
                 await self.log_maintenance_action(
@@ -225,44 +357,34 @@ class MaintenanceManager:
         """Archive old events."""
         try:
             cutoff_date = datetime.now() - timedelta(days=days_old)
-            
-            # Find old events
-            old_events = await events_collection.find(
-                {"date_time": {"$lt": cutoff_date}}
-            ).to_list(length=None)
-            
-            if not old_events:
+            old_events_query = {"date_time": {"$lt": cutoff_date}}
+            
+            # Copy old events into the archive server-side, then remove them
+            # from the active collection; no documents pass through Python
+            await events_collection.aggregate([
+                {"$match": old_events_query},
+                {"$merge": {"into": "archived_events", "whenMatched": "keepExisting"}}
+            ]).to_list(length=None)
+            delete_result = await events_collection.delete_many(old_events_query)
+            archived_count = delete_result.deleted_count
+            
+            if not archived_count:
                 logger.info(f"No events older than {days_old} days found for archiving")
                 return True
             
-            # Archive old events (insert to archive collection and remove from active)
-            archive_collection = db.archived_events
-            result = await archive_collection.insert_many(old_events)
+            await self.log_maintenance_action(
+                "archive_old_events", 
+                {"count": archived_count, "days_old": days_old}, 
+                success=True
+            )
             
-            if result.acknowledged:
-                # Extract IDs of the archived events
-                archived_ids = [event["_id"] for event in old_events]
-                
-                # Remove archived events from the active collection
-                delete_result = await events_collection.delete_many(
-                    {"_id": {"$in": archived_ids}}
-                )
-                
-                await self.log_maintenance_action(
-                    "archive_old_events", 
-                    {"count": len(old_events), "days_old": days_old}, 
-                    success=True
-                )
-                
-                logger.info(f"Archived {len(old_events)} events older than {days_old} days")
-                await self.send_admin_alert(
-                    f"Event archiving completed.\n"
-                    f"Archived {len(old_events)} events older than {days_old} days.",
-                    level="info"
-                )
-                return True
-            else:
-                raise Exception("Failed to insert events into archive collection")
+            logger.info(f"Archived {archived_count} events older than {days_old} days")
+            await self.send_admin_alert(
+                f"Event archiving completed.\n"
+                f"Archived {archived_count} events older than {days_old} days.",
+                level="info"
+            )
+            return True
                 
         except Exception as e:
             error_msg = f"Failed to archive old events: {str(e)}"
@@ -278,72 +400,71 @@ class MaintenanceManager:
     async def update_expired_subscriptions(self):
         """Update status of expired mentorship subscriptions."""
         try:
+            # MongoDB stores datetimes at millisecond precision, so truncate
+            # now to match the stored expired_at value exactly
             now = datetime.now()
+            now = now.replace(microsecond=now.microsecond // 1000 * 1000)
             
-            # Find active subscriptions that have expired
-            expired_subs = await subscriptions_collection.find(
-                {
-                    "status": "active",
-                    "end_date": {"$lt": now}
-                }
-            ).to_list(length=None)
+            # Expire active subscriptions past their end date server-side
+            update_result = await subscriptions_collection.update_many(
+                {"status": "active", "end_date": {"$lt": now}},
+                {"$set": {"status": "expired", "expired_at": now}}
+            )
             
-            if not expired_subs:
+            if update_result.modified_count == 0:
                 logger.info("No expired subscriptions found")
                 return True
             
-            # Update expired subscriptions to "expired" status
-            update_ids = [sub["_id"] for sub in expired_subs]
-            update_result = await subscriptions_collection.update_many(
-                {"_id": {"$in": update_ids}},
-                {"$set": {"status": "expired", "expired_at": now}}
+            # Fetch only the subscriptions expired by this run to notify their users
+            expired_subs = await subscriptions_collection.find(
+                {"status": "expired", "expired_at": now},
+                EXPIRED_SUBSCRIPTION_PROJECTION
+            ).to_list(length=None)
+            
+            await self.log_maintenance_action(
+                "update_expired_subscriptions", 
+                {"count": update_result.modified_count}, 
+                success=True
             )
             
-            if update_result.modified_count > 0:
-                await self.log_maintenance_action(
-                    "update_expired_subscriptions", 
-                    {"count": update_result.modified_count}, 
-                    success=True
-                )
+            logger.info(f"Updated {update_result.modified_count} expired subscriptions")
+            
+            # Notify affected users concurrently, throttled to Telegram's limits
+            notifications = []
+            for sub in expired_subs:
+                # Notify mentee
+                mentee_id = sub.get("mentee_id")
+                mentor_name = sub.get("mentor_name", "your mentor")
                 
-                logger.info(f"Updated {update_result.modified_count} expired subscriptions")
+                if mentee_id:
+                    notifications.append(self.send_user_notification(
+                        mentee_id,
+                        f"Your mentorship subscription with {mentor_name} has expired. "
+                        f"If you wish to continue, please renew your subscription."
+                    ))
                 
-                # Notify affected users
-                for sub in expired_subs:
-                    try:
-                        # Notify mentee
-                        mentee_id = sub.get("mentee_id")
-                        mentor_name = sub.get("mentor_name", "your mentor")
-                        
-                        if mentee_id:
-                            await self.bot.send_message(
-                                mentee_id,
-                                f"Your mentorship subscription with {mentor_name} has expired. "
-                                f"If you wish to continue, please renew your subscription."
-                            )
-                        
-                        # Notify mentor
-                        mentor_id = sub.get("mentor_id")
-                        mentee_name = sub.get("mentee_name", "A mentee")
-                        
-                        if mentor_id:
-                            await self.bot.send_message(
-                                mentor_id,
-                                f"Your mentorship with {mentee_name} has expired. "
-                                f"They have been notified and may choose to renew."
-                            )
-                    except Exception as e:
-                        logger.error(f"Failed to notify user about expired subscription: {e}")
-                
-                await self.send_admin_alert(
-                    f"Updated {update_result.modified_count} expired subscriptions.",
-                    level="info"
-                )
-                return True
-            else:
-                logger.info("No subscriptions were updated (already processed)")
-                return True
+                # Notify mentor
+                mentor_id = sub.get("mentor_id")
+                mentee_name = sub.get("mentee_name", "A mentee")
                 
+                if mentor_id:
+                    notifications.append(self.send_user_notification(
+                        mentor_id,
+                        f"Your mentorship with {mentee_name} has expired. "
+                        f"They have been notified and may choose to renew."
+                    ))
+            
+            results = await asyncio.gather(*notifications, return_exceptions=True)
+            for result in results:
+                if isinstance(result, Exception):
+                    logger.error(f"Failed to notify user about expired subscription: {result}")
+            
+            await self.send_admin_alert(
+                f"Updated {update_result.modified_count} expired subscriptions.",
+                level="info"
+            )
+            return True
+            
         except Exception as e:
             error_msg = f"Failed to update expired subscriptions: {str(e)}"
             logger.error(error_msg)
@@ -359,29 +480,98 @@ class MaintenanceManager:
         """Create and optimize MongoDB indexes."""
         try:
             # User collection indexes
-            await users_collection.create_index("telegram_id", unique=True)
-            await users_collection.create_index("ogs_username")
-            await users_collection.create_index("rank")
-            await users_collection.create_index("is_mentor")
+            user_indexes = [
+                IndexModel([("telegram_id", ASCENDING)], unique=True),
+                IndexModel([("ogs_username", ASCENDING)]),
+                IndexModel([("rank", ASCENDING)]),
+                IndexModel([("rank_index", DESCENDING), ("wins", DESCENDING)]),
+                IndexModel([("is_mentor", ASCENDING)]),
+                IndexModel([("last_activity", ASCENDING)]),
+                IndexModel(
+                    [("is_mentor", ASCENDING), ("rank_index", DESCENDING)],
+                    partialFilterExpression={"is_mentor": True}
+                )
+            ]
             
             # Events collection indexes
-            await events_collection.create_index("date_time")
-            await events_collection.create_index("created_by")
+            event_indexes = [
+                IndexModel([("date_time", ASCENDING), ("_id", ASCENDING)]),
+                IndexModel([("created_by", ASCENDING)]),
+                IndexModel([("participants.user_id", ASCENDING)])
+            ]
             
             # Matches collection indexes
-            await matches_collection.create_index("date")
-            await matches_collection.create_index("player1_id")
-            await matches_collection.create_index("player2_id")
+            match_indexes = [
+                IndexModel([("date", ASCENDING)]),
+                IndexModel([("player1_id", ASCENDING)]),
+                IndexModel([("player2_id", ASCENDING)])
+            ]
             
             # Subscriptions collection indexes
-            await subscriptions_collection.create_index("mentor_id")
-            await subscriptions_collection.create_index("mentee_id")
-            await subscriptions_collection.create_index("status")
-            await subscriptions_collection.create_index("end_date")
+            subscription_indexes = [
+                IndexModel([("mentor_id", ASCENDING)]),
+                IndexModel([("mentee_id", ASCENDING)]),
+                IndexModel([("status", ASCENDING), ("end_date", ASCENDING)]),
+                IndexModel([("mentee_id", ASCENDING), ("mentor_id", ASCENDING), ("status", ASCENDING)]),
+                IndexModel([("mentor_id", ASCENDING), ("status", ASCENDING)])
+            ]
+            
+            # Health and maintenance logs expire automatically so the
+            # collections stay bounded
+            health_log_indexes = [
+                IndexModel(
+                    [("timestamp", ASCENDING)],
+                    expireAfterSeconds=CONFIG.health_log_retention_days * 24 * 60 * 60
+                )
+            ]
+            maintenance_log_indexes = [
+                IndexModel(
+                    [("timestamp", ASCENDING)],
+                    expireAfterSeconds=CONFIG.maintenance_log_retention_days * 24 * 60 * 60
+                )
+            ]
+            
+            # Security logs are counted per event type over recent time ranges,
+            # and expire once they are no longer needed
+            security_log_indexes = [
+                IndexModel([("event_type", ASCENDING), ("timestamp", DESCENDING)]),
+                IndexModel(
+                    [("timestamp", ASCENDING)],
+                    expireAfterSeconds=CONFIG.security_log_retention_days * 24 * 60 * 60
+                )
+            ]
+            
+            # Rate limiting is kept in memory now; expire the windows the old
+            # MongoDB-backed limiter left behind
+            rate_limit_indexes = [
+                IndexModel([("window_start", ASCENDING)], expireAfterSeconds=60 * 60)
+            ]
+            
+            # One createIndexes command per collection, all sent concurrently
+            await asyncio.gather(
+                users_collection.create_indexes(user_indexes),
+                events_collection.create_indexes(event_indexes),
+                matches_collection.create_indexes(match_indexes),
+                subscriptions_collection.create_indexes(subscription_indexes),
+                health_logs_collection.create_indexes(health_log_indexes),
+                maintenance_collection.create_indexes(maintenance_log_indexes),
+                rate_limits_collection.create_indexes(rate_limit_indexes),
+                security_logs_collection.create_indexes(security_log_indexes)
+            )
+            
+            # Drop superseded indexes only once the compound ones covering
+            # them are built, so queries are never left without an index
+            await asyncio.gather(
+                _drop_index_if_exists(events_collection, "date_time_1"),
+                _drop_index_if_exists(subscriptions_collection, "status_1"),
+                _drop_index_if_exists(subscriptions_collection, "end_date_1"),
+                # Served the per-user suspicious message count, now kept in memory
+                _drop_index_if_exists(security_logs_collection, "event_type_1_user_id_1_timestamp_-1")
+            )
             
             await self.log_maintenance_action(
                 "create_database_indexes", 
-                {"collections": ["users", "events", "matches", "subscriptions"]}, 
+                {"collections": ["users", "events", "matches", "subscriptions", "health_logs", "maintenance_logs", "rate_limits", "security_logs"]}, 
                 success=True
             )
             
@@ -402,17 +592,16 @@ class MaintenanceManager:
     async def check_system_health(self):
         """Check system resources and health."""
         try:
-            # Get system stats
-            cpu_percent = psutil.cpu_percent(interval=1)
-            memory = psutil.virtual_memory()
-            disk = psutil.disk_usage('/')
+            # Get system stats; the 1s CPU sample runs in a worker thread so
+            # the event loop keeps serving other tasks meanwhile
+            cpu_percent, memory, disk = await asyncio.to_thread(_sample_system_stats)
             
             # Get bot uptime
             uptime = datetime.now() - self.start_time
             uptime_str = str(uptime).split('.')[0]  # Remove microseconds
             
             # Get MongoDB stats
-            db_stats = self.sync_db.command("dbStats")
+            db_stats = await db.command("dbStats")
             
             health_data = {
                 "timestamp": datetime.now(),
@@ -466,19 +655,28 @@ class MaintenanceManager:
             return None
     
     async def run_all_maintenance(self):
-        """Run all maintenance tasks in sequence."""
+        """Run all maintenance tasks, overlapping the independent ones."""
         logger.info("Starting full maintenance routine")
         
         # Initialize bot for alerts
         await self.initialize_bot()
         
-        # Run all maintenance tasks
+        # Stage 1: rebuild indexes first, since the expiry sweep filters on
+        # the subscription fields they cover
+        await self.create_database_indexes()
+        
+        # Stage 2: tasks with no ordering between them run concurrently
+        _, health_data = await asyncio.gather(
+            self.update_expired_subscriptions(),
+            self.check_system_health()
+        )
+        
+        # Stage 3: back up before anything is deleted, then prune old backups
         await self.create_database_backup()
         await self.cleanup_old_backups()
+        
+        # Stage 4: archive old events only once they are in the backup
         await self.cleanup_old_events()
-        await self.update_expired_subscriptions()
-        await self.create_database_indexes()
-        health_data = await self.check_system_health()
         
         # Generate summary
         uptime = str(datetime.now() - self.start_time).split('.')[0]
@@ -495,12 +693,56 @@ class MaintenanceManager:
         )
         
         await self.send_admin_alert(summary, level="success")
+        await self.flush_logs()
         logger.info("Full maintenance routine completed")
 
 
-async def run_maintenance_schedule():
+def next_run_at(hour: int, weekday: Optional[int] = None) -> datetime:
+    """Return the next wall-clock time at `hour` o'clock, optionally on `weekday`."""
+    now = datetime.now()
+    target = now.replace(hour=hour, minute=0, second=0, microsecond=0)
+    
+    if weekday is not None:
+        target += timedelta(days=(weekday - target.weekday()) % 7)
+    if target <= now:
+        target += timedelta(days=7 if weekday is not None else 1)
+    
+    return target
+
+
+async def _run_scheduled_job(manager: MaintenanceManager, name: str, job):
+    """Run one scheduled job, reporting errors without stopping the scheduler."""
+    try:
+        await job()
+    except Exception as e:
+        logger.error(f"Error in maintenance job {name}: {e}")
+        await manager.send_admin_alert(
+            # Job names like database_backup would otherwise break the Markdown
+            f"🚨 Maintenance job {escape_markdown(name)} failed: {escape_markdown(str(e))}",
+            level="error"
+        )
+    finally:
+        await manager.flush_logs()
+
+
+async def run_daily(manager: MaintenanceManager, name: str, job, hour: int, weekday: Optional[int] = None):
+    """Run `job` every day (or every week on `weekday`) at `hour` o'clock."""
+    while True:
+        delay = (next_run_at(hour, weekday) - datetime.now()).total_seconds()
+        await asyncio.sleep(max(delay, 0))
+        await _run_scheduled_job(manager, name, job)
+
+
+async def run_every(manager: MaintenanceManager, name: str, job, seconds: float):
+    """Run `job` repeatedly, `seconds` apart."""
+    while True:
+        await asyncio.sleep(seconds)
+        await _run_scheduled_job(manager, name, job)
+
+
+async def run_maintenance_schedule(manager: Optional[MaintenanceManager] = None):
     """Run the maintenance tasks on a schedule."""
-    manager = MaintenanceManager()
+    manager = manager or MaintenanceManager()
     
     # Send startup notification
     await manager.initialize_bot()
@@ -512,40 +754,26 @@ async def run_maintenance_schedule():
     # Run initial setup tasks
     await manager.create_database_indexes()
     health_data = await manager.check_system_health()
+    await manager.flush_logs()
+    
+    async def backup_and_cleanup():
+        await manager.create_database_backup()
+        await manager.cleanup_old_backups()
     
     try:
-        while True:
+        # Each job sleeps until its next wall-clock slot instead of polling hourly
+        await asyncio.gather(
             # Run health check every hour
-            await asyncio.sleep(3600)  # 1 hour
-            await manager.check_system_health()
-            
-            # Get current hour
-            current_hour = datetime.now().hour
-            
+            run_every(manager, "check_system_health", manager.check_system_health, 3600),
             # Run backup at 3 AM
-            if current_hour == 3:
-                await manager.create_database_backup()
-                await manager.cleanup_old_backups()
-            
+            run_daily(manager, "database_backup", backup_and_cleanup, hour=3),
+            # Run event cleanup at 4 AM on Sundays (0 is Monday, 6 is Sunday)
+            run_daily(manager, "cleanup_old_events", manager.cleanup_old_events, hour=4, weekday=6),
             # Run subscription updates at 6 AM
-            if current_hour == 6:
-                await manager.update_expired_subscriptions()
-            
-            # Run event cleanup at 4 AM on Sundays
-            if current_hour == 4 and datetime.now().weekday() == 6:  # 0 is Monday, 6 is Sunday
-                await manager.cleanup_old_events()
-    
+            run_daily(manager, "update_expired_subscriptions", manager.update_expired_subscriptions, hour=6)
+        )
     except asyncio.CancelledError:
         logger.info("Maintenance scheduler stopped")
-    except Exception as e:
-        logger.error(f"Error in maintenance scheduler: {e}")
-        await manager.send_admin_alert(
-            f"🚨 Maintenance scheduler error: {str(e)}\nRestarting scheduler...",
-            level="error"
-        )
-        # Wait a bit and retry
-        await asyncio.sleep(60)
-        return await run_maintenance_schedule()
 
 
 def handle_exit(signum, frame):
@@ -571,44 +799,25 @@ async def restore_database(backup_path: str):
     await manager.initialize_bot()
     
     try:
-        # Extract the backup
-        extract_dir = os.path.join(BACKUP_DIR, "temp_restore")
-        os.makedirs(extract_dir, exist_ok=True)
-        
-        extract_cmd = f"tar -xzf {backup_path} -C {extract_dir}"
-        extract_result = os.system(extract_cmd)
-        
-        if extract_result != 0:
-            raise Exception(f"Failed to extract backup file: Exit code {extract_result}")
-        
-        # Find the extracted directory
-        backup_dirs = [d for d in os.listdir(extract_dir) if os.path.isdir(os.path.join(extract_dir, d))]
-        if not backup_dirs:
-            raise Exception("No backup directory found in the archive")
-        
-        backup_dir = os.path.join(extract_dir, backup_dirs[0])
-        
-        # Run mongorestore
-        uri_parts = MONGO_URI.split('@')
-        if len(uri_parts) > 1:
-            auth_parts = uri_parts[0].split('://')[-1].split(':')
-            if len(auth_parts) > 1:
-                username = auth_parts[0]
-                password = auth_parts[1]
-                host_parts = uri_parts[1].split('/')
-                host = host_parts[0]
-                
-                cmd = f"mongorestore --host {host} --username {username} --password {password} " \
-                      f"--db go_club_db {backup_dir}/go_club_db --drop"
-            else:
-                cmd = f"mongorestore --uri \"{MONGO_URI}\" {backup_dir}/go_club_db --drop"
+        # Verify the archive against the digest recorded when it was created
+        backup_log = await maintenance_collection.find_one(
+            {"action": "database_backup", "success": True, "details.path": backup_path},
+            {"details.sha256": 1}
+        )
+        expected_sha256 = (backup_log or {}).get("details", {}).get("sha256")
+        if expected_sha256:
+            actual_sha256 = await asyncio.to_thread(_sha256_file, backup_path)
+            if actual_sha256 != expected_sha256:
+                raise Exception("Backup archive checksum does not match the recorded SHA-256")
         else:
-            cmd = f"mongorestore --uri \"{MONGO_URI}\" {backup_dir}/go_club_db --drop"
-        
-        restore_result = os.system(cmd)
+            logger.warning(f"No recorded checksum for {backup_path}; restoring unverified")
         
-        # Clean up
-        os.system(f"rm -rf {extract_dir}")
+        # mongorestore reads the gzipped archive directly, so nothing is
+        # extracted to disk first
+        proc = await asyncio.create_subprocess_exec(
+            "mongorestore", "--uri", CONFIG.mongo_uri, f"--archive={backup_path}", "--gzip", "--drop"
+        )
+        restore_result = await proc.wait()
         
         if restore_result == 0:
             await manager.log_maintenance_action(
@@ -636,9 +845,13 @@ async def restore_database(backup_path: str):
         )
         await manager.send_admin_alert(error_msg, level="error")
         return False
+    finally:
+        await manager.close()
 
 
 if __name__ == "__main__":
+    configure_logging()
+
     # Register signal handlers
     signal.signal(signal.SIGINT, handle_exit)
     signal.signal(signal.SIGTERM, handle_exit)
@@ -655,9 +868,11 @@ if __name__ == "__main__":
     else:
         # Start the maintenance scheduler
         logger.info("Starting maintenance scheduler")
+        manager = MaintenanceManager()
         try:
-            loop.run_until_complete(run_maintenance_schedule())
+            loop.run_until_complete(run_maintenance_schedule(manager))
         except KeyboardInterrupt:
             logger.info("Maintenance scheduler interrupted by user")
         finally:
+            loop.run_until_complete(manager.close())
             loop.close()
@@ -1,85 +1,237 @@
 from bson.objectid import ObjectId
+import atexit
 import logging
 import os
+import queue
 import re
 import json
 import hmac
 import hashlib
+import functools
 import secrets
+import time
+from collections import deque
 from datetime import datetime, timedelta
-from typing import Dict, List, Optional, Any, Tuple, Union
+from logging.handlers import QueueHandler, QueueListener
+from urllib.parse import unquote
+from typing import Deque, Dict, List, Optional, Any, Tuple, Union
 import asyncio
 
 import motor.motor_asyncio
-from aiogram import Bot, Dispatcher, types
+from pymongo import UpdateOne
+from aiogram import Dispatcher, types
 from aiogram.dispatcher.middlewares import BaseMiddleware
 from aiogram.dispatcher.handler import CancelHandler
 from dotenv import load_dotenv
 from aiogram.dispatcher.filters import IDFilter
 
+try:
+    # Optional linear-time engine for the attack pattern scan
+    import re2
+except ImportError:
+    re2 = None
+
+from bot import bot as club_bot, safe_send_message
+from config import ADMIN_CHAT_IDS
+
 def is_chat_admin(handler):
     """Decorator to check if user is an admin."""
-    admin_ids = [int(id_str) for id_str in ADMIN_CHAT_IDS if id_str.isdigit()]
-    return IDFilter(chat_id=admin_ids)(handler)
+    return IDFilter(chat_id=list(ADMIN_CHAT_IDS))(handler)
 
 # Load environment variables
 load_dotenv()
 MONGO_URI = os.getenv("MONGO_URI")
-API_TOKEN = os.getenv("TELEGRAM_BOT_TOKEN")
 SECURITY_SECRET = os.getenv("SECURITY_SECRET", secrets.token_hex(32))
-ADMIN_CHAT_IDS = os.getenv("ADMIN_CHAT_IDS", "").split(",")
+# BLAKE2b keys are at most 64 bytes, so longer secrets are hashed down to one
+_BLAKE2B_MAX_KEY_SIZE = 64
+_SIGNING_KEY = SECURITY_SECRET.encode()
+if len(_SIGNING_KEY) > _BLAKE2B_MAX_KEY_SIZE:
+    _SIGNING_KEY = hashlib.blake2b(_SIGNING_KEY).digest()
 RATE_LIMIT_ENABLED = os.getenv("RATE_LIMIT_ENABLED", "True").lower() == "true"
+MAX_SCAN_LENGTH = 8192  # Characters of a message checked for attack patterns
+MAX_INPUT_LENGTH = 512  # Longest value validate_input will check
+BLOCK_CACHE_TTL = 60  # Seconds a blocked/not-blocked lookup is reused
+BLOCK_CACHE_MAX_SIZE = 10000
+RATE_LIMIT_MAX_KEYS = 50000  # In-memory rate limit buckets kept at once
+ACTIVITY_FLUSH_INTERVAL = 30  # Seconds between batched last_activity writes
+SECURITY_LOG_QUEUE_SIZE = 10000  # Security events buffered before new ones are dropped
+SECURITY_LOG_BATCH_SIZE = 100  # Security events per insert_many
+SECURITY_LOG_FLUSH_INTERVAL = 1  # Seconds between security log writes
+SUSPICIOUS_WINDOW = 24 * 60 * 60  # Seconds suspicious messages count toward a block
+SUSPICIOUS_ALERT_COOLDOWN = 60  # Seconds between admin alerts about the same user
+SUSPICIOUS_TRACK_MAX_USERS = 10000
+
+logger = logging.getLogger('go_club_security')
 
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
+
+def configure_logging():
+    """Write security events to security.log through a background thread.
+
+    Only called from the setup and ``__main__`` paths, so importing the
+    module never touches the logging configuration of the host process.
+    """
+    if logger.handlers:
+        return
+    log_formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    log_handlers = [
         logging.FileHandler("security.log"),
         logging.StreamHandler()
     ]
-)
-logger = logging.getLogger('go_club_security')
+    for handler in log_handlers:
+        handler.setFormatter(log_formatter)
+
+    log_queue = queue.Queue(-1)
+    log_listener = QueueListener(log_queue, *log_handlers)
+    log_listener.start()
+    atexit.register(log_listener.stop)
+
+    logger.setLevel(logging.INFO)
+    logger.handlers = [QueueHandler(log_queue)]
+    logger.propagate = False
+
 
-# Initialize MongoDB connection
-client = motor.motor_asyncio.AsyncIOMotorClient(MONGO_URI)
+# Initialize MongoDB connection; a few pooled connections stay open so the
+# occasional cache miss on the message path never waits on a handshake, and
+# timeouts keep an unreachable server from stalling the middleware
+client = motor.motor_asyncio.AsyncIOMotorClient(
+    MONGO_URI,
+    serverSelectionTimeoutMS=3000,
+    connectTimeoutMS=3000,
+    socketTimeoutMS=5000,
+    appname="go_club_security",
+    maxPoolSize=50,
+    minPoolSize=5
+)
 db = client.go_club_db
 users_collection = db.users
 security_logs_collection = db.security_logs
 blocked_users_collection = db.blocked_users
-rate_limits_collection = db.rate_limits
+
+# Admin alert formatting
+ALERT_EMOJI = {
+    "info": "ℹ️",
+    "warning": "⚠️",
+    "error": "🚨",
+    "critical": "🆘"
+}
+ALERT_TEMPLATE = "{emoji} *Security Alert*\n\n{message}"
+
+# Patterns for input validation; each must match the whole value, and
+# re.ASCII keeps \d from accepting non-ASCII digits
+INPUT_PATTERNS = {
+    "name": re.compile(r'[A-Za-z0-9 \-_.]{2,50}'),
+    "rank": re.compile(r'(?:30|[1-2][0-9]|[1-9])k|[1-9]d'),
+    "ogs_username": re.compile(r'[A-Za-z0-9\-_.]{3,20}'),
+    "date": re.compile(r'\d{4}-\d{2}-\d{2}', re.ASCII),
+    "time": re.compile(r'\d{2}:\d{2}', re.ASCII),
+    "url": re.compile(r'https?://.+'),
+}
+
+# Every attack pattern needs one of these characters, except the SQL command
+# pattern, which needs one of the keywords; keep in sync with attack_patterns
+_ATTACK_CHARS = frozenset("<%\"':=")
+_SQL_KEYWORDS = ("INSERT", "UPDATE", "DELETE", "DROP", "SELECT")
+
+# HTML-escape table applied in a single pass by sanitize_input
+_SANITIZE_TABLE = str.maketrans({
+    "&": "&amp;",
+    "<": "&lt;",
+    ">": "&gt;",
+    "\"": "&quot;",
+    "'": "&#x27;"
+})
+
+
+@functools.lru_cache(maxsize=4096)
+def _validate_input(input_type: str, value: str) -> bool:
+    """Match a value against its input pattern; the result depends only on the arguments."""
+    pattern = INPUT_PATTERNS.get(input_type)
+    if not pattern:
+        return True  # No pattern defined for this input type
+    return pattern.fullmatch(value) is not None
+
+def _compile_attack_union(patterns: List[str]):
+    """Compile patterns into one case-insensitive alternation, using RE2 when available."""
+    source = "(?i)" + "|".join(f"(?:{pattern})" for pattern in patterns)
+    if re2 is not None:
+        try:
+            return re2.compile(source)
+        except Exception as e:
+            logger.warning(f"RE2 could not compile the attack patterns, using re: {e}")
+    return re.compile(source)
 
 
 class SecurityManager:
     """Handles security-related functions including input validation and rate limiting."""
     
     def __init__(self, bot=None):
-        self.bot = bot or Bot(token=API_TOKEN)
+        self.bot = bot or club_bot
+        self._block_cache: Dict[int, Tuple[float, bool]] = {}
+        # (user_id, action_type) -> (tokens, last refill, alert window start,
+        # attempts rejected in that window)
+        self._buckets: Dict[Tuple[int, str], Tuple[float, float, float, int]] = {}
+        # Latest activity per user, written to MongoDB in batches
+        self._activity_buffer: Dict[int, datetime] = {}
+        # Security events waiting for the background writer
+        self._log_queue: asyncio.Queue = asyncio.Queue(maxsize=SECURITY_LOG_QUEUE_SIZE)
+        # Monotonic times of each user's recent suspicious messages and of
+        # the last admin alert about them
+        self._suspicious_strikes: Dict[int, Deque[float]] = {}
+        self._suspicious_alerted: Dict[int, float] = {}
         
-        # Define patterns for input validation
-        self.patterns = {
-            "name": re.compile(r'^[A-Za-z0-9\s\-_.]{2,50}$'),
-            "rank": re.compile(r'^(3[0]|[1-2][0-9]|[1-9])k$|^([1-9])d$'),
-            "ogs_username": re.compile(r'^[A-Za-z0-9\-_.]{3,20}$'),
-            "date": re.compile(r'^\d{4}-\d{2}-\d{2}$'),
-            "time": re.compile(r'^\d{2}:\d{2}$'),
-            "url": re.compile(r'^https?://.+$'),
-        }
-        
-        # Common attack patterns to detect
+        # Common attack patterns to detect, combined into one alternation so
+        # each message is scanned in a single pass; the syntax is kept to what
+        # both re and RE2 accept. URL-encoded input is decoded and scanned
+        # again rather than matched by separate encoded patterns
         self.attack_patterns = [
-            re.compile(r'<script.*?>.*?</script>', re.IGNORECASE | re.DOTALL),
-            re.compile(r'javascript:', re.IGNORECASE),
-            re.compile(r'onload=', re.IGNORECASE),
-            re.compile(r'onerror=', re.IGNORECASE),
-            re.compile(r'%3Cscript', re.IGNORECASE),  # URL encoded <script
-            re.compile(r'%22%3E%3Cscript', re.IGNORECASE),  # URL encoded "><script
-            re.compile(r'(?:\'|\").*?(?:OR|AND).*?(?:\'|\")\s*=', re.IGNORECASE),  # SQL injection
-            re.compile(r'(?:INSERT|UPDATE|DELETE|DROP|SELECT)\s+(?:FROM|INTO|TABLE)', re.IGNORECASE)  # SQL commands
+            r'(?s:<script.*?>.*?</script>)',
+            r'javascript:',
+            r'onload=',
+            r'onerror=',
+            # SQL injection; bounded runs keep backtracking linear in the input
+            r'[\'"][^\'"]{0,200}?\b(?:OR|AND)\b[^=]{0,200}?[\'"]\s*=',
+            r'\b(?:INSERT|UPDATE|DELETE|DROP|SELECT)\b\s+(?:FROM|INTO|TABLE)\b'  # SQL commands
         ]
+        self._attack_union = _compile_attack_union(self.attack_patterns)
+    
+    def record_activity(self, user_id: int):
+        """Note a user's latest activity; flush_activity writes it out."""
+        self._activity_buffer[user_id] = datetime.now()
+    
+    async def flush_activity(self):
+        """Write buffered last_activity timestamps with one bulk_write."""
+        if not self._activity_buffer:
+            return
+        
+        snapshot, self._activity_buffer = self._activity_buffer, {}
+        try:
+            await users_collection.bulk_write(
+                [
+                    UpdateOne({"telegram_id": user_id}, {"$set": {"last_activity": ts}})
+                    for user_id, ts in snapshot.items()
+                ],
+                ordered=False
+            )
+        except Exception as e:
+            logger.error(f"Failed to update user activity: {e}")
+    
+    async def flush_security_logs(self):
+        """Write queued security events in batches of SECURITY_LOG_BATCH_SIZE."""
+        while not self._log_queue.empty():
+            batch = []
+            while len(batch) < SECURITY_LOG_BATCH_SIZE and not self._log_queue.empty():
+                batch.append(self._log_queue.get_nowait())
+            try:
+                await security_logs_collection.insert_many(batch, ordered=False)
+            except Exception as e:
+                logger.error(f"Failed to log {len(batch)} security events: {e}")
+    
+    async def close(self):
+        """Write out anything still buffered."""
+        await asyncio.gather(self.flush_activity(), self.flush_security_logs())
     
     async def log_security_event(self, event_type: str, user_id: int, details: Dict, severity: str = "info"):
-        """Log a security event to the database."""
+        """Queue a security event; the background writer stores it in the database."""
         log_entry = {
             "event_type": event_type,
             "user_id": user_id,
@@ -89,165 +241,169 @@ class SecurityManager:
         }
         
         try:
-            await security_logs_collection.insert_one(log_entry)
+            self._log_queue.put_nowait(log_entry)
             logger.info(f"Security event logged: {event_type} - User: {user_id}")
-        except Exception as e:
-            logger.error(f"Failed to log security event: {e}")
+        except asyncio.QueueFull:
+            logger.warning(f"Security log queue full, dropping event: {event_type} - User: {user_id}")
     
     async def send_admin_alert(self, message: str, level: str = "info"):
-        """Send security alerts to admin chat IDs."""
-        emoji_map = {
-            "info": "ℹ️",
-            "warning": "⚠️",
-            "error": "🚨",
-            "critical": "🆘"
-        }
+        """Send security alerts to all admin chat IDs concurrently."""
+        formatted_message = ALERT_TEMPLATE.format_map({
+            "emoji": ALERT_EMOJI.get(level.lower(), "ℹ️"),
+            "message": message
+        })
         
-        emoji = emoji_map.get(level.lower(), "ℹ️")
-        formatted_message = f"{emoji} *Security Alert*\n\n{message}"
+        results = await asyncio.gather(
+            *[
+                self.bot.send_message(admin_id, formatted_message, parse_mode="Markdown")
+                for admin_id in ADMIN_CHAT_IDS
+            ],
+            return_exceptions=True
+        )
         
-        for admin_id in ADMIN_CHAT_IDS:
-            if admin_id:
-                try:
-                    await self.bot.send_message(
-                        admin_id, 
-                        formatted_message, 
-                        parse_mode="Markdown"
-                    )
-                except Exception as e:
-                    logger.error(f"Failed to send alert to admin {admin_id}: {e}")
+        for admin_id, result in zip(ADMIN_CHAT_IDS, results):
+            if isinstance(result, Exception):
+                logger.error(f"Failed to send alert to admin {admin_id}: {result}")
     
     def validate_input(self, input_type: str, value: str) -> bool:
         """Validate user input against defined patterns."""
-        if not value:
+        # Long values are rejected before the cache so they cannot flush it
+        if not value or len(value) > MAX_INPUT_LENGTH:
             return False
-            
-        pattern = self.patterns.get(input_type)
-        if not pattern:
-            return True  # No pattern defined for this input type
-            
-        return bool(pattern.match(value))
+        return _validate_input(input_type, value)
     
     def sanitize_input(self, value: str) -> str:
         """Sanitize user input by removing potentially dangerous characters."""
         if not value:
             return ""
             
-        # Basic sanitization
-        sanitized = value.replace("<", "&lt;").replace(">", "&gt;")
-        sanitized = sanitized.replace("&", "&amp;").replace("\"", "&quot;").replace("'", "&#x27;")
-        
-        return sanitized
+        # Escape every character in one pass, so "&" in an inserted entity is
+        # never escaped again
+        return value.translate(_SANITIZE_TABLE)
     
     def detect_potential_attack(self, value: str) -> Tuple[bool, str]:
         """Check if input contains potential attack patterns."""
         if not value:
             return False, ""
+        
+        value = value[:MAX_SCAN_LENGTH]
+        # Plain prose cannot match any pattern, so skip the regex for it
+        if not _ATTACK_CHARS.intersection(value):
+            upper = value.upper()
+            if not any(keyword in upper for keyword in _SQL_KEYWORDS):
+                return False, ""
             
-        for pattern in self.attack_patterns:
-            match = pattern.search(value)
-            if match:
-                return True, match.group(0)
+        try:
+            match = self._attack_union.search(value)
+            if match is None and "%" in value:
+                decoded = unquote(value, errors="replace")
+                if decoded != value:
+                    match = self._attack_union.search(decoded)
+        except Exception as e:
+            # Fail open rather than dropping the message
+            logger.warning(f"Attack pattern scan failed: {e}")
+            return False, ""
+        
+        if match:
+            return True, match.group(0)
                 
         return False, ""
     
-    async def check_rate_limit(self, user_id: int, action_type: str, limit: int, window_seconds: int) -> bool:
+    async def check_rate_limit(self, user_id: int, action_type: str, limit: int, window_seconds: int,
+                               now: Optional[float] = None) -> bool:
         """
         Check if a user has exceeded their rate limit for a specific action.
-        Returns True if within limits, False if exceeded.
+        Returns True if within limits, False if exceeded. `now` is a
+        time.monotonic() reading the caller may share across checks.
         """
         if not RATE_LIMIT_ENABLED:
             return True
             
         try:
-            now = datetime.now()
-            window_start = now - timedelta(seconds=window_seconds)
-            
-            # Create a rate limit key
-            limit_key = f"{user_id}:{action_type}"
+            # Token bucket holding up to `limit` actions, refilled continuously
+            # so a full bucket lasts exactly one window
+            if now is None:
+                now = time.monotonic()
+            key = (user_id, action_type)
+            tokens, last_refill, window_start, rejected = self._buckets.pop(
+                key, (float(limit), now, now, 0)
+            )
+            tokens = min(float(limit), tokens + (now - last_refill) * limit / window_seconds)
+            # Rejections are counted per fixed window, so refills during a
+            # sustained flood do not reset the count
+            if now - window_start >= window_seconds:
+                window_start, rejected = now, 0
+            
+            if tokens >= 1:
+                self._store_bucket(key, (tokens - 1, now, window_start, rejected))
+                return True
             
-            # Get the current count for this user and action
-            rate_data = await rate_limits_collection.find_one({"key": limit_key})
+            rejected += 1
+            self._store_bucket(key, (tokens, now, window_start, rejected))
             
-            if not rate_data:
-                # First action, create a new record
-                await rate_limits_collection.insert_one({
-                    "key": limit_key,
-                    "user_id": user_id,
+            # Log the rate limit violation
+            await self.log_security_event(
+                "rate_limit_exceeded",
+                user_id,
+                {
                     "action_type": action_type,
-                    "count": 1,
-                    "window_start": now,
-                    "last_action": now
-                })
-                return True
-                
-            # If window has expired, reset counter
-            if rate_data["window_start"] < window_start:
-                await rate_limits_collection.update_one(
-                    {"key": limit_key},
-                    {"$set": {
-                        "count": 1,
-                        "window_start": now,
-                        "last_action": now
-                    }}
-                )
-                return True
-                
-            # Update the counter
-            new_count = rate_data["count"] + 1
-            await rate_limits_collection.update_one(
-                {"key": limit_key},
-                {"$set": {
-                    "count": new_count,
-                    "last_action": now
-                }}
+                    "limit": limit,
+                    "window_seconds": window_seconds,
+                    "rejected": rejected
+                },
+                severity="warning"
             )
             
-            # Check if limit exceeded
-            if new_count > limit:
-                # Log the rate limit violation
-                await self.log_security_event(
-                    "rate_limit_exceeded",
-                    user_id,
-                    {
-                        "action_type": action_type,
-                        "limit": limit,
-                        "window_seconds": window_seconds,
-                        "count": new_count
-                    },
-                    severity="warning"
-                )
-                
-                # Only alert admins for significant violations
-                if new_count > limit * 2:  # If more than double the limit
-                    user = await users_collection.find_one({"telegram_id": user_id})
-                    user_name = user.get("name", "Unknown") if user else "Unknown"
-                    
-                    await self.send_admin_alert(
-                        f"Rate limit significantly exceeded:\n"
-                        f"User: {user_name} (ID: {user_id})\n"
-                        f"Action: {action_type}\n"
-                        f"Count: {new_count}/{limit} in {window_seconds} seconds",
-                        level="warning"
-                    )
+            # Alert admins once per window when rejections exceed the limit
+            if rejected == limit + 1:
+                user = await users_collection.find_one({"telegram_id": user_id})
+                user_name = user.get("name", "Unknown") if user else "Unknown"
                 
-                return False
+                await self.send_admin_alert(
+                    f"Rate limit significantly exceeded:\n"
+                    f"User: {user_name} (ID: {user_id})\n"
+                    f"Action: {action_type}\n"
+                    f"Rejected: {rejected} attempts over the limit of {limit} in {window_seconds} seconds",
+                    level="warning"
+                )
             
-            return True
+            return False
             
         except Exception as e:
             logger.error(f"Error checking rate limit: {e}")
             # If there's an error, allow the action to proceed
             return True
     
-    async def is_user_blocked(self, user_id: int) -> bool:
-        """Check if a user is blocked from using the bot."""
+    def _store_bucket(self, key: Tuple[int, str], bucket: Tuple[float, float, float, int]):
+        """Save a rate limit bucket, evicting the least recently used one when full."""
+        if len(self._buckets) >= RATE_LIMIT_MAX_KEYS:
+            self._buckets.pop(next(iter(self._buckets)))
+        self._buckets[key] = bucket
+    
+    def _cache_block_status(self, user_id: int, blocked: bool, now: Optional[float] = None):
+        """Remember whether a user is blocked for BLOCK_CACHE_TTL seconds."""
+        if len(self._block_cache) >= BLOCK_CACHE_MAX_SIZE:
+            # Evict the oldest entry
+            self._block_cache.pop(next(iter(self._block_cache)))
+        self._block_cache.pop(user_id, None)
+        self._block_cache[user_id] = (time.monotonic() if now is None else now, blocked)
+    
+    async def is_user_blocked(self, user_id: int, now: Optional[float] = None) -> bool:
+        """Check if a user is blocked from using the bot, served from a short-lived cache when possible."""
+        if now is None:
+            now = time.monotonic()
+        entry = self._block_cache.get(user_id)
+        if entry is not None and now - entry[0] < BLOCK_CACHE_TTL:
+            return entry[1]
+        
         try:
-            blocked = await blocked_users_collection.find_one({"user_id": user_id})
-            return blocked is not None
+            blocked = await blocked_users_collection.find_one({"user_id": user_id}, {"_id": 1})
         except Exception as e:
             logger.error(f"Error checking if user is blocked: {e}")
             return False
+        
+        self._cache_block_status(user_id, blocked is not None, now)
+        return blocked is not None
     
     async def block_user(self, user_id: int, reason: str, admin_id: int = None, duration_days: int = None):
         """Block a user from using the bot."""
@@ -274,6 +430,7 @@ class SecurityManager:
             else:
                 # Create a new block
                 await blocked_users_collection.insert_one(block_data)
+            self._cache_block_status(user_id, True)
             
             # Log the block
             await self.log_security_event(
@@ -323,6 +480,7 @@ class SecurityManager:
         try:
             # Remove the block
             result = await blocked_users_collection.delete_one({"user_id": user_id})
+            self._cache_block_status(user_id, False)
             
             if result.deleted_count == 0:
                 return False  # User wasn't blocked
@@ -365,31 +523,70 @@ class SecurityManager:
         """Remove blocks that have expired."""
         try:
             now = datetime.now()
+            expired_query = {"expiry": {"$lt": now, "$ne": None}}
+            
+            # Collect the affected users, then remove their blocks in one go
+            user_ids = [
+                block["user_id"]
+                async for block in blocked_users_collection.find(
+                    expired_query, {"user_id": 1}
+                ).batch_size(500)
+            ]
+            if not user_ids:
+                return 0
+            
+            await blocked_users_collection.delete_many(
+                {"user_id": {"$in": user_ids}, **expired_query}
+            )
+            for user_id in user_ids:
+                self._cache_block_status(user_id, False)
+            
+            await security_logs_collection.insert_many(
+                [
+                    {
+                        "event_type": "user_unblocked",
+                        "user_id": user_id,
+                        "details": {"admin_id": None, "reason": "block expired"},
+                        "severity": "info",
+                        "timestamp": now
+                    }
+                    for user_id in user_ids
+                ],
+                ordered=False
+            )
             
-            # Find expired blocks
-            expired = await blocked_users_collection.find({
-                "expiry": {"$lt": now, "$ne": None}
-            }).to_list(length=None)
+            # Tell the users concurrently through the shared send limiters,
+            # which also retry flood control; admins get a single summary
+            delivered = await asyncio.gather(
+                *[
+                    safe_send_message(
+                        user_id,
+                        "You have been unblocked and can now use the bot again."
+                    )
+                    for user_id in user_ids
+                ]
+            )
+            failed = delivered.count(False)
+            if failed:
+                logger.error(f"Failed to notify {failed} user(s) about expired blocks")
             
-            for block in expired:
-                user_id = block.get("user_id")
-                await self.unblock_user(user_id)
+            await self.send_admin_alert(
+                f"{len(user_ids)} expired block(s) removed.",
+                level="info"
+            )
             
-            return len(expired)
+            return len(user_ids)
             
         except Exception as e:
             logger.error(f"Error cleaning up expired blocks: {e}")
             return 0
     
     def generate_hmac(self, data: str) -> str:
-        """Generate an HMAC signature for data validation."""
-        key = SECURITY_SECRET.encode()
-        message = data.encode()
-        h = hmac.new(key, message, hashlib.sha256)
-        return h.hexdigest()
+        """Generate a keyed BLAKE2b signature for data validation."""
+        return hashlib.blake2b(data.encode(), key=_SIGNING_KEY, digest_size=32).hexdigest()
     
     def verify_hmac(self, data: str, signature: str) -> bool:
-        """Verify an HMAC signature for data validation."""
+        """Verify a signature from generate_hmac in constant time."""
         expected = self.generate_hmac(data)
         return hmac.compare_digest(expected, signature)
     
@@ -414,12 +611,16 @@ class SecurityManager:
             severity="warning"
         )
         
-        # Check how many suspicious messages this user has sent recently
-        recent_suspicious = await security_logs_collection.count_documents({
-            "event_type": "suspicious_message",
-            "user_id": user_id,
-            "timestamp": {"$gt": datetime.now() - timedelta(hours=24)}
-        })
+        # Count this user's suspicious messages over the last 24 hours in memory
+        now = time.monotonic()
+        strikes = self._suspicious_strikes.pop(user_id, None) or deque()
+        while strikes and now - strikes[0] > SUSPICIOUS_WINDOW:
+            strikes.popleft()
+        strikes.append(now)
+        if len(self._suspicious_strikes) >= SUSPICIOUS_TRACK_MAX_USERS:
+            self._suspicious_strikes.pop(next(iter(self._suspicious_strikes)))
+        self._suspicious_strikes[user_id] = strikes
+        recent_suspicious = len(strikes)
         
         # If this is a repeated offense, consider blocking the user
         if recent_suspicious >= 3:
@@ -435,7 +636,16 @@ class SecurityManager:
             except Exception as e:
                 logger.error(f"Failed to delete suspicious message: {e}")
         
-        # Alert admins for manual review
+        # Alert admins for manual review, at most once per cooldown per user
+        # so a flood of messages cannot turn into a flood of alerts
+        last_alert = self._suspicious_alerted.pop(user_id, None)
+        if last_alert is not None and now - last_alert < SUSPICIOUS_ALERT_COOLDOWN:
+            self._suspicious_alerted[user_id] = last_alert
+            return
+        if len(self._suspicious_alerted) >= SUSPICIOUS_TRACK_MAX_USERS:
+            self._suspicious_alerted.pop(next(iter(self._suspicious_alerted)))
+        self._suspicious_alerted[user_id] = now
+        
         await self.send_admin_alert(
             f"Suspicious message detected:\n"
             f"User: {user_name} (ID: {user_id})\n"
@@ -449,16 +659,18 @@ class SecurityManager:
 class SecurityMiddleware(BaseMiddleware):
     """Middleware to handle security checks for all incoming messages."""
     
-    def __init__(self):
+    def __init__(self, security: Optional[SecurityManager] = None):
         super(SecurityMiddleware, self).__init__()
-        self.security = SecurityManager()
+        self.security = security or SecurityManager()
     
     async def on_pre_process_message(self, message: types.Message, data: dict):
         """Run security checks before processing any message."""
         user_id = message.from_user.id
+        # One clock reading shared by the block cache and rate limiter
+        now = time.monotonic()
         
         # Check if user is blocked
-        if await self.security.is_user_blocked(user_id):
+        if await self.security.is_user_blocked(user_id, now):
             # Log the attempt
             await self.security.log_security_event(
                 "blocked_user_attempt",
@@ -477,7 +689,7 @@ class SecurityMiddleware(BaseMiddleware):
             raise CancelHandler()
         
         # Check rate limits for messages
-        if not await self.security.check_rate_limit(user_id, "message", 30, 60):  # 30 messages per minute
+        if not await self.security.check_rate_limit(user_id, "message", 30, 60, now):  # 30 messages per minute
             await message.reply(
                 "You're sending messages too quickly. Please slow down."
             )
@@ -496,21 +708,17 @@ class SecurityMiddleware(BaseMiddleware):
                 )
                 raise CancelHandler()
         
-        # Update user's last activity timestamp
-        try:
-            await users_collection.update_one(
-                {"telegram_id": user_id},
-                {"$set": {"last_activity": datetime.now()}}
-            )
-        except Exception as e:
-            logger.error(f"Failed to update user activity: {e}")
+        # Buffer the user's last activity timestamp for the next batched write
+        self.security.record_activity(user_id)
     
     async def on_pre_process_callback_query(self, callback_query: types.CallbackQuery, data: dict):
         """Run security checks before processing callback queries."""
         user_id = callback_query.from_user.id
+        # One clock reading shared by the block cache and rate limiter
+        now = time.monotonic()
         
         # Check if user is blocked
-        if await self.security.is_user_blocked(user_id):
+        if await self.security.is_user_blocked(user_id, now):
             # Log the attempt
             await self.security.log_security_event(
                 "blocked_user_callback_attempt",
@@ -529,30 +737,27 @@ class SecurityMiddleware(BaseMiddleware):
             raise CancelHandler()
         
         # Check rate limits for callbacks
-        if not await self.security.check_rate_limit(user_id, "callback", 20, 60):  # 20 callbacks per minute
+        if not await self.security.check_rate_limit(user_id, "callback", 20, 60, now):  # 20 callbacks per minute
             await callback_query.answer(
                 "You're interacting too quickly. Please slow down.", 
                 show_alert=True
             )
             raise CancelHandler()
         
-        # Update user's last activity timestamp
-        try:
-            await users_collection.update_one(
-                {"telegram_id": user_id},
-                {"$set": {"last_activity": datetime.now()}}
-            )
-        except Exception as e:
-            logger.error(f"Failed to update user activity: {e}")
+        # Buffer the user's last activity timestamp for the next batched write
+        self.security.record_activity(user_id)
 
 
 async def setup_security_for_bot(dp: Dispatcher):
     """Configure and attach security features to the bot."""
+    configure_logging()
+
     # Initialize the security module
     security = SecurityManager(dp.bot)
     
-    # Add security middleware
-    dp.middleware.setup(SecurityMiddleware())
+    # Add security middleware, sharing the manager so blocks made by the
+    # admin commands reach the middleware's cache immediately
+    dp.middleware.setup(SecurityMiddleware(security))
     
     # Register security-related command handlers
     
@@ -643,20 +848,22 @@ async def setup_security_for_bot(dp: Dispatcher):
     async def cmd_security_status(message: types.Message):
         """Command to check security status and metrics. Admin only."""
         try:
-            # Get blocked users count
-            blocked_count = await blocked_users_collection.count_documents({})
-            
-            # Get recent suspicious events
-            recent_suspicious = await security_logs_collection.count_documents({
-                "event_type": "suspicious_message",
-                "timestamp": {"$gt": datetime.now() - timedelta(days=1)}
-            })
-            
-            # Get recent rate limit violations
-            rate_limit_violations = await security_logs_collection.count_documents({
-                "event_type": "rate_limit_exceeded",
-                "timestamp": {"$gt": datetime.now() - timedelta(days=1)}
-            })
+            # Count blocks from collection metadata and both kinds of recent
+            # event in one aggregation, with the two commands run concurrently
+            since = datetime.now() - timedelta(days=1)
+            blocked_count, event_counts = await asyncio.gather(
+                blocked_users_collection.estimated_document_count(),
+                security_logs_collection.aggregate([
+                    {"$match": {
+                        "event_type": {"$in": ["suspicious_message", "rate_limit_exceeded"]},
+                        "timestamp": {"$gt": since}
+                    }},
+                    {"$group": {"_id": "$event_type", "count": {"$sum": 1}}}
+                ]).to_list(length=None)
+            )
+            counts = {doc["_id"]: doc["count"] for doc in event_counts}
+            recent_suspicious = counts.get("suspicious_message", 0)
+            rate_limit_violations = counts.get("rate_limit_exceeded", 0)
             
             # Format the status message
             status = (
@@ -673,6 +880,20 @@ async def setup_security_for_bot(dp: Dispatcher):
             logger.error(f"Error in security_status command: {e}")
             await message.reply(f"An error occurred: {str(e)}")
     
+    # Write queued security events in the background
+    async def periodic_security_log_flush():
+        """Flush security events every SECURITY_LOG_FLUSH_INTERVAL seconds."""
+        while True:
+            await asyncio.sleep(SECURITY_LOG_FLUSH_INTERVAL)
+            await security.flush_security_logs()
+    
+    # Write buffered user activity in batches
+    async def periodic_activity_flush():
+        """Flush last_activity updates every ACTIVITY_FLUSH_INTERVAL seconds."""
+        while True:
+            await asyncio.sleep(ACTIVITY_FLUSH_INTERVAL)
+            await security.flush_activity()
+    
     # Run periodic security tasks
     async def periodic_security_tasks():
         """Run security tasks on a schedule."""
@@ -692,6 +913,8 @@ async def setup_security_for_bot(dp: Dispatcher):
     
     # Start the periodic tasks
     asyncio.create_task(periodic_security_tasks())
+    asyncio.create_task(periodic_activity_flush())
+    asyncio.create_task(periodic_security_log_flush())
     
     return security
 
@@ -726,6 +949,6 @@ if __name__ == "__main__":
         print(f"Verify invalid: {security.verify_hmac(test_data, hmac_sig[:-1] + '0')}")
     
     # Run the test
-    import asyncio
+    configure_logging()
     loop = asyncio.get_event_loop()
     loop.run_until_complete(test_security())
@@ -0,0 +1,16 @@
+import asyncio
+
+import pytest
+
+try:
+    import uvloop
+except ImportError:  # Optional test dependency, not available on Windows
+    uvloop = None
+
+
+@pytest.fixture(scope="session")
+def event_loop_policy():
+    # Run the async tests on uvloop where it is installed
+    if uvloop is not None:
+        return uvloop.EventLoopPolicy()
+    return asyncio.DefaultEventLoopPolicy()
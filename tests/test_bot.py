@@ -1,133 +1,501 @@
 import pytest
 import asyncio
+import re
+import time
+from contextlib import ExitStack, asynccontextmanager
+from dataclasses import replace
+from types import SimpleNamespace
 from unittest.mock import AsyncMock, MagicMock, patch
-from datetime import datetime, timedelta
 
-from bson.objectid import ObjectId
+import ujson
 from aiogram import types
-from aiogram.dispatcher import FSMContext
 
 # Import modules to test
 import bot
+import maintenance
+import security
+
+try:
+    import pytest_benchmark  # noqa: F401
+    HAS_BENCHMARK = True
+except ImportError:  # Optional test dependency
+    HAS_BENCHMARK = False
+
+# Coroutine tests are marked with loop_scope="session" so they share one
+# event loop instead of creating and closing a loop per test; conftest.py
+# picks the loop policy
+
+# Collection methods that Motor exposes as coroutines; the rest (find,
+# aggregate) return cursors synchronously
+ASYNC_COLLECTION_METHODS = (
+    'find_one', 'find_one_and_update', 'insert_one', 'insert_many',
+    'update_one', 'update_many', 'bulk_write', 'count_documents'
+)
+
+def acoro_stub(rv=None):
+    """Plain coroutine stand-in for AsyncMock: records calls, returns ``rv``."""
+    async def stub(*args, **kwargs):
+        stub.calls.append((args, kwargs))
+        return stub.rv
+    stub.rv = rv
+    stub.calls = []
+    return stub
+
+def make_collection_mock():
+    collection = MagicMock()
+    for name in ASYNC_COLLECTION_METHODS:
+        setattr(collection, name, acoro_stub())
+    return collection
+
+# Build the collection mocks once per module; tests only configure them
+@pytest.fixture(scope="module")
+def _collections():
+    return {
+        name: make_collection_mock()
+        for name in ('users', 'events', 'matches', 'subscriptions')
+    }
+
+@pytest.fixture(autouse=True)
+def _reset_collections(_collections):
+    yield
+    for collection in _collections.values():
+        collection.reset_mock(return_value=True, side_effect=True)
+        for name in ASYNC_COLLECTION_METHODS:
+            stub = getattr(collection, name)
+            stub.rv = None
+            stub.calls.clear()
 
 # Mock environment variables and MongoDB
 @pytest.fixture
-def setup_mocks():
-    # Mock MongoDB collections
-    bot.users_collection = AsyncMock()
-    bot.events_collection = AsyncMock()
-    bot.matches_collection = AsyncMock()
-    bot.subscriptions_collection = AsyncMock()
+def setup_mocks(_collections):
+    with ExitStack() as stack:
+        # Mock MongoDB collections; patch.object restores the real ones
+        for name, collection in _collections.items():
+            stack.enter_context(patch.object(bot, f'{name}_collection', collection))
+        
+        # Mock bot for sending messages
+        stack.enter_context(patch.object(bot, 'bot', AsyncMock()))
+        
+        # Start every test with an empty user cache
+        bot._user_cache.clear()
+        
+        # Create a mock FSMContext
+        async def mock_get_data():
+            return {}
+        
+        state = AsyncMock()
+        state.get_data = mock_get_data
+        state.finish = AsyncMock()
+        
+        yield {
+            'state': state
+        }
+
+@pytest.fixture
+def message():
+    # Spec'd on aiogram's Message so a misspelt attribute fails the test
+    msg = MagicMock(spec=types.Message)
+    msg.answer = AsyncMock()
+    msg.from_user = SimpleNamespace(id=123456789)
+    msg.text = None
+    return msg
+
+def assert_answered(message, contains):
+    """Check the last reply contains the text, ignoring case, and return its kwargs."""
+    args, kwargs = message.answer.call_args
+    assert contains.lower() in args[0].lower()
+    return kwargs
+
+# OGS payloads built once at import; tests only read them
+OGS_SEARCH = {"results": [{"id": 12345, "username": "testplayer"}]}
+OGS_PROFILE = {"username": "testplayer", "ranking": "5k", "wins": 10, "losses": 5}
+OGS_GAMES = {"results": [{"id": i} for i in range(1, 7)]}
+
+class FakeOGSSession:
+    """Stand-in for the shared OGS session that serves JSON payloads by URL."""
     
-    # Mock bot for sending messages
-    bot.bot = AsyncMock()
+    closed = False
     
-    # Create a mock FSMContext
-    async def mock_get_data():
-        return {}
+    def __init__(self):
+        self.responses = {}
+        self.requests = []
+        self.in_flight = 0
+        self.max_in_flight = 0
     
-    state = AsyncMock()
-    state.get_data = mock_get_data
-    state.finish = AsyncMock()
+    @asynccontextmanager
+    async def get(self, url, params=None):
+        self.requests.append(url)
+        yield SimpleNamespace(status=200, json=lambda loads=None: self._json(url))
     
-    return {
-        'state': state
-    }
+    async def _json(self, url):
+        # Track overlapping requests, yielding so concurrent ones can start
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        await asyncio.sleep(0)
+        self.in_flight -= 1
+        return self.responses[url]
 
-@pytest.mark.asyncio
-async def test_cmd_start_new_user(setup_mocks):
-    # Create mock message
-    message = AsyncMock()
-    message.from_user.id = 123456789
-    
-    # Configure mock to return None (new user)
-    bot.users_collection.find_one.return_value = None
+@pytest.fixture
+def ogs_session():
+    bot._ogs_cache.clear()
+    session = FakeOGSSession()
+    with patch.object(bot, 'ogs_session', session):
+        yield session
+    bot._ogs_cache.clear()
+
+@pytest.mark.asyncio(loop_scope="session")
+@pytest.mark.parametrize("user_doc,expected", [
+    # New user is prompted to register
+    (None, 'register'),
+    # Registered user gets a welcome back message
+    ({'name': 'Test User', 'is_admin': False, 'is_mentor': False}, 'welcome back'),
+])
+async def test_cmd_start(setup_mocks, message, user_doc, expected):
+    bot.users_collection.find_one.rv = user_doc
     
     # Call the function
     await bot.cmd_start(message)
     
-    # Check user is prompted to register
     message.answer.assert_called_once()
-    args, kwargs = message.answer.call_args
-    assert 'register' in args[0].lower()
-    
-@pytest.mark.asyncio
-async def test_cmd_start_existing_user(setup_mocks):
-    # Create mock message
-    message = AsyncMock()
-    message.from_user.id = 123456789
-    
-    # Configure mock to return a user
-    bot.users_collection.find_one.return_value = {
-        'name': 'Test User',
-        'is_admin': False,
-        'is_mentor': False
-    }
+    assert_answered(message, expected)
     
-    # Call the function
-    await bot.cmd_start(message)
+def test_rank_helpers():
+    assert bot.get_rank_index("30k") == 0
+    assert bot.get_rank_index("9d") == len(bot.RANKS) - 1
+    assert bot.get_rank_index("10dan") == -1
     
-    # Check welcome back message
-    message.answer.assert_called_once()
-    args, kwargs = message.answer.call_args
-    assert 'welcome back' in args[0].lower()
+    assert bot.is_rank_sufficient_for_mentor("3k")
+    assert bot.is_rank_sufficient_for_mentor("2d")
+    assert not bot.is_rank_sufficient_for_mentor("4k")
+    assert not bot.is_rank_sufficient_for_mentor("invalid")
+    
+    assert bot.rank_fields("1d", "player1_") == {"player1_rank": "1d", "player1_rank_index": 30}
+    
+@pytest.mark.asyncio(loop_scope="session")
+async def test_leaderboard_message_cached(setup_mocks):
+    # Configure the sorted/limited cursor chain
+    cursor = MagicMock()
+    cursor.sort.return_value.limit.return_value.to_list = AsyncMock(return_value=[
+        {"name": "Test User", "rank": "3k", "wins": 2, "losses": 1}
+    ])
+    bot.users_collection.find.return_value = cursor
+    bot.invalidate_leaderboard_cache()
     
-@pytest.mark.asyncio
-async def test_fetch_ogs_data_success():
+    first = await bot.get_leaderboard_message()
+    second = await bot.get_leaderboard_message()
+    
+    # Second call is served from the cache
+    assert first == second
+    assert "Test User" in first
+    bot.users_collection.find.assert_called_once()
+    
+    # Invalidation forces a rebuild
+    bot.invalidate_leaderboard_cache()
+    await bot.get_leaderboard_message()
+    assert bot.users_collection.find.call_count == 2
+
+@pytest.mark.asyncio(loop_scope="session")
+async def test_fetch_ogs_data_success(ogs_session):
     username = "testplayer"
     
-    # Mock aiohttp ClientSession
-    with patch('aiohttp.ClientSession') as mock_session:
-        # Configure successful responses
-        mock_resp = AsyncMock()
-        mock_resp.status = 200
-        mock_resp.json = AsyncMock(side_effect=[
-            {"results": [{"id": 12345, "username": username}]},
-            {"username": username, "ranking": "5k", "wins": 10, "losses": 5},
-            {"results": [{"id": 1}, {"id": 2}, {"id": 3}, {"id": 4}, {"id": 5}, {"id": 6}]}
-        ])
+    # Successful responses keyed by the requested URL, so the test does not
+    # depend on the order fetch_ogs_data issues its requests in
+    ogs_session.responses.update({
+        f"{bot.OGS_API_URL}/players": OGS_SEARCH,
+        f"{bot.OGS_API_URL}/players/12345/": OGS_PROFILE,
+        f"{bot.OGS_API_URL}/players/12345/games/": OGS_GAMES
+    })
+    
+    # Call the function
+    result = await bot.fetch_ogs_data(username)
+    
+    # Check result
+    assert "error" not in result
+    assert result["username"] == username
+    assert result["rank"] == "5k"
+    assert result["wins"] == 10
+    assert result["losses"] == 5
+    assert len(result["recent_games"]) == 5  # Should only take first 5
+    
+    # Profile and games requests only need the player id, so they overlap
+    assert ogs_session.max_in_flight == 2
+    
+    # A repeat lookup within the TTL is served from the cache
+    assert await bot.fetch_ogs_data(username) is result
+    assert len(ogs_session.requests) == 3
+
+@pytest.mark.asyncio(loop_scope="session")
+async def test_fetch_ogs_data_cache_evicts_oldest():
+    bot._ogs_cache.clear()
+    uncached = AsyncMock(side_effect=lambda username: {"username": username})
+    
+    with patch.object(bot, 'fetch_ogs_data_uncached', uncached), \
+            patch.object(bot, 'OGS_CACHE_MAX_SIZE', 2):
+        for username in ("alice", "bob", "alice", "carol"):
+            await bot.fetch_ogs_data(username)
         
-        # Configure session context managers
-        mock_cm = MagicMock()
-        mock_cm.__aenter__.return_value = mock_resp
-        mock_session.return_value.__aenter__.return_value.get.return_value = mock_cm
+        # Concurrent lookups share one fetch
+        await asyncio.gather(bot.fetch_ogs_data("dave"), bot.fetch_ogs_data("dave"))
         
-        # Call the function
-        result = await bot.fetch_ogs_data(username)
+        # The repeated lookups were cache hits, and later names pushed out alice and bob
+        assert uncached.await_count == 4
+        assert list(bot._ogs_cache) == ["carol", "dave"]
+        # Per-username locks are released once no lookup needs them
+        assert not bot._ogs_locks
+    
+    bot._ogs_cache.clear()
+
+@pytest.mark.skipif(not HAS_BENCHMARK, reason="pytest-benchmark is not installed")
+def test_parse_ogs_player_benchmark(benchmark):
+    # Decode and parse a typical OGS profile plus a page of recent games
+    profile = ujson.dumps({"username": "testplayer", "ranking": "5k", "wins": 10, "losses": 5})
+    games = ujson.dumps({"results": [{"id": i, "name": f"Game {i}", "width": 19, "height": 19} for i in range(100)]})
+    
+    result = benchmark(lambda: bot.parse_ogs_player(12345, ujson.loads(profile), ujson.loads(games)))
+    
+    assert result["rank"] == "5k"
+    assert len(result["recent_games"]) == 5
+
+@pytest.mark.asyncio(loop_scope="session")
+async def test_get_ogs_json_retries_rate_limit():
+    # First response is rate limited, second succeeds
+    limited = MagicMock(status=429, headers={"Retry-After": "1"})
+    ok = MagicMock(status=200)
+    ok.json = AsyncMock(return_value={"results": []})
+    
+    cms = []
+    for resp in (limited, ok):
+        cm = MagicMock()
+        cm.__aenter__.return_value = resp
+        cms.append(cm)
+    
+    mock_session = MagicMock()
+    mock_session.get.side_effect = cms
+    
+    with patch('bot.asyncio.sleep', new=AsyncMock()) as mock_sleep:
+        result = await bot.get_ogs_json(mock_session, "https://example.com")
+    
+    assert result == {"results": []}
+    assert mock_session.get.call_count == 2
+    ok.json.assert_awaited_once_with(loads=bot.ujson.loads)
+    mock_sleep.assert_awaited_once_with(1.0)
+
+@pytest.mark.asyncio(loop_scope="session")
+async def test_safe_send_message_retries_after_flood_control(setup_mocks):
+    from aiogram.utils.exceptions import RetryAfter
+    
+    bot.bot.send_message = AsyncMock(side_effect=[RetryAfter(2), None])
+    
+    with patch('bot.asyncio.sleep', new=AsyncMock()) as mock_sleep, \
+            patch('bot.random.random', return_value=0.0):
+        assert await bot.safe_send_message(123, "hello")
+    
+    assert bot.bot.send_message.await_count == 2
+    mock_sleep.assert_awaited_once_with(2)
+
+@pytest.mark.asyncio(loop_scope="session")
+async def test_broadcast_to_users_counts_results(setup_mocks):
+    class Cursor:
+        def batch_size(self, size):
+            return self
         
-        # Check result
-        assert "error" not in result
-        assert result["username"] == username
-        assert result["rank"] == "5k"
-        assert result["wins"] == 10
-        assert result["losses"] == 5
-        assert len(result["recent_games"]) == 5  # Should only take first 5
-
-@pytest.mark.asyncio
-async def test_process_name(setup_mocks):
-    # Create mock message and state
-    message = AsyncMock()
+        async def __aiter__(self):
+            for telegram_id in (1, 2, 3):
+                yield {"telegram_id": telegram_id}
+    
+    bot.users_collection.find.return_value = Cursor()
+    bot.bot.send_message = AsyncMock(side_effect=[None, Exception("blocked"), None])
+    
+    sent, failed = await bot.broadcast_to_users("hello")
+    
+    assert (sent, failed) == (2, 1)
+    assert bot.bot.send_message.await_count == 3
+
+@pytest.mark.asyncio(loop_scope="session")
+async def test_get_users_fetches_misses_in_one_query(setup_mocks):
+    telegram_ids = list(range(1, 501))
+    bot._user_cache[1] = (time.monotonic(), {"telegram_id": 1})
+    
+    class Cursor:
+        async def __aiter__(self):
+            for telegram_id in telegram_ids[1:]:
+                yield {"telegram_id": telegram_id}
+    
+    bot.users_collection.find.return_value = Cursor()
+    
+    users = await bot.get_users(*telegram_ids)
+    
+    # Cache misses are loaded with a single $in query, never one by one
+    assert len(users) == 500
+    bot.users_collection.find.assert_called_once_with({"telegram_id": {"$in": telegram_ids[1:]}})
+    assert not bot.users_collection.find_one.calls
+
+@pytest.mark.asyncio(loop_scope="session")
+async def test_user_middleware_passes_cached_user(setup_mocks, message):
+    bot.users_collection.find_one.rv = {"telegram_id": 42, "is_admin": True}
+    message.from_user.id = 42
+    
+    data = {}
+    await bot.UserMiddleware().on_process_message(message, data)
+    await bot.admin_panel(message, user=data["user"])
+    
+    assert data["user"]["is_admin"]
+    assert_answered(message, "Admin Panel")
+    
+    # A second lookup is served from the cache
+    await bot.get_user(42)
+    assert len(bot.users_collection.find_one.calls) == 1
+
+@pytest.mark.asyncio(loop_scope="session")
+async def test_get_user_caches_miss_until_registration(setup_mocks, message):
+    message.text = "none"
+    message.from_user.username = "tester"
+    state = setup_mocks['state']
+    proxy_cm = MagicMock()
+    proxy_cm.__aenter__.return_value = {"name": "Test Player", "rank": "5k"}
+    state.proxy = MagicMock(return_value=proxy_cm)
+    
+    # Unregistered senders are looked up once, not on every message
+    assert await bot.get_user(message.from_user.id) is None
+    assert await bot.get_user(message.from_user.id) is None
+    assert len(bot.users_collection.find_one.calls) == 1
+    
+    await bot.process_ogs_username(message, state)
+    bot.users_collection.find_one.rv = {"telegram_id": message.from_user.id}
+    
+    # Registration drops the cached miss so the new document is seen at once
+    assert await bot.get_user(message.from_user.id) == {"telegram_id": message.from_user.id}
+    assert len(bot.users_collection.find_one.calls) == 2
+
+@pytest.mark.asyncio(loop_scope="session")
+@pytest.mark.parametrize("data,expected", [
+    # Buttons sent by the registration and profile screens
+    ("skip_mentor", "become a mentor later"),
+    ("update_mentor", "set up your mentor profile"),
+    # Anything else, like a button from before the callback data formats changed
+    ("event_123", "isn't available"),
+])
+async def test_callback_buttons_are_handled(setup_mocks, data, expected):
+    bot.users_collection.find_one.rv = {"telegram_id": 42, "rank": "1d", "is_mentor": True}
+    callback_query = types.CallbackQuery(**{
+        "id": "1",
+        "from": {"id": 42, "is_bot": False, "first_name": "Test"},
+        "chat_instance": "1",
+        "data": data
+    })
+    
+    # Dispatch through the real handler table, with the fallback registered last
+    handlers = bot.dp.callback_query_handlers
+    with patch.object(handlers, 'handlers', list(handlers.handlers)):
+        bot.dp.register_callback_query_handler(bot.unknown_callback, state="*")
+        bot.Dispatcher.set_current(bot.dp)
+        await bot.dp.process_update(types.Update(update_id=1, callback_query=callback_query))
+        await bot.dp.current_state(chat=42, user=42).finish()
+    
+    bot.bot.answer_callback_query.assert_awaited_once()
+    replies = [bot.bot.answer_callback_query.call_args.kwargs.get("text") or ""]
+    replies += [sent.args[1] for sent in bot.bot.send_message.call_args_list]
+    assert any(expected in reply for reply in replies)
+
+@pytest.mark.asyncio(loop_scope="session")
+async def test_process_name(setup_mocks, message):
+    # Configure message and state
     message.text = "Test Player"
     state = setup_mocks['state']
     
     # Mock state proxy context manager
     state_proxy = {}
-    async def mock_state_proxy():
-        return state_proxy
-    
-    state.__call__ = mock_state_proxy
+    proxy_cm = MagicMock()
+    proxy_cm.__aenter__.return_value = state_proxy
+    state.proxy = MagicMock(return_value=proxy_cm)
     
     # Call the function
-    await bot.process_name(message, state)
+    with patch.object(bot.RegistrationForm, 'next', AsyncMock()) as mock_next:
+        await bot.process_name(message, state)
     
     # Check state was updated
     assert state_proxy.get('name') == "Test Player"
     
     # Check next state was set
-    state.next.assert_called_once()
+    mock_next.assert_called_once()
     
     # Check keyboard was sent
     message.answer.assert_called_once()
-    args, kwargs = message.answer.call_args
-    assert 'rank' in args[0].lower()
-    assert 'reply_markup' in kwargs
+    kwargs = assert_answered(message, 'rank')
+    assert kwargs['reply_markup'] is bot.RANK_KEYBOARD
+
+@pytest.fixture
+def security_manager():
+    manager = security.SecurityManager(bot=AsyncMock())
+    manager.log_security_event = AsyncMock()
+    manager.send_admin_alert = AsyncMock()
+    return manager
+
+@pytest.mark.asyncio(loop_scope="session")
+async def test_check_rate_limit_refills_bucket(security_manager):
+    check = security_manager.check_rate_limit
+    
+    # A full bucket allows `limit` actions, then refills at limit/window per second
+    assert await check(1, "message", 2, 60, now=0.0)
+    assert await check(1, "message", 2, 60, now=0.0)
+    assert not await check(1, "message", 2, 60, now=1.0)
+    assert await check(1, "message", 2, 60, now=31.0)
+    assert not await check(1, "message", 2, 60, now=31.0)
+    
+    # Other users and actions have their own buckets
+    assert await check(2, "message", 2, 60, now=31.0)
+    assert await check(1, "callback", 2, 60, now=31.0)
+
+@pytest.mark.asyncio(loop_scope="session")
+async def test_check_rate_limit_alerts_on_sustained_flood(security_manager):
+    with patch.object(security, 'users_collection', MagicMock(find_one=AsyncMock(return_value=None))):
+        # 600 messages at 10 per second against 30 per minute
+        allowed = 0
+        for i in range(600):
+            allowed += await security_manager.check_rate_limit(1, "message", 30, 60, now=i / 10)
+    
+    # Refills let a message through every two seconds without resetting the
+    # rejection count, so admins are alerted exactly once for the window
+    assert allowed == 59
+    security_manager.send_admin_alert.assert_awaited_once()
+    assert security_manager.log_security_event.await_count == 541
+
+def test_sanitize_input_escapes_once(security_manager):
+    assert security_manager.sanitize_input("<b>Tom & \"Jerry\"</b>") == (
+        "&lt;b&gt;Tom &amp; &quot;Jerry&quot;&lt;/b&gt;"
+    )
+    # An escaped entity is escaped as text, not double-escaped into itself
+    assert security_manager.sanitize_input("&lt;") == "&amp;lt;"
+    assert security_manager.sanitize_input("") == ""
+
+@pytest.mark.parametrize("value,detected", [
+    ("Let's play a game on Saturday at 5", False),
+    ("<script>alert(1)</script>", True),
+    ("%3Cscript%3Ealert(1)%3C/script%3E", True),
+    ("50% off 100%", False),
+])
+def test_detect_potential_attack(security_manager, value, detected):
+    assert security_manager.detect_potential_attack(value)[0] is detected
+
+def assert_valid_markdown(text):
+    """Check every legacy Markdown entity marker outside an escape is paired."""
+    unescaped = re.sub(r"\\[_*`\[]", "", text)
+    for marker in ("_", "*", "`"):
+        assert unescaped.count(marker) % 2 == 0, f"unbalanced {marker!r} in {text!r}"
+
+@pytest.mark.asyncio(loop_scope="session")
+async def test_failed_job_alert_is_valid_markdown():
+    manager = maintenance.MaintenanceManager(bot=AsyncMock())
+    manager.flush_logs = AsyncMock()
+    
+    async def job():
+        raise RuntimeError("mongodump failed: *.archive.gz not writable")
+    
+    with patch.object(maintenance, 'CONFIG', replace(maintenance.CONFIG, admin_chat_ids=(1,))):
+        await maintenance._run_scheduled_job(manager, "database_backup", job)
+    
+    args, kwargs = manager.bot.send_message.call_args
+    assert kwargs["parse_mode"] == "Markdown"
+    assert "database\\_backup" in args[1]
+    assert_valid_markdown(args[1])
+